@@ -0,0 +1,433 @@
+"""Cold-conversation archive - idle conversations move out of Redis
+
+Conversations expire from Redis after 7 days. The archiver periodically
+scans for conversations idle longer than ARCHIVE_IDLE_SECONDS and writes
+them, zlib-compressed, to a cold store. It then deletes the Redis key, but
+only if the conversation did not change in the meantime. SalesBotRedis
+reads fall through to the archive: get_conversation and the exports serve
+archived threads, and a thread that sends a new message is rehydrated into
+Redis by the normal save, after which its archive copy is deleted.
+
+Stores are pluggable through the ArchiveStore interface:
+
+    ARCHIVE_BACKEND=sqlite     one SQLite file (WAL mode), safe to read from every worker
+    ARCHIVE_BACKEND=segments   append-only segment files in a directory, compacted by the archiver
+    ARCHIVE_BACKEND=none       (default) no archival; conversations expire with their TTL
+
+Every worker runs the archiver loop, and a Redis lock makes sure only one
+pass runs at a time. The store path must therefore be shared by all workers,
+for example a volume mounted into every container.
+
+Configuration:
+    ARCHIVE_PATH=data/archive.sqlite3 | data/archive     file (sqlite) or directory (segments)
+    ARCHIVE_IDLE_SECONDS=86400     archive conversations idle longer than this
+    ARCHIVE_INTERVAL=600           seconds between archiver passes
+    ARCHIVE_BATCH=500              conversations examined per SCAN batch
+"""
+
+import os
+import json
+import zlib
+import time
+import fcntl
+import struct
+import sqlite3
+import asyncio
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Any, Optional, Iterator, Tuple, List
+
+from .metrics import ARCHIVE_EVENTS
+
+logger = logging.getLogger(__name__)
+
+ARCHIVER_LOCK_KEY = "archive:lock"
+
+# Delete the conversation only if it is still exactly what was archived
+DELETE_IF_UNCHANGED_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+def compress(conversation: Dict[str, Any]) -> bytes:
+    return zlib.compress(json.dumps(conversation, separators=(",", ":")).encode(), 6)
+
+
+def decompress(data: bytes) -> Dict[str, Any]:
+    return json.loads(zlib.decompress(data))
+
+
+class ArchiveStore:
+    """Cold storage for compressed conversations, keyed by thread ID"""
+
+    name = "base"
+
+    def put_many(self, records: List[Tuple[str, bytes]]):
+        """Store (thread_id, compressed conversation) pairs, replacing older copies"""
+        raise NotImplementedError
+
+    def get(self, thread_id: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def delete(self, thread_id: str):
+        raise NotImplementedError
+
+    def iter_records(self) -> Iterator[Tuple[str, bytes]]:
+        """Every archived (thread_id, compressed conversation)"""
+        raise NotImplementedError
+
+    def compact(self) -> int:
+        """Reclaim space held by replaced and deleted records; returns bytes reclaimed"""
+        return 0
+
+    def close(self):
+        pass
+
+
+class SQLiteArchiveStore(ArchiveStore):
+    """Archive in a single SQLite table"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Used from the event loop and from the archiver's thread
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=10.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS archived_conversations ("
+            "thread_id TEXT PRIMARY KEY, archived_at REAL NOT NULL, data BLOB NOT NULL)"
+        )
+        self.conn.commit()
+        self._lock = threading.Lock()
+
+    def put_many(self, records: List[Tuple[str, bytes]]):
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO archived_conversations (thread_id, archived_at, data) VALUES (?, ?, ?)",
+                [(thread_id, now, data) for thread_id, data in records]
+            )
+
+    def get(self, thread_id: str) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM archived_conversations WHERE thread_id = ?", (thread_id,)
+            ).fetchone()
+        return row[0] if row else None
+
+    def delete(self, thread_id: str):
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM archived_conversations WHERE thread_id = ?", (thread_id,))
+
+    def iter_records(self) -> Iterator[Tuple[str, bytes]]:
+        last = ""
+        while True:
+            with self._lock:
+                rows = self.conn.execute(
+                    "SELECT thread_id, data FROM archived_conversations WHERE thread_id > ? "
+                    "ORDER BY thread_id LIMIT 500", (last,)
+                ).fetchall()
+            if not rows:
+                return
+            yield from rows
+            last = rows[-1][0]
+
+    def close(self):
+        self.conn.close()
+
+
+class SegmentArchiveStore(ArchiveStore):
+    """Archive as append-only segment files with an in-memory index
+
+    Each record is a header (thread ID) and a compressed body; an empty body
+    is a tombstone and the newest record for a thread wins. Segments roll
+    over at `segment_bytes`. Readers in other processes pick up records
+    appended since their last look by scanning the new tail of each segment.
+
+    compact() copies the live records into fresh segments and removes the
+    old ones once most of the bytes are replaced or deleted records. Writers
+    and compaction hold an exclusive lock on the directory and readers a
+    shared one, so nobody reads a segment while it is being removed.
+    """
+
+    name = "segments"
+
+    RECORD_HEADER = struct.Struct(">HI")  # thread ID length, body length
+
+    def __init__(self, directory: str, segment_bytes: int = 64 * 1024 * 1024, min_garbage: float = 0.5):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.min_garbage = min_garbage
+        os.makedirs(directory, exist_ok=True)
+        # thread_id -> (segment name, body offset, body length)
+        self._index: Dict[str, Tuple[str, int, int]] = {}
+        self._scanned: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        with self._flock(fcntl.LOCK_SH):
+            self._refresh()
+
+    @contextmanager
+    def _flock(self, mode: int):
+        """Directory-wide lock shared with other processes: LOCK_SH to read, LOCK_EX to change segments"""
+        with open(os.path.join(self.directory, ".lock"), "a") as lock:
+            fcntl.flock(lock, mode)
+            yield
+
+    def _segments(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(".seg"))
+
+    def _refresh(self):
+        """Index records appended since the last scan; call with the directory lock held"""
+        segments = self._segments()
+        if any(name not in segments for name in self._scanned):
+            # Compacted by another process; index the new segments from scratch
+            self._index.clear()
+            self._scanned.clear()
+        for name in segments:
+            path = os.path.join(self.directory, name)
+            offset = self._scanned.get(name, 0)
+            if os.path.getsize(path) <= offset:
+                continue
+            with open(path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                f.seek(offset)
+                while offset + self.RECORD_HEADER.size <= size:
+                    id_length, body_length = self.RECORD_HEADER.unpack(f.read(self.RECORD_HEADER.size))
+                    record_end = offset + self.RECORD_HEADER.size + id_length + body_length
+                    if record_end > size:
+                        break  # still being written; indexed on a later refresh
+                    thread_id = f.read(id_length).decode()
+                    if body_length:
+                        self._index[thread_id] = (name, f.tell(), body_length)
+                    else:
+                        self._index.pop(thread_id, None)
+                    f.seek(record_end)
+                    offset = record_end
+            self._scanned[name] = offset
+
+    def _append(self, records: List[Tuple[str, bytes]]):
+        # Workers append tombstones (resets) while the archiver appends records
+        with self._flock(fcntl.LOCK_EX):
+            self._append_locked(records)
+            self._refresh()
+
+    def _append_locked(self, records: List[Tuple[str, bytes]]):
+        segments = self._segments()
+        name = segments[-1] if segments else "00000001.seg"
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path) and os.path.getsize(path) >= self.segment_bytes:
+            name = f"{int(name.split('.')[0]) + 1:08d}.seg"
+            path = os.path.join(self.directory, name)
+
+        with open(path, "ab") as f:
+            for thread_id, data in records:
+                encoded = thread_id.encode()
+                f.write(self.RECORD_HEADER.pack(len(encoded), len(data)) + encoded + data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def put_many(self, records: List[Tuple[str, bytes]]):
+        with self._lock:
+            self._append(records)
+
+    def get(self, thread_id: str) -> Optional[bytes]:
+        with self._lock, self._flock(fcntl.LOCK_SH):
+            self._refresh()
+            return self._read(thread_id)
+
+    def _read(self, thread_id: str) -> Optional[bytes]:
+        location = self._index.get(thread_id)
+        if location is None:
+            return None
+        name, offset, length = location
+        with open(os.path.join(self.directory, name), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    def delete(self, thread_id: str):
+        with self._lock:
+            with self._flock(fcntl.LOCK_SH):
+                self._refresh()
+                archived = thread_id in self._index
+            if archived:
+                self._append([(thread_id, b"")])
+
+    def iter_records(self) -> Iterator[Tuple[str, bytes]]:
+        with self._lock, self._flock(fcntl.LOCK_SH):
+            self._refresh()
+            thread_ids = sorted(self._index)
+        for thread_id in thread_ids:
+            data = self.get(thread_id)
+            if data is not None:
+                yield thread_id, data
+
+    def compact(self) -> int:
+        """Copy live records into fresh segments and remove the old ones once
+        at least `min_garbage` of their bytes belong to replaced or deleted records
+        """
+        with self._lock, self._flock(fcntl.LOCK_EX):
+            self._refresh()
+            old = self._segments()
+            total = sum(os.path.getsize(os.path.join(self.directory, name)) for name in old)
+            live = sum(self.RECORD_HEADER.size + len(thread_id.encode()) + length
+                       for thread_id, (_, _, length) in self._index.items())
+            if not total or (total - live) / total < self.min_garbage:
+                return 0
+
+            # New segments sort after the old ones, so a crash before the old
+            # ones are removed leaves the newest copy of every record in effect
+            number = int(old[-1].split(".")[0])
+            out, written = None, 0
+            try:
+                for thread_id in sorted(self._index):
+                    data = self._read(thread_id)
+                    if out is None or written >= self.segment_bytes:
+                        if out is not None:
+                            out.flush()
+                            os.fsync(out.fileno())
+                            out.close()
+                        number += 1
+                        out, written = open(os.path.join(self.directory, f"{number:08d}.seg"), "wb"), 0
+                    encoded = thread_id.encode()
+                    out.write(self.RECORD_HEADER.pack(len(encoded), len(data)) + encoded + data)
+                    written += self.RECORD_HEADER.size + len(encoded) + len(data)
+                if out is None:
+                    # Nothing live; an empty segment keeps segment names from being reused
+                    out = open(os.path.join(self.directory, f"{number + 1:08d}.seg"), "wb")
+                out.flush()
+                os.fsync(out.fileno())
+            finally:
+                if out is not None:
+                    out.close()
+
+            for name in old:
+                os.remove(os.path.join(self.directory, name))
+            self._index.clear()
+            self._scanned.clear()
+            self._refresh()
+
+        logger.info("Compacted archive segments: %d of %d bytes were live", live, total)
+        return total - live
+
+
+def create_archive_store() -> Optional[ArchiveStore]:
+    """Build the store configured through ARCHIVE_BACKEND (None when disabled)"""
+    backend = os.getenv("ARCHIVE_BACKEND", "none")
+    if backend == "none":
+        return None
+    if backend == "sqlite":
+        return SQLiteArchiveStore(os.getenv("ARCHIVE_PATH", "data/archive.sqlite3"))
+    if backend == "segments":
+        return SegmentArchiveStore(os.getenv("ARCHIVE_PATH", "data/archive"))
+    raise ValueError(f"Unknown ARCHIVE_BACKEND: {backend}")
+
+
+class Archiver:
+    """Moves idle conversations from Redis into an ArchiveStore"""
+
+    def __init__(self, redis_client, store: ArchiveStore, idle_seconds: float = 86400,
+                 interval: float = 600, batch_size: int = 500):
+        self.redis = redis_client
+        self.store = store
+        self.idle_seconds = idle_seconds
+        self.interval = interval
+        self.batch_size = batch_size
+        self._delete_if_unchanged = redis_client.register_script(DELETE_IF_UNCHANGED_SCRIPT)
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_env(cls, redis_client, store: ArchiveStore) -> "Archiver":
+        return cls(
+            redis_client,
+            store,
+            idle_seconds=float(os.getenv("ARCHIVE_IDLE_SECONDS", 86400)),
+            interval=float(os.getenv("ARCHIVE_INTERVAL", 600)),
+            batch_size=int(os.getenv("ARCHIVE_BATCH", 500))
+        )
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def aclose(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Compression and store writes are blocking; keep them off the event loop
+                await asyncio.to_thread(self.run_once)
+            except Exception as e:
+                logger.error("Archiver pass failed: %s", e, exc_info=True)
+
+    def run_once(self) -> int:
+        """One pass over the keyspace; returns the number of conversations archived"""
+        if not self.redis.set(ARCHIVER_LOCK_KEY, "1", nx=True, ex=max(int(self.interval), 60)):
+            return 0
+
+        archived = 0
+        try:
+            cutoff = (datetime.utcnow() - timedelta(seconds=self.idle_seconds)).isoformat()
+            cursor = 0
+            while True:
+                cursor, keys = self.redis.scan(cursor=cursor, match="conversation:*", count=self.batch_size)
+                if keys:
+                    archived += self._archive_batch(keys, cutoff)
+                if cursor == 0:
+                    break
+            self.store.compact()
+        finally:
+            self.redis.delete(ARCHIVER_LOCK_KEY)
+
+        if archived:
+            logger.info("Archived %d idle conversations", archived)
+        return archived
+
+    def _archive_batch(self, keys: List[bytes], cutoff: str) -> int:
+        pipe = self.redis.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+        values = pipe.execute()
+
+        idle = []
+        for key, raw in zip(keys, values):
+            if not raw:
+                continue
+            conversation = json.loads(raw)
+            updated = conversation.get("last_updated") or conversation.get("created_at", "")
+            if updated < cutoff:
+                idle.append((key, raw, conversation))
+        if not idle:
+            return 0
+
+        # Written (and synced) before anything leaves Redis
+        self.store.put_many([(key.decode().split(":", 1)[1], compress(conv)) for key, _, conv in idle])
+
+        pipe = self.redis.pipeline(transaction=False)
+        for key, raw, _ in idle:
+            self._delete_if_unchanged(keys=[key], args=[raw], client=pipe)
+        deleted = pipe.execute()
+
+        archived = sum(1 for d in deleted if d)
+        ARCHIVE_EVENTS.inc(archived, event="archived")
+        if archived < len(idle):
+            # Resumed while we were archiving; Redis holds the live copy, so drop the stale one
+            for (key, _, _), was_deleted in zip(idle, deleted):
+                if not was_deleted:
+                    self.store.delete(key.decode().split(":", 1)[1])
+            ARCHIVE_EVENTS.inc(len(idle) - archived, event="changed")
+        return archived
@@ -0,0 +1,134 @@
+"""Conversation cache - per-worker LRU of hot conversations in front of Redis
+
+A thread that is actively chatting is read on every turn. Keeping the parsed
+conversation in the worker saves the GET and the json.loads of the whole
+history. Every write or delete through SalesBotRedis publishes the thread ID
+on a Redis channel, and each worker's subscriber thread evicts that entry.
+If the subscription drops, messages may have been missed, so the whole cache
+is cleared. Entries also expire after CONVERSATION_CACHE_TTL seconds as a
+backstop.
+
+The cache only serves reads while its subscriber is running (started per
+worker by SalesBotRedis.start()), so processes that never start it, such as
+the job worker, always read Redis.
+
+Configuration:
+    CONVERSATION_CACHE_SIZE=1000    conversations kept per worker (0 disables)
+    CONVERSATION_CACHE_TTL=300      seconds an entry may be served without a write
+"""
+
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from .metrics import CONVERSATION_CACHE
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "conversation_cache:invalidate"
+
+
+class ConversationCache:
+    """Bounded LRU of parsed conversations, kept coherent through Redis pub/sub"""
+
+    def __init__(self, redis_client, max_entries: int = 1000, ttl: float = 300.0,
+                 channel: str = INVALIDATION_CHANNEL):
+        self.redis = redis_client
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.channel = channel
+        # Tags this worker's own invalidations so the subscriber can skip them
+        self.origin = uuid.uuid4().hex
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._pubsub = None
+        self._listener = None
+
+    @classmethod
+    def from_env(cls, redis_client) -> Optional["ConversationCache"]:
+        max_entries = int(os.getenv("CONVERSATION_CACHE_SIZE", 1000))
+        if max_entries <= 0:
+            return None
+        return cls(redis_client, max_entries, float(os.getenv("CONVERSATION_CACHE_TTL", 300)))
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None and self._listener.is_alive()
+
+    def start(self):
+        """Subscribe to invalidations on a background thread"""
+        self._pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        self._pubsub.subscribe(**{self.channel: self._on_message})
+        self._listener = self._pubsub.run_in_thread(
+            sleep_time=1.0, daemon=True, exception_handler=self._on_error
+        )
+
+    def stop(self):
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener.join(timeout=2)
+            self._listener = None
+        if self._pubsub is not None:
+            self._pubsub.close()
+            self._pubsub = None
+        self.clear()
+
+    def get(self, thread_id: str, pop: bool = False) -> Optional[Dict[str, Any]]:
+        """Cached conversation, or None
+
+        With `pop` the entry is removed: the caller is about to modify the
+        conversation and puts it back with put() once it is saved.
+        """
+        if not self.running:
+            return None
+        with self._lock:
+            entry = self._entries.pop(thread_id, None) if pop else self._entries.get(thread_id)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl:
+                self._entries.pop(thread_id, None)
+                entry = None
+            if entry is not None and not pop:
+                self._entries.move_to_end(thread_id)
+        CONVERSATION_CACHE.inc(event="hit" if entry else "miss")
+        return entry[1] if entry else None
+
+    def put(self, thread_id: str, conversation: Dict[str, Any]):
+        """Cache a conversation this worker just wrote to Redis"""
+        if not self.running:
+            return
+        with self._lock:
+            self._entries[thread_id] = (time.monotonic(), conversation)
+            self._entries.move_to_end(thread_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                CONVERSATION_CACHE.inc(event="evicted")
+
+    def discard(self, thread_id: str):
+        with self._lock:
+            self._entries.pop(thread_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self, pipe, thread_id: str):
+        """Queue the cross-worker invalidation on `pipe`, next to the write itself"""
+        pipe.publish(self.channel, f"{self.origin}:{thread_id}")
+
+    def _on_message(self, message: Dict[str, Any]):
+        origin, thread_id = message["data"].decode().split(":", 1)
+        if origin == self.origin:
+            return
+        with self._lock:
+            found = self._entries.pop(thread_id, None)
+        if found:
+            CONVERSATION_CACHE.inc(event="invalidated")
+
+    def _on_error(self, error: Exception, pubsub, thread):
+        # Invalidations may have been lost while disconnected; the next poll reconnects
+        logger.warning("Conversation cache subscription error, clearing cache: %s", error)
+        self.clear()
+        time.sleep(1.0)
@@ -0,0 +1,164 @@
+"""Funnel analytics - stage transition counters and time-in-stage histograms
+
+Every stage transition is rolled up into hourly and daily Redis buckets at
+write time, so the dashboard can read a window of funnel data with a handful
+of commands instead of scanning every conversation.
+"""
+
+import logging
+from typing import Dict, Any, Optional, List
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Conversation stages in funnel order
+FUNNEL_STAGES = ["greeting", "understanding", "identify_mvp", "scoping", "proposal", "booking"]
+
+# Upper bounds (seconds) for the time-in-stage histogram buckets (counts are per bucket, not cumulative)
+TIME_IN_STAGE_BUCKETS = [10, 30, 60, 300, 900, 3600, 21600, 86400]
+
+# How long rolled-up buckets are kept around
+HOURLY_TTL = 8 * 24 * 60 * 60     # 8 days
+DAILY_TTL = 90 * 24 * 60 * 60     # 90 days
+
+# Pseudo-stage used for the first transition of a brand new thread
+NEW_THREAD = "new"
+
+
+def _hour_bucket(ts: datetime) -> str:
+    return ts.strftime("%Y%m%d%H")
+
+
+def _day_bucket(ts: datetime) -> str:
+    return ts.strftime("%Y%m%d")
+
+
+def _histogram_field(seconds: float) -> str:
+    """Map a duration to its histogram bucket label"""
+    for bound in TIME_IN_STAGE_BUCKETS:
+        if seconds <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+class FunnelTracker:
+    """Records stage transitions into time-bucketed Redis structures"""
+
+    def __init__(self, redis_client, prefix: str = "funnel"):
+        self.redis = redis_client
+        self.prefix = prefix
+
+    def _key(self, *parts: str) -> str:
+        return ":".join((self.prefix,) + parts)
+
+    def record(self, thread_id: str, from_stage: Optional[str], to_stage: str,
+               entered_at: Optional[str], now: Optional[datetime] = None):
+        """Record one processed message and, if the stage changed, the transition
+
+        `from_stage` is None for a brand new thread. `entered_at` is the ISO
+        timestamp at which the thread entered `from_stage` and is used for
+        the time-in-stage histogram.
+        """
+        now = now or datetime.utcnow()
+        hour, day = _hour_bucket(now), _day_bucket(now)
+
+        pipe = self.redis.pipeline(transaction=False)
+
+        # Unique active threads per bucket
+        for granularity, bucket, ttl in (("hourly", hour, HOURLY_TTL), ("daily", day, DAILY_TTL)):
+            uniq_key = self._key("uniq", granularity, bucket)
+            pipe.pfadd(uniq_key, thread_id)
+            pipe.expire(uniq_key, ttl)
+
+        if from_stage != to_stage:
+            field = f"{from_stage or NEW_THREAD}>{to_stage}"
+            for granularity, bucket, ttl in (("hourly", hour, HOURLY_TTL), ("daily", day, DAILY_TTL)):
+                transitions_key = self._key("transitions", granularity, bucket)
+                pipe.hincrby(transitions_key, field, 1)
+                pipe.expire(transitions_key, ttl)
+
+                # Unique threads reaching each stage
+                reached_key = self._key("reached", granularity, bucket, to_stage)
+                pipe.pfadd(reached_key, thread_id)
+                pipe.expire(reached_key, ttl)
+
+            # Time spent in the stage we are leaving (daily histogram)
+            if from_stage and entered_at:
+                try:
+                    seconds = max((now - datetime.fromisoformat(entered_at)).total_seconds(), 0.0)
+                    hist_key = self._key("stage_time", from_stage, day)
+                    pipe.hincrby(hist_key, _histogram_field(seconds), 1)
+                    pipe.hincrby(hist_key, "count", 1)
+                    pipe.hincrbyfloat(hist_key, "sum", seconds)
+                    pipe.expire(hist_key, DAILY_TTL)
+                except ValueError:
+                    logger.warning("Invalid stage timestamp for thread %s: %s", thread_id, entered_at)
+
+        pipe.execute()
+
+    def get_timeseries(self, granularity: str = "hourly", periods: int = 24,
+                       stages: Optional[List[str]] = None,
+                       now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Read a window of funnel buckets, oldest first"""
+        if granularity not in ("hourly", "daily"):
+            raise ValueError("granularity must be 'hourly' or 'daily'")
+
+        now = now or datetime.utcnow()
+        step = timedelta(hours=1) if granularity == "hourly" else timedelta(days=1)
+        to_bucket = _hour_bucket if granularity == "hourly" else _day_bucket
+        buckets = [to_bucket(now - step * i) for i in reversed(range(periods))]
+        stages = stages or FUNNEL_STAGES
+
+        pipe = self.redis.pipeline(transaction=False)
+        for bucket in buckets:
+            pipe.hgetall(self._key("transitions", granularity, bucket))
+            pipe.pfcount(self._key("uniq", granularity, bucket))
+            for stage in stages:
+                pipe.pfcount(self._key("reached", granularity, bucket, stage))
+
+        # Time-in-stage histograms are kept per day, so aggregate the days covered
+        days = sorted({_day_bucket(now - step * i) for i in range(periods)})
+        for stage in stages:
+            for day in days:
+                pipe.hgetall(self._key("stage_time", stage, day))
+
+        results = iter(pipe.execute())
+
+        series = []
+        for bucket in buckets:
+            transitions = {_decode(k): int(v) for k, v in next(results).items()}
+            unique_threads = next(results)
+            reached = {stage: next(results) for stage in stages}
+            series.append({
+                "bucket": bucket,
+                "transitions": transitions,
+                "unique_threads": unique_threads,
+                "unique_threads_reached": reached
+            })
+
+        time_in_stage = {}
+        for stage in stages:
+            histogram = {}
+            for _ in days:
+                for field, value in next(results).items():
+                    field = _decode(field)
+                    histogram[field] = histogram.get(field, 0) + float(value)
+            count = int(histogram.pop("count", 0))
+            total = histogram.pop("sum", 0.0)
+            labels = [f"le_{b}" for b in TIME_IN_STAGE_BUCKETS] + ["le_inf"]
+            time_in_stage[stage] = {
+                "count": count,
+                "mean_seconds": round(total / count, 2) if count else None,
+                "buckets": {label: int(histogram.get(label, 0)) for label in labels}
+            }
+
+        return {
+            "granularity": granularity,
+            "periods": periods,
+            "series": series,
+            "time_in_stage": time_in_stage
+        }
+
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
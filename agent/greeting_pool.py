@@ -0,0 +1,171 @@
+"""Greeting pool - pre-generated first-turn replies served from Redis
+
+A brand new thread that opens with a plain "hi" gets the same kind of reply
+whoever sends it, so instead of a full LLM call it gets a varied reply
+popped from a Redis list. When the list drops below the low-water mark a
+background task tops it up. The key includes a hash of the system prompt, so
+editing the prompt starts a fresh pool and the old one expires.
+
+Pooled replies are context-free: they are generated from a context holding
+only message_count, never for a particular thread. A first message that
+already told the bot something (a business type, say) is not a bare
+greeting and goes to the LLM with its real context.
+
+Configuration:
+    GREETING_POOL=true|false        (default true)
+    GREETING_POOL_SIZE=50           refill target
+    GREETING_POOL_LOW_WATER=10      refill when fewer replies than this remain
+    GREETING_POOL_MAX_WORDS=5       longer first messages always go to the LLM
+"""
+
+import os
+import re
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Dict, Any, Optional, Callable
+
+from .llm import LLMProvider, LLMReply
+from .metrics import GREETING_POOL_EVENTS
+
+logger = logging.getLogger(__name__)
+
+GREETING_RE = re.compile(r"^\W*(hi|hello|hey|hiya|howdy|yo|greetings|good (morning|afternoon|evening))\b", re.IGNORECASE)
+
+# Openers used to generate pool entries; rotating them varies the wording. Bare greetings
+# only, since a pooled reply is served to greetings that say nothing else
+SEED_MESSAGES = ["Hi", "Hello!", "Hey there", "Good morning", "hey"]
+
+# Context keys a pooled reply may ignore; the thread ID is opaque and never shapes the reply
+POOLABLE_CONTEXT = {"message_count", "thread_id"}
+
+POOL_TTL = 7 * 24 * 60 * 60  # 7 days
+REFILL_LOCK_TTL = 120
+REFILL_CONCURRENCY = 4
+
+# KEYS[1]: refill lock. ARGV[1]: token of the refill that took it
+RELEASE_LOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class GreetingPool:
+    """Redis list of ready-made first-turn replies, refilled in the background"""
+
+    def __init__(self, redis_client, llm: LLMProvider, prompt_builder: Callable[[], str],
+                 stage: str = "understanding", size: int = 50, low_water: int = 10, max_words: int = 5):
+        self.redis = redis_client
+        self.llm = llm
+        self.prompt_builder = prompt_builder
+        self.stage = stage
+        self.size = size
+        self.low_water = low_water
+        self.max_words = max_words
+        self._refill_task: Optional[asyncio.Task] = None
+        self._release_lock = redis_client.register_script(RELEASE_LOCK_SCRIPT)
+
+    @classmethod
+    def from_env(cls, redis_client, llm: LLMProvider, prompt_builder: Callable[[], str]) -> Optional["GreetingPool"]:
+        if os.getenv("GREETING_POOL", "true").lower() != "true":
+            return None
+        return cls(
+            redis_client,
+            llm,
+            prompt_builder,
+            size=int(os.getenv("GREETING_POOL_SIZE", 50)),
+            low_water=int(os.getenv("GREETING_POOL_LOW_WATER", 10)),
+            max_words=int(os.getenv("GREETING_POOL_MAX_WORDS", 5))
+        )
+
+    @property
+    def key(self) -> str:
+        digest = hashlib.sha256(self.prompt_builder().encode()).hexdigest()[:12]
+        return f"greeting_pool:{digest}"
+
+    def accepts(self, message: str, context: Dict[str, Any]) -> bool:
+        """Whether a first message is a bare greeting a pooled reply can answer
+
+        The turn's context must hold nothing the pooled replies were not
+        generated with.
+        """
+        return (
+            len(message.split()) <= self.max_words
+            and bool(GREETING_RE.match(message))
+            and set(context) <= POOLABLE_CONTEXT
+        )
+
+    def take(self) -> Optional[LLMReply]:
+        """Pop a pooled reply (None when empty) and schedule a refill if running low"""
+        key = self.key
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.lpop(key)
+        pipe.llen(key)
+        entry, remaining = pipe.execute()
+
+        if remaining < self.low_water:
+            self.schedule_refill()
+
+        if entry is None:
+            GREETING_POOL_EVENTS.inc(event="miss")
+            return None
+        GREETING_POOL_EVENTS.inc(event="hit")
+        data = json.loads(entry)
+        return LLMReply(content=data["content"], model=data["model"])
+
+    def schedule_refill(self):
+        """Start a background refill unless one is already running in this worker"""
+        if self._refill_task is None or self._refill_task.done():
+            self._refill_task = asyncio.get_running_loop().create_task(self.refill())
+
+    async def aclose(self, timeout: float):
+        """Let a running refill finish for up to `timeout` seconds, then cancel it"""
+        task = self._refill_task
+        if task is None or task.done():
+            return
+        try:
+            await asyncio.wait_for(task, timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Greeting pool refill cancelled at shutdown")
+
+    async def refill(self):
+        """Top the pool up to `size`; a Redis lock keeps workers from refilling at once"""
+        key = self.key
+        lock_key = f"{key}:refill"
+        token = uuid.uuid4().hex
+        if not self.redis.set(lock_key, token, nx=True, ex=REFILL_LOCK_TTL):
+            return
+
+        try:
+            missing = self.size - self.redis.llen(key)
+            system_prompt = self.prompt_builder()
+            semaphore = asyncio.Semaphore(REFILL_CONCURRENCY)
+
+            async def generate(i: int):
+                async with semaphore:
+                    seed = SEED_MESSAGES[i % len(SEED_MESSAGES)]
+                    reply = await self.llm.agenerate(system_prompt, [], seed, stage=self.stage)
+                entry = {"content": reply.content, "model": reply.model, "generated_at": datetime.utcnow().isoformat()}
+                pipe = self.redis.pipeline(transaction=False)
+                pipe.rpush(key, json.dumps(entry))
+                pipe.expire(key, POOL_TTL)
+                pipe.execute()
+                GREETING_POOL_EVENTS.inc(event="generated")
+
+            if missing > 0:
+                results = await asyncio.gather(*(generate(i) for i in range(missing)), return_exceptions=True)
+                failures = [r for r in results if isinstance(r, Exception)]
+                if failures:
+                    logger.warning("Greeting pool refill: %d of %d generations failed (%s)",
+                                   len(failures), missing, failures[0])
+                logger.info("Greeting pool %s refilled with %d replies", key, missing - len(failures))
+        except Exception as e:
+            logger.error("Greeting pool refill failed: %s", e)
+        finally:
+            # A refill slower than REFILL_LOCK_TTL must not drop the lock another worker now holds
+            self._release_lock(keys=[lock_key], args=[token])
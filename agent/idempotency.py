@@ -0,0 +1,125 @@
+"""Idempotency keys - coalesce duplicate requests and replay their results
+
+A client that retries a request with the same Idempotency-Key either joins
+the computation still in flight or gets the stored result back, so a retry
+never re-runs the turn. Coalescing works within a worker (shared future) and
+across workers (a pending marker in Redis that other workers poll).
+
+Only successful results are stored; if the computation raises, the key is
+released and the next retry runs it again.
+
+Configuration:
+    IDEMPOTENCY_TTL=300             seconds a completed result is replayed
+    IDEMPOTENCY_WAIT=30             seconds a duplicate waits for another worker's result
+"""
+
+import os
+import json
+import asyncio
+import hashlib
+import logging
+from typing import Dict, Any, Optional, Tuple, Callable, Awaitable
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+POLL_INTERVAL = 0.05
+
+
+class IdempotencyConflict(Exception):
+    """The key was already used for a request with a different payload"""
+
+
+class IdempotencyTimeout(Exception):
+    """Another worker is still processing the same key"""
+
+
+def request_fingerprint(*parts: str) -> str:
+    return hashlib.sha256("\x1f".join(parts).encode()).hexdigest()
+
+
+class IdempotencyCache:
+    """Runs each idempotency key at most once and replays the stored result"""
+
+    def __init__(self, redis_client, ttl: int = 300, wait: float = 30.0, prefix: str = "idempotency"):
+        self.redis = redis_client
+        self.ttl = ttl
+        self.wait = wait
+        self.prefix = prefix
+        # redis key -> (fingerprint, future) for computations running in this worker
+        self._inflight: Dict[str, Tuple[str, "asyncio.Future[Dict[str, Any]]"]] = {}
+
+    @classmethod
+    def from_env(cls, redis_client) -> "IdempotencyCache":
+        return cls(
+            redis_client,
+            ttl=int(os.getenv("IDEMPOTENCY_TTL", 300)),
+            wait=float(os.getenv("IDEMPOTENCY_WAIT", 30))
+        )
+
+    def seen(self, key: str) -> bool:
+        """Whether `key` is in flight or has a stored result, i.e. run() would not compute it"""
+        redis_key = f"{self.prefix}:{key}"
+        return redis_key in self._inflight or bool(self.redis.exists(redis_key))
+
+    async def run(self, key: str, fingerprint: str,
+                  compute: Callable[[], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """Return (result, replayed) for `key`, calling `compute` only for the first request"""
+        redis_key = f"{self.prefix}:{key}"
+
+        # Same worker: attach to the in-flight computation
+        inflight = self._inflight.get(redis_key)
+        if inflight is not None:
+            inflight_fingerprint, future = inflight
+            if inflight_fingerprint != fingerprint:
+                raise IdempotencyConflict("Idempotency key was already used with a different request")
+            return await asyncio.shield(future), True
+
+        # Claim the key, or wait for the request that holds it
+        marker = json.dumps({"state": PENDING, "fingerprint": fingerprint})
+        while not self.redis.set(redis_key, marker, nx=True, ex=max(int(self.wait) * 2, 1)):
+            result = await self._await_stored(redis_key, fingerprint)
+            if result is not None:
+                return result, True
+            # The holder failed and released the key, so try to claim it again
+
+        future: "asyncio.Future[Dict[str, Any]]" = asyncio.get_running_loop().create_future()
+        self._inflight[redis_key] = (fingerprint, future)
+        try:
+            result = await compute()
+        except asyncio.CancelledError:
+            self.redis.delete(redis_key)
+            future.cancel()
+            raise
+        except Exception as e:
+            self.redis.delete(redis_key)
+            future.set_exception(e)
+            # Nobody may be waiting; don't report the exception as never retrieved
+            future.exception()
+            raise
+        else:
+            stored = json.dumps({"state": "done", "fingerprint": fingerprint, "result": result})
+            self.redis.set(redis_key, stored, ex=self.ttl)
+            future.set_result(result)
+            return result, False
+        finally:
+            del self._inflight[redis_key]
+
+    async def _await_stored(self, redis_key: str, fingerprint: str) -> Optional[Dict[str, Any]]:
+        """Wait for a result another worker is computing; None if it released the key"""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.wait
+        while True:
+            stored = self.redis.get(redis_key)
+            if stored is None:
+                return None
+
+            entry = json.loads(stored)
+            if entry["fingerprint"] != fingerprint:
+                raise IdempotencyConflict("Idempotency key was already used with a different request")
+            if entry["state"] != PENDING:
+                return entry["result"]
+
+            if loop.time() >= give_up_at:
+                raise IdempotencyTimeout("A request with this idempotency key is still in progress")
+            await asyncio.sleep(POLL_INTERVAL)
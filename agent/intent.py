@@ -0,0 +1,217 @@
+"""Stage intent classifier - hashed n-grams scored with a NumPy linear model
+
+Replaces the substring rules in _determine_next_stage and
+_extract_context_from_message. Those rules count "need" as approval, and any
+"$" as both a budget and a timeline. Each message is turned into hashed word
+unigrams, bigrams, character trigrams and budget/timeline regex hits. A
+logistic regression per label scores them with one gather-and-sum over a
+(features x labels) weight matrix, well under a millisecond per message.
+predict_batch scores many messages with a single segmented sum, for
+backfills. Once the model says a message states a budget or timeline, the
+value is extracted with the same regexes.
+
+Labels: affirm, decline, timeline, budget, features, ecommerce, saas
+
+Training data is JSONL with one {"text", "labels", "stage"} object per line
+("stage" is optional and only used for evaluation). A hand-labelled seed set
+ships as intent_seed.jsonl. The model is trained from it once per process, in
+a few hundred milliseconds, on the bots' background warm-up (see warm()), and
+the keyword rules decide until it is ready. NumPy is only imported then; the
+model itself lives in intent_model.py. Set INTENT_MODEL to use a model
+trained on your own conversations instead:
+
+    python -m agent.intent label export.ndjson --out to_label.jsonl   # user messages from /export/all, pre-labelled
+    python -m agent.intent train to_label.jsonl --out models/intent.npz
+    python -m benchmarks.eval_intent to_label.jsonl                   # compare with the keyword rules
+
+Configuration:
+    STAGE_CLASSIFIER=model|keywords     (default model)
+    INTENT_MODEL=models/intent.npz      (unset: train from the seed set)
+    INTENT_THRESHOLD=0.5                probability at which a label is predicted
+"""
+
+import os
+import re
+import sys
+import json
+import asyncio
+import logging
+import argparse
+import threading
+from typing import Dict, Any, Optional, List, Set, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .intent_model import IntentClassifier
+
+logger = logging.getLogger(__name__)
+
+LABELS = ["affirm", "decline", "timeline", "budget", "features", "ecommerce", "saas"]
+
+SEED_PATH = os.path.join(os.path.dirname(__file__), "intent_seed.jsonl")
+
+_NUMBER_WORDS = r"(?:a|an|one|two|three|four|five|six|seven|eight|nine|ten|twelve|a few|few|a couple of|couple of|several)"
+_MONTHS = r"(?:jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*"
+
+BUDGET_RE = re.compile(
+    r"[$€£]\s?\d[\d,.]*\s?[km]?\b(?:\s?(?:-|to|and)\s?[$€£]?\s?\d[\d,.]*\s?[km]?\b)?"
+    r"|\b\d[\d,.]*\s?(?:k|thousand|grand)\b(?:\s(?:dollars|usd|euros|eur))?"
+    r"|\b\d[\d,.]*\s?(?:dollars|usd|euros|eur)\b"
+    r"|\b(?:ten|twenty|thirty|forty|fifty|hundred)\s+thousand(?:\s+(?:dollars|euros))?",
+    re.IGNORECASE
+)
+TIMELINE_RE = re.compile(
+    r"\b\d+(?:\s?(?:-|to)\s?\d+)?\s?(?:days?|weeks?|months?|quarters?)\b"
+    rf"|\b{_NUMBER_WORDS}\s(?:days?|weeks?|months?|quarters?)\b"
+    rf"|\b(?:by|before|in|until|end of)\s(?:the\send\sof\s)?(?:{_MONTHS}|q[1-4]|next\s(?:week|month|quarter))\b"
+    r"|\bnext\s(?:week|month|quarter)\b|\bq[1-4]\b|\basap\b|\bas soon as possible\b",
+    re.IGNORECASE
+)
+
+
+def load_records(paths: List[str]) -> List[Dict[str, Any]]:
+    records = []
+    for path in paths:
+        with open(path) as f:
+            records.extend(json.loads(line) for line in f if line.strip())
+    return records
+
+
+_classifier: Optional["IntentClassifier"] = None
+_classifier_lock = threading.Lock()
+
+
+def get_intent_classifier() -> "IntentClassifier":
+    """The process-wide classifier: INTENT_MODEL if set, else trained from the seed set"""
+    global _classifier
+    with _classifier_lock:
+        if _classifier is None:
+            # NumPy is only imported here, so building a bot stays cheap
+            from .intent_model import IntentClassifier
+
+            threshold = float(os.getenv("INTENT_THRESHOLD", 0.5))
+            path = os.getenv("INTENT_MODEL")
+            if path:
+                _classifier = IntentClassifier.load(path, threshold)
+                logger.info("Loaded intent model from %s", path)
+            else:
+                _classifier = IntentClassifier.from_jsonl([SEED_PATH], threshold=threshold)
+        return _classifier
+
+
+def create_intent_classifier() -> Optional["IntentClassifier"]:
+    """The intent classifier, or None when STAGE_CLASSIFIER=keywords selects the old rules"""
+    if os.getenv("STAGE_CLASSIFIER", "model") == "keywords":
+        return None
+    return get_intent_classifier()
+
+
+async def load_intent_classifier() -> Optional["IntentClassifier"]:
+    """create_intent_classifier() on a worker thread, for the bots' background warm-up"""
+    return await asyncio.to_thread(create_intent_classifier)
+
+
+def update_context(stage: str, message: str, context: Dict[str, Any], intents: Set[str]) -> Dict[str, Any]:
+    """Model-driven counterpart of _extract_context_from_message"""
+    if stage in ("greeting", "understanding"):
+        if "ecommerce" in intents:
+            context["business_type"] = "e-commerce"
+        elif "saas" in intents:
+            context["business_type"] = "SaaS"
+
+    elif stage in ("identify_mvp", "scoping"):
+        if "timeline" in intents:
+            match = TIMELINE_RE.search(message)
+            context["timeline"] = match.group(0) if match else message
+        if "budget" in intents:
+            match = BUDGET_RE.search(message)
+            context["budget"] = match.group(0) if match else message
+        if "features" in intents:
+            if "features" not in context:
+                context["features"] = []
+            if isinstance(context.get("features"), list):
+                context["features"].append(message)
+
+    return context
+
+
+def stage_after(current_stage: str, intents: Set[str], context: Dict[str, Any]) -> str:
+    """Model-driven counterpart of _determine_next_stage, with the same message-count fallbacks"""
+    agreed = "affirm" in intents and "decline" not in intents
+
+    if current_stage == "greeting":
+        return "understanding"
+
+    elif current_stage == "understanding":
+        if context.get("message_count", 0) >= 3:
+            return "identify_mvp"
+        return "understanding"
+
+    elif current_stage == "identify_mvp":
+        if agreed or context.get("message_count", 0) >= 5:
+            return "scoping"
+        return "identify_mvp"
+
+    elif current_stage == "scoping":
+        if (context.get("timeline") and context.get("budget")) or context.get("message_count", 0) >= 7:
+            return "proposal"
+        return "scoping"
+
+    elif current_stage == "proposal":
+        if agreed:
+            return "booking"
+        return "proposal"
+
+    return current_stage
+
+
+def _label_export(export_path: str, out_path: str):
+    """Write the user messages of an /export/all NDJSON file, pre-labelled by the current model"""
+    classifier = get_intent_classifier()
+    written = 0
+    with open(export_path) as source, open(out_path, "w") as out:
+        for line in source:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            texts = [turn["content"] for turn in record["conversation"].get("history", []) if turn["role"] == "user"]
+            for text, labels in zip(texts, classifier.predict_batch(texts)):
+                out.write(json.dumps({"text": text, "labels": sorted(labels), "thread_id": record["thread_id"]}) + "\n")
+                written += 1
+    print(f"{written} messages written to {out_path}; review the labels before training")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the stage intent classifier or prepare training data")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    train = commands.add_parser("train", help="Train a model from labelled JSONL files")
+    train.add_argument("paths", nargs="+")
+    train.add_argument("--out", required=True, help="Model file (.npz) for INTENT_MODEL")
+    train.add_argument("--no-seed", action="store_true", help="Do not include the bundled seed set")
+    train.add_argument("--epochs", type=int, default=300)
+
+    label = commands.add_parser("label", help="Extract pre-labelled user messages from an /export/all NDJSON file")
+    label.add_argument("export")
+    label.add_argument("--out", required=True)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "label":
+        _label_export(args.export, args.out)
+        return
+
+    from .intent_model import IntentClassifier
+
+    paths = args.paths if args.no_seed else [SEED_PATH] + args.paths
+    records = load_records(paths)
+    if not records:
+        sys.exit("No training records")
+    classifier = IntentClassifier.train([record["text"] for record in records],
+                                        [record["labels"] for record in records], epochs=args.epochs)
+    classifier.save(args.out)
+    print(f"Trained on {len(records)} messages; model written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
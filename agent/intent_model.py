@@ -0,0 +1,162 @@
+"""NumPy linear model behind the stage intent classifier (see agent.intent)
+
+Kept apart from the rules in agent.intent so the bots can be built without
+importing NumPy; this module is imported when the model is loaded, on the
+background warm-up.
+"""
+
+import os
+import re
+import math
+import zlib
+from typing import Dict, Optional, List, Set, Iterable
+
+import numpy as np
+
+from .intent import LABELS, BUDGET_RE, TIMELINE_RE, load_records
+
+# Hashed feature space; collisions are rare at this size for a sales-chat vocabulary
+N_FEATURES = 2 ** 16
+
+TOKEN_RE = re.compile(r"\$|€|£|\d[\d,.]*k?|[a-z]+(?:['-][a-z]+)*")
+
+
+def _features(text: str) -> List[str]:
+    """Word unigrams and bigrams, character trigrams and entity matches; numbers are reduced to their shape"""
+    tokens = [
+        ("<num>k" if token.endswith("k") else "<num>") if token[0].isdigit() else token
+        for token in TOKEN_RE.findall(text.lower())
+    ]
+    features = [f"w:{token}" for token in tokens]
+    # Entity matches generalise from a few examples far better than the amounts' own n-grams
+    if BUDGET_RE.search(text):
+        features.append("e:money")
+    if TIMELINE_RE.search(text):
+        features.append("e:duration")
+    features.extend(f"b:{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    for token in tokens:
+        padded = f"^{token}$"
+        features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+    return features
+
+
+def feature_indices(text: str, n_features: int = N_FEATURES) -> np.ndarray:
+    """Sorted, de-duplicated hashed feature indices (binary bag of n-grams)"""
+    # crc32 rather than hash(): string hashes are salted per process
+    return np.fromiter(
+        sorted({zlib.crc32(feature.encode()) % n_features for feature in _features(text)}),
+        dtype=np.int64
+    )
+
+
+def _row_sums(weights: np.ndarray, columns: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Sum the weight rows of each message's features; `columns` holds the messages' indices back to back"""
+    sums = np.zeros((len(lengths), weights.shape[1]), dtype=weights.dtype)
+    nonempty = lengths > 0
+    if nonempty.any():
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        # reduceat sums each run up to the next start, so empty messages are skipped
+        sums[nonempty] = np.add.reduceat(weights[columns], starts[nonempty], axis=0)
+    return sums
+
+
+class IntentClassifier:
+    """One-vs-rest logistic regression over hashed n-grams"""
+
+    def __init__(self, weights: np.ndarray, bias: np.ndarray, labels: List[str], threshold: float = 0.5):
+        self.weights = weights
+        self.bias = bias
+        self.labels = list(labels)
+        self.n_features = weights.shape[0]
+        self.threshold = threshold
+        # Compare log-odds directly instead of applying the sigmoid per label
+        self._cutoff = math.log(threshold / (1 - threshold))
+        self._last: Optional[tuple] = None
+
+    @classmethod
+    def train(cls, texts: List[str], label_sets: List[Iterable[str]], labels: Optional[List[str]] = None,
+              n_features: int = N_FEATURES, epochs: int = 300, learning_rate: float = 2.0,
+              l2: float = 1e-4, threshold: float = 0.5) -> "IntentClassifier":
+        """Fit one logistic regression per label with full-batch Adagrad
+
+        Only features that occur in the training set can get a weight, so
+        training runs over that compact subset of the hashed space.
+        """
+        labels = labels or LABELS
+        rows = [feature_indices(text, n_features) for text in texts]
+        targets = np.array([[label in set(label_set) for label in labels] for label_set in label_sets],
+                           dtype=np.float64).reshape(len(texts), len(labels))
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        used, columns = np.unique(np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64),
+                                  return_inverse=True)
+        # The same entries sorted by feature, so gradients are one segmented sum per feature
+        by_feature = np.argsort(columns, kind="stable")
+        rows_by_feature = np.repeat(np.arange(len(rows)), lengths)[by_feature]
+        feature_starts = np.flatnonzero(np.diff(columns[by_feature], prepend=-1))
+
+        weights = np.zeros((len(used), len(labels)))
+        bias = np.zeros(len(labels))
+        weight_history = np.full_like(weights, 1e-8)
+        bias_history = np.full_like(bias, 1e-8)
+        for _ in range(epochs):
+            scores = _row_sums(weights, columns, lengths) + bias
+            errors = (1 / (1 + np.exp(-scores)) - targets) / len(rows)
+
+            weight_gradient = np.add.reduceat(errors[rows_by_feature], feature_starts, axis=0) + l2 * weights
+            bias_gradient = errors.sum(axis=0)
+            weight_history += weight_gradient ** 2
+            bias_history += bias_gradient ** 2
+            weights -= learning_rate * weight_gradient / np.sqrt(weight_history)
+            bias -= learning_rate * bias_gradient / np.sqrt(bias_history)
+
+        full = np.zeros((n_features, len(labels)), dtype=np.float32)
+        full[used] = weights
+        return cls(full, bias.astype(np.float32), labels, threshold)
+
+    @classmethod
+    def from_jsonl(cls, paths: List[str], **kwargs) -> "IntentClassifier":
+        records = load_records(paths)
+        return cls.train([record["text"] for record in records], [record["labels"] for record in records], **kwargs)
+
+    @classmethod
+    def load(cls, path: str, threshold: float = 0.5) -> "IntentClassifier":
+        with np.load(path) as model:
+            return cls(model["weights"], model["bias"], [str(label) for label in model["labels"]], threshold)
+
+    def save(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(path, weights=self.weights, bias=self.bias, labels=np.array(self.labels))
+
+    def scores(self, text: str) -> np.ndarray:
+        """Log-odds per label"""
+        return self.weights[feature_indices(text, self.n_features)].sum(axis=0) + self.bias
+
+    def predict_proba(self, text: str) -> Dict[str, float]:
+        probabilities = 1 / (1 + np.exp(-self.scores(text)))
+        return {label: float(p) for label, p in zip(self.labels, probabilities)}
+
+    def predict(self, text: str) -> Set[str]:
+        """Labels predicted for one message
+
+        A turn classifies the same message for context extraction and then
+        for the stage decision, so the last result is reused.
+        """
+        if self._last is not None and self._last[0] == text:
+            return self._last[1]
+        scores = self.scores(text)
+        intents = {label for label, score in zip(self.labels, scores) if score >= self._cutoff}
+        self._last = (text, intents)
+        return intents
+
+    def predict_batch(self, texts: List[str]) -> List[Set[str]]:
+        """Labels for many messages, scored with one gather and one segmented sum"""
+        rows = [feature_indices(text, self.n_features) for text in texts]
+        lengths = np.array([len(row) for row in rows], dtype=np.int64)
+        columns = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        scores = _row_sums(self.weights, columns, lengths) + self.bias
+        return [
+            {label for label, hit in zip(self.labels, row) if hit}
+            for row in scores >= self._cutoff
+        ]
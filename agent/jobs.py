@@ -0,0 +1,434 @@
+"""Asynchronous chat jobs - Redis queue, worker pool and long-poll results
+
+`/chat?mode=async` stores the turn as a job hash, appends its ID to the
+thread's job list and pushes the thread ID onto the shared queue, returning
+202 straight away. Separate worker processes pop from the queue and run the
+thread's oldest job through SalesBotRedis with a fixed concurrency; clients
+long-poll `/jobs/{id}` for the result. A per-thread lock keeps turns of one
+thread from running concurrently, and taking jobs from the thread's own
+list keeps them in order. Work for a thread whose lock is taken is parked
+until the holder releases it rather than cycled through the queue.
+
+Jobs survive a worker crash or deploy: popped work sits in the worker's
+processing list until its result is stored, and workers that start later
+requeue the processing lists of workers whose heartbeat has expired
+(HEARTBEAT_TTL seconds), so a job runs at least once.
+
+Run workers with:
+
+    python -m agent.jobs --concurrency 8 [--metrics-port 9100]
+
+Each job holds one of the LLM_MAX_INFLIGHT leases shared with /chat while it
+runs (see agent.rate_limit); when none frees up in time the job stays at
+the head of its thread and the thread is requeued.
+
+Configuration:
+    JOB_TTL=3600                seconds a job and its result are kept
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+import socket
+import argparse
+import threading
+import contextlib
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Dict, Any, Optional
+
+from .metrics import REGISTRY, CONTENT_TYPE, JOB_WAIT_SECONDS, JOBS
+from .rate_limit import Overloaded
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+FINISHED = (DONE, FAILED)
+
+THREAD_LOCK_TTL = 300
+POLL_INTERVAL = 0.1
+
+# Seconds without a heartbeat after which a worker's processing list is recovered
+HEARTBEAT_TTL = 30
+
+# KEYS: thread lock, worker's processing list, thread's parked list
+# ARGV: worker ID, lock TTL, thread ID, parked list TTL
+# Takes the thread lock, or moves the unit from processing to parked in the same step,
+# so the holder's release can never miss it
+ACQUIRE_OR_PARK_SCRIPT = """
+if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'EX', ARGV[2]) then
+    return 1
+end
+redis.call('LREM', KEYS[2], 1, ARGV[3])
+redis.call('RPUSH', KEYS[3], ARGV[3])
+redis.call('EXPIRE', KEYS[3], ARGV[4])
+return 0
+"""
+
+# KEYS: thread lock, thread's parked list, queue. ARGV: worker ID that holds the lock
+RELEASE_THREAD_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('DEL', KEYS[1])
+end
+for _ = 1, redis.call('LLEN', KEYS[2]) do
+    redis.call('LMOVE', KEYS[2], KEYS[3], 'LEFT', 'RIGHT')
+end
+return 1
+"""
+
+
+class JobQueue:
+    """Job records and the pending queue in Redis"""
+
+    def __init__(self, redis_client, prefix: str = "jobs", ttl: int = 3600):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.ttl = ttl
+        self.queue_key = f"{prefix}:queue"
+        self.stats_key = f"{prefix}:stats"
+        self.workers_key = f"{prefix}:workers"
+
+    def _job_key(self, job_id: str) -> str:
+        return f"{self.prefix}:job:{job_id}"
+
+    def _thread_key(self, thread_id: str) -> str:
+        return f"{self.prefix}:thread:{thread_id}"
+
+    def enqueue(self, thread_id: str, message: str) -> str:
+        """Store a job and queue one unit of work for its thread"""
+        job_id = uuid.uuid4().hex
+        job_key = self._job_key(job_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(job_key, mapping={
+            "status": QUEUED,
+            "thread_id": thread_id,
+            "message": message,
+            "enqueued_at": time.time()
+        })
+        pipe.expire(job_key, self.ttl)
+        pipe.rpush(self._thread_key(thread_id), job_id)
+        pipe.expire(self._thread_key(thread_id), self.ttl)
+        pipe.rpush(self.queue_key, thread_id)
+        pipe.execute()
+        JOBS.inc(event="enqueued")
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job status and, once finished, its result"""
+        raw = self.redis.hgetall(self._job_key(job_id))
+        if not raw:
+            return None
+        job = {k.decode(): v.decode() for k, v in raw.items()}
+
+        view: Dict[str, Any] = {"job_id": job_id, "status": job["status"], "thread_id": job["thread_id"]}
+        enqueued_at = float(job["enqueued_at"])
+        if "started_at" in job:
+            view["queue_wait_seconds"] = round(float(job["started_at"]) - enqueued_at, 3)
+        if "finished_at" in job:
+            view["processing_seconds"] = round(float(job["finished_at"]) - float(job["started_at"]), 3)
+        if "result" in job:
+            view["result"] = json.loads(job["result"])
+        if "error" in job:
+            view["error"] = job["error"]
+        return view
+
+    async def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """Long-poll until the job finishes or `timeout` passes; returns its current view"""
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in FINISHED or loop.time() >= give_up_at:
+                return job
+            await asyncio.sleep(POLL_INTERVAL)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth, age of the oldest queued job and lifetime wait statistics"""
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.llen(self.queue_key)
+        pipe.lindex(self.queue_key, 0)
+        pipe.hgetall(self.stats_key)
+        depth, head, totals = pipe.execute()
+        totals = {k.decode(): float(v) for k, v in totals.items()}
+
+        oldest_wait = None
+        oldest_job = self.redis.lindex(self._thread_key(head.decode()), 0) if head else None
+        if oldest_job:
+            enqueued_at = self.redis.hget(self._job_key(oldest_job.decode()), "enqueued_at")
+            if enqueued_at:
+                oldest_wait = round(time.time() - float(enqueued_at), 3)
+
+        started = int(totals.get("started", 0))
+        return {
+            "queue_depth": depth,
+            "oldest_wait_seconds": oldest_wait,
+            "started": started,
+            "done": int(totals.get("done", 0)),
+            "failed": int(totals.get("failed", 0)),
+            "mean_wait_seconds": round(totals.get("wait_seconds", 0.0) / started, 3) if started else None
+        }
+
+
+class JobWorker:
+    """Pops jobs and runs them through the bot with bounded concurrency
+
+    A thread's unit of work moves atomically from the queue into this
+    worker's processing list (BLMOVE), and its job stays at the head of the
+    thread's list until the result is written. A worker that dies keeps its
+    units in the processing list; once its heartbeat expires, the next worker
+    to start puts them back on the queue and the jobs run again.
+    """
+
+    def __init__(self, bot, queue: JobQueue, concurrency: int = 8, admission=None,
+                 worker_id: Optional[str] = None):
+        self.bot = bot
+        self.queue = queue
+        self.concurrency = concurrency
+        # AdmissionController whose in-flight LLM cap /chat also uses (None: uncapped)
+        self.admission = admission
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.processing_key = self._processing_key(self.worker_id)
+        self._acquire_or_park = queue.redis.register_script(ACQUIRE_OR_PARK_SCRIPT)
+        self._release = queue.redis.register_script(RELEASE_THREAD_SCRIPT)
+        self._stopping = False
+
+    def _processing_key(self, worker_id: str) -> str:
+        return f"{self.queue.prefix}:processing:{worker_id}"
+
+    def _heartbeat_key(self, worker_id: str) -> str:
+        return f"{self.queue.prefix}:worker:{worker_id}"
+
+    def _lock_key(self, thread_id: str) -> str:
+        return f"{self.queue.prefix}:lock:{thread_id}"
+
+    def _parked_key(self, thread_id: str) -> str:
+        return f"{self.queue.prefix}:parked:{thread_id}"
+
+    def stop(self):
+        self._stopping = True
+
+    def _release_thread(self, thread_id: str, owner: str):
+        """Drop `owner`'s lock on the thread and put the units parked behind it back on the queue"""
+        self._release(keys=[self._lock_key(thread_id), self._parked_key(thread_id), self.queue.queue_key],
+                      args=[owner])
+
+    def recover(self) -> int:
+        """Requeue the units left in the processing lists of workers whose heartbeat expired"""
+        redis_client = self.queue.redis
+        requeued = 0
+        for member in redis_client.smembers(self.queue.workers_key):
+            worker_id = member.decode()
+            if worker_id == self.worker_id or redis_client.exists(self._heartbeat_key(worker_id)):
+                continue
+            # SREM succeeds for exactly one recovering worker
+            if not redis_client.srem(self.queue.workers_key, worker_id):
+                continue
+            while True:
+                unit = redis_client.lmove(self._processing_key(worker_id), self.queue.queue_key, "RIGHT", "LEFT")
+                if unit is None:
+                    break
+                self._release_thread(unit.decode(), worker_id)
+                requeued += 1
+        if requeued:
+            logger.warning("Requeued %d jobs left by stopped workers", requeued)
+            JOBS.inc(requeued, event="recovered")
+        return requeued
+
+    async def _heartbeat(self):
+        redis_client = self.queue.redis
+        while True:
+            try:
+                redis_client.set(self._heartbeat_key(self.worker_id), "1", ex=HEARTBEAT_TTL)
+            except Exception as e:
+                logger.warning("Job worker heartbeat failed: %s", e)
+            await asyncio.sleep(HEARTBEAT_TTL / 3)
+
+    async def run(self):
+        """Process jobs until stop() is called, then finish the ones in flight"""
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+
+        def finished(task: asyncio.Task):
+            tasks.discard(task)
+            semaphore.release()
+
+        redis_client = self.queue.redis
+        redis_client.set(self._heartbeat_key(self.worker_id), "1", ex=HEARTBEAT_TTL)
+        redis_client.sadd(self.queue.workers_key, self.worker_id)
+        heartbeat = asyncio.create_task(self._heartbeat())
+        self.recover()
+        logger.info("Job worker %s started with concurrency %d", self.worker_id, self.concurrency)
+
+        try:
+            while not self._stopping:
+                await semaphore.acquire()
+                # BLMOVE blocks, so keep it off the event loop; the timeout lets stop() take effect
+                unit = await asyncio.to_thread(
+                    redis_client.blmove, self.queue.queue_key, self.processing_key, 1, "LEFT", "RIGHT"
+                )
+                if unit is None:
+                    semaphore.release()
+                    continue
+
+                task = asyncio.create_task(self._run_next(unit.decode()))
+                tasks.add(task)
+                task.add_done_callback(finished)
+
+            if tasks:
+                logger.info("Waiting for %d in-flight jobs", len(tasks))
+                await asyncio.gather(*tasks, return_exceptions=True)
+        finally:
+            heartbeat.cancel()
+            # Anything still in the processing list is recovered by the next worker to start
+            if not redis_client.llen(self.processing_key):
+                redis_client.srem(self.queue.workers_key, self.worker_id)
+                redis_client.delete(self._heartbeat_key(self.worker_id))
+
+    async def _run_next(self, thread_id: str):
+        """Run the oldest queued job of a thread, or park the unit while another worker holds the thread"""
+        redis_client = self.queue.redis
+        thread_key = self.queue._thread_key(thread_id)
+        if not self._acquire_or_park(
+            keys=[self._lock_key(thread_id), self.processing_key, self._parked_key(thread_id)],
+            args=[self.worker_id, THREAD_LOCK_TTL, thread_id, self.queue.ttl]
+        ):
+            # Parked; the lock holder puts it back on the queue when it releases the thread
+            return
+
+        job_id, finished = None, False
+        try:
+            job_id = redis_client.lindex(thread_key, 0)
+            finished = job_id is None or await self._run_job(job_id.decode(), thread_id)
+        finally:
+            pipe = redis_client.pipeline()
+            if finished:
+                # The job is only taken off its thread once its result is stored
+                if job_id is not None:
+                    pipe.lpop(thread_key)
+            else:
+                # Not run (no LLM lease, or Redis failed mid-job); try it again later
+                pipe.rpush(self.queue.queue_key, thread_id)
+            pipe.lrem(self.processing_key, 1, thread_id)
+            pipe.execute()
+            self._release_thread(thread_id, self.worker_id)
+        if not finished:
+            await asyncio.sleep(POLL_INTERVAL)
+
+    async def _run_job(self, job_id: str, thread_id: str) -> bool:
+        """Run a job under one of the global in-flight LLM leases /chat turns also take
+
+        Returns False when no lease freed up in time and the job should be retried.
+        """
+        try:
+            async with self.admission.llm_slot() if self.admission else contextlib.nullcontext():
+                await self._process_job(job_id, thread_id)
+            return True
+        except Overloaded:
+            return False
+
+    async def _process_job(self, job_id: str, thread_id: str):
+        redis_client = self.queue.redis
+        job_key = self.queue._job_key(job_id)
+        job = redis_client.hgetall(job_key)
+        if not job:
+            logger.warning("Job %s expired before it was processed", job_id)
+            return
+        if job[b"status"].decode() in FINISHED:
+            # Finished by a worker that stopped before taking it off the thread
+            return
+        message = job[b"message"].decode()
+
+        started_at = time.time()
+        wait = started_at - float(job[b"enqueued_at"])
+        JOB_WAIT_SECONDS.observe(wait)
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(job_key, mapping={"status": RUNNING, "started_at": started_at})
+        pipe.hincrby(self.queue.stats_key, "started", 1)
+        pipe.hincrbyfloat(self.queue.stats_key, "wait_seconds", wait)
+        pipe.execute()
+
+        update: Dict[str, Any]
+        try:
+            response, conversation = await self.bot.process_turn(message, thread_id)
+            result = {
+                "response": response,
+                "thread_id": thread_id,
+                "stage": conversation["stage"],
+                "context": conversation["context"]
+            }
+            update = {"status": DONE, "result": json.dumps(result)}
+        except Exception as e:
+            logger.error("Job %s failed: %s", job_id, e, exc_info=True)
+            update = {"status": FAILED, "error": str(e)}
+
+        update["finished_at"] = time.time()
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hset(job_key, mapping=update)
+        pipe.expire(job_key, self.queue.ttl)
+        pipe.hincrby(self.queue.stats_key, update["status"], 1)
+        pipe.execute()
+        JOBS.inc(event=update["status"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = REGISTRY.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    import signal
+
+    from .logic_redis import SalesBotRedis
+    from .logging_config import setup_logging, shutdown_logging
+    from .readiness import Warmup
+    from .rate_limit import AdmissionController
+    from .tracing import TRACER
+
+    parser = argparse.ArgumentParser(description="Run chat jobs queued by /chat?mode=async")
+    parser.add_argument("--concurrency", type=int, default=int(os.getenv("JOB_WORKER_CONCURRENCY", 8)),
+                        help="Jobs processed at once by this process")
+    parser.add_argument("--metrics-port", type=int, default=None, help="Serve Prometheus metrics on this port")
+    args = parser.parse_args()
+
+    setup_logging()
+    if args.metrics_port:
+        server = HTTPServer(("0.0.0.0", args.metrics_port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+
+    bot = SalesBotRedis()
+    worker = JobWorker(bot, JobQueue(bot.redis_client, ttl=int(os.getenv("JOB_TTL", 3600))), args.concurrency,
+                       admission=AdmissionController.from_env(bot.redis_client))
+
+    async def serve():
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, worker.stop)
+        await bot.start()
+        # Load the intent model in the background; jobs use the keyword rules until it is ready
+        warmup = Warmup()
+        warmup.start(bot.warm())
+        try:
+            await worker.run()
+        finally:
+            warmup.cancel()
+            await bot.aclose(float(os.getenv("DRAIN_TIMEOUT", 30)))
+
+    try:
+        asyncio.run(serve())
+    finally:
+        TRACER.shutdown()
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    main()
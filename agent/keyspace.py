@@ -0,0 +1,185 @@
+"""Keyspace memory introspection - what conversations, leads and indexes cost in Redis
+
+The keyspace is walked with SCAN, a small step at a time. Keys in each step
+that match a tracked prefix are measured with MEMORY USAGE and PTTL in one
+pipeline, so Redis serves other clients between steps and no single command
+is expensive. MEMORY USAGE uses SAMPLES 5, which sizes the nested lead hashes
+from a handful of fields instead of walking them.
+
+The walk stops at a time budget. SCAN visits keys in hash-table order, which
+is unrelated to their names, so key counts and total bytes are projected
+from the fraction of DBSIZE visited. A cut-short walk remembers its cursor
+(per worker and Redis server) and the next call resumes there, wrapping at
+the end of the table, so successive samples cover the whole table rather
+than its leading part again and again. A walk that starts at the beginning
+and finishes inside the budget has exact counts.
+
+Only the DEFAULT_PREFIXES are exported as the salesbot_keyspace_projected_bytes
+gauge, so ad-hoc ?prefix= queries do not create metric series.
+"""
+
+import time
+import heapq
+import logging
+from typing import Dict, Any, Optional, List, Tuple
+
+from .metrics import KEYSPACE_BYTES
+
+logger = logging.getLogger(__name__)
+
+# Key families reported by default (see SalesBotRedis._get_conversation_key / _get_lead_key)
+DEFAULT_PREFIXES = ["conversation:", "lead:", "leads:all"]
+
+# Elements MEMORY USAGE inspects in nested types (Redis default is also 5)
+MEMORY_SAMPLES = 5
+
+# Upper bounds (bytes) for the size histogram buckets
+SIZE_BUCKETS = [1024, 4096, 16384, 65536, 262144, 1048576]
+
+# Upper bounds (seconds) for the remaining-TTL histogram buckets
+TTL_BUCKETS = [3600, 86400, 7 * 86400, 30 * 86400]
+
+# SCAN cursor where the last cut-short walk stopped, per Redis server (0: start of the table)
+_cursors: Dict[str, int] = {}
+
+
+def _size_field(size: int) -> str:
+    for bound in SIZE_BUCKETS:
+        if size <= bound:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def _ttl_field(pttl: int) -> str:
+    if pttl < 0:
+        return "none"
+    for bound in TTL_BUCKETS:
+        if pttl <= bound * 1000:
+            return f"le_{bound}"
+    return "le_inf"
+
+
+def _percentile(values: List[int], q: float) -> int:
+    """Nearest-rank percentile of sorted values"""
+    return values[min(int(q * len(values)), len(values) - 1)] if values else 0
+
+
+class _PrefixStats:
+    """Sizes, TTLs and largest keys seen for one key prefix"""
+
+    def __init__(self, prefix: str, top: int):
+        self.prefix = prefix
+        self.top = top
+        self.seen = 0
+        self.queued = 0
+        self.sizes: List[int] = []
+        self.largest: List[Tuple[int, str, int]] = []
+        self.size_histogram = {**{f"le_{bound}": 0 for bound in SIZE_BUCKETS}, "le_inf": 0}
+        self.ttl_histogram = {"none": 0, **{f"le_{bound}": 0 for bound in TTL_BUCKETS}, "le_inf": 0}
+
+    def add(self, key: str, size: int, pttl: int):
+        self.sizes.append(size)
+        self.size_histogram[_size_field(size)] += 1
+        self.ttl_histogram[_ttl_field(pttl)] += 1
+        entry = (size, key, pttl)
+        if len(self.largest) < self.top:
+            heapq.heappush(self.largest, entry)
+        else:
+            heapq.heappushpop(self.largest, entry)
+
+    def report(self, coverage: float) -> Dict[str, Any]:
+        sizes = sorted(self.sizes)
+        mean = sum(sizes) / len(sizes) if sizes else 0.0
+        projected_keys = round(self.seen / coverage) if coverage else 0
+        return {
+            "keys_seen": self.seen,
+            "keys_sampled": len(sizes),
+            "projected_keys": projected_keys,
+            "projected_bytes": round(mean * projected_keys),
+            "bytes": {
+                "sampled_total": sum(sizes),
+                "mean": round(mean),
+                "p50": _percentile(sizes, 0.5),
+                "p90": _percentile(sizes, 0.9),
+                "p99": _percentile(sizes, 0.99),
+                "max": sizes[-1] if sizes else 0
+            },
+            "size_histogram": self.size_histogram,
+            "ttl_histogram": self.ttl_histogram,
+            "largest": [
+                {"key": key, "bytes": size, "ttl": pttl // 1000 if pttl >= 0 else None}
+                for size, key, pttl in sorted(self.largest, reverse=True)
+            ]
+        }
+
+
+def sample_keyspace(client, prefixes: Optional[List[str]] = None, budget: float = 0.5,
+                    max_samples: int = 1000, top: int = 10, scan_count: int = 100) -> Dict[str, Any]:
+    """Measure keys by prefix until the keyspace is walked or `budget` seconds pass
+
+    The walk resumes where the previous cut-short walk on this server stopped.
+    At most `max_samples` keys per prefix are measured; keys beyond that are
+    only counted, which keeps the projection accurate without extra commands.
+    Raises redis.ResponseError where MEMORY USAGE is disabled.
+    """
+    started = time.monotonic()
+    stats = [_PrefixStats(prefix, top) for prefix in (prefixes or DEFAULT_PREFIXES)]
+    dbsize = client.dbsize()
+    visited = 0
+    server = repr(client)
+    cursor = start_cursor = _cursors.get(server, 0)
+    complete = False
+
+    while True:
+        cursor, keys = client.scan(cursor=cursor, count=scan_count)
+        visited += len(keys)
+
+        measure = []
+        for key in keys:
+            name = key.decode(errors="replace")
+            for prefix_stats in stats:
+                if name.startswith(prefix_stats.prefix):
+                    prefix_stats.seen += 1
+                    if prefix_stats.queued < max_samples:
+                        prefix_stats.queued += 1
+                        measure.append((prefix_stats, key, name))
+                    break
+
+        if measure:
+            pipe = client.pipeline(transaction=False)
+            for _, key, _ in measure:
+                pipe.memory_usage(key, samples=MEMORY_SAMPLES)
+                pipe.pttl(key)
+            results = pipe.execute()
+            for i, (prefix_stats, _, name) in enumerate(measure):
+                size, pttl = results[2 * i], results[2 * i + 1]
+                if size is None:
+                    # Expired or deleted between SCAN and MEMORY USAGE
+                    continue
+                prefix_stats.add(name, size, pttl)
+
+        if cursor == 0:
+            # Only a walk from the start of the table has seen every key
+            complete = start_cursor == 0
+            break
+        if time.monotonic() - started >= budget:
+            break
+    _cursors[server] = cursor
+
+    # SCAN may return a key more than once, so never project below what was seen
+    coverage = 1.0 if complete or not dbsize else min(visited / dbsize, 1.0)
+    report = {
+        "complete": complete,
+        "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+        "dbsize": dbsize,
+        "keys_scanned": visited,
+        "start_cursor": start_cursor,
+        "coverage": round(coverage, 4),
+        "prefixes": {prefix_stats.prefix: prefix_stats.report(coverage) for prefix_stats in stats}
+    }
+    for prefix, prefix_report in report["prefixes"].items():
+        if prefix in DEFAULT_PREFIXES:
+            KEYSPACE_BYTES.set(prefix_report["projected_bytes"], prefix=prefix)
+    logger.info("Keyspace sample: %d of %d keys in %.0f ms (complete=%s)",
+                visited, dbsize, report["elapsed_ms"], complete)
+    return report
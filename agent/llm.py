@@ -0,0 +1,411 @@
+"""LLM providers - Anthropic, deterministic local mock and record/replay cassettes
+
+All bots talk to the model through `agenerate(system_prompt, history, message)`
+so the backend can be swapped without touching conversation logic:
+
+    LLM_PROVIDER=anthropic      (default) Claude via LangChain
+    LLM_PROVIDER=anthropic_sdk  Claude via the anthropic SDK directly (shared HTTP/2 client)
+    LLM_PROVIDER=mock           offline, deterministic replies with simulated latency
+
+Any provider can be wrapped in a cassette that records real exchanges to a
+JSONL file, or replays them without network access:
+
+    LLM_CASSETTE=cassettes/flow.jsonl LLM_CASSETTE_MODE=record|replay
+
+Each stage is sent to its own model settings (agent.routing; LLM_ROUTING=false
+uses ANTHROPIC_MODEL everywhere), and live providers are wrapped in
+agent.resilience.ResilientProvider (per-stage latency budgets, hedging to
+LLM_FALLBACK_MODEL, circuit breaker; LLM_RESILIENCE=false disables it).
+"""
+
+import os
+import json
+import time
+import random
+import asyncio
+import hashlib
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = "claude-3-5-sonnet-20241022"
+DEFAULT_FALLBACK_MODEL = "claude-3-5-haiku-20241022"
+
+# One AsyncAnthropic client per worker process, shared by every SDK provider
+_sdk_client = None
+
+
+@dataclass
+class LLMReply:
+    """A single model completion"""
+    content: str
+    model: str
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+def request_key(system_prompt: str, history: List[Dict[str, str]], message: str) -> str:
+    """Stable hash identifying a request, used for mock seeding and cassettes"""
+    payload = json.dumps([system_prompt, history, message], sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class LLMProvider:
+    """Base class for chat model backends"""
+
+    name = "base"
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        """Generate a reply to `message` given the system prompt and prior turns
+
+        `stage` is the conversation stage the reply is for; providers may use it
+        to pick budgets or models.
+        """
+        raise NotImplementedError
+
+    async def warm(self):
+        """Load heavy client libraries ahead of the first request (no-op by default)"""
+
+
+class AnthropicProvider(LLMProvider):
+    """Claude via langchain-anthropic
+
+    LangChain takes a second or more to import, so the client is built on
+    first use (or by warm()) rather than at construction.
+    """
+
+    name = "anthropic"
+
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.7, max_tokens: int = 1000):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._llm = None
+
+    @property
+    def llm(self):
+        if self._llm is None:
+            from langchain_anthropic import ChatAnthropic
+            import langchain_core.messages  # noqa: F401 - imported here so agenerate never pays for it
+
+            self._llm = ChatAnthropic(
+                model=self.model,
+                api_key=os.getenv("ANTHROPIC_API_KEY"),
+                temperature=self.temperature,
+                max_tokens=self.max_tokens
+            )
+        return self._llm
+
+    async def warm(self):
+        # Importing holds the import lock, so keep it off the event loop
+        await asyncio.to_thread(lambda: self.llm)
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+
+        messages = [SystemMessage(content=system_prompt)]
+        for msg in history:
+            if msg["role"] == "user":
+                messages.append(HumanMessage(content=msg["content"]))
+            else:
+                messages.append(AIMessage(content=msg["content"]))
+        messages.append(HumanMessage(content=message))
+
+        response = await self.llm.ainvoke(messages)
+        usage = getattr(response, "usage_metadata", None) or {}
+        return LLMReply(
+            content=response.content,
+            model=self.model,
+            input_tokens=usage.get("input_tokens", 0),
+            output_tokens=usage.get("output_tokens", 0)
+        )
+
+
+def sdk_client():
+    """The worker's AsyncAnthropic client, built on first use
+
+    It keeps a pool of HTTP/2 keep-alive connections, so routed stages, the
+    fallback model and concurrent turns all multiplex over the same TLS
+    connections instead of opening their own.
+    """
+    global _sdk_client
+    if _sdk_client is None:
+        from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+        try:
+            import h2  # noqa: F401 - httpx needs it for HTTP/2
+            http2 = True
+        except ImportError:
+            logger.warning("h2 is not installed; the Anthropic client falls back to HTTP/1.1")
+            http2 = False
+
+        _sdk_client = AsyncAnthropic(
+            api_key=os.getenv("ANTHROPIC_API_KEY"),
+            http_client=DefaultAsyncHttpxClient(http2=http2)
+        )
+    return _sdk_client
+
+
+class AnthropicSDKProvider(LLMProvider):
+    """Claude via the anthropic SDK, without LangChain message objects
+
+    The request payload is built straight from the stored history dicts, and
+    all instances share the worker's client (see sdk_client()).
+    """
+
+    name = "anthropic_sdk"
+
+    def __init__(self, model: str = DEFAULT_MODEL, temperature: float = 0.7, max_tokens: int = 1000,
+                 client=None):
+        self.model = model
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = sdk_client()
+        return self._client
+
+    async def warm(self):
+        client = await asyncio.to_thread(lambda: self.client)
+        if getattr(client, "_salesbot_warmed", False):
+            return
+        client._salesbot_warmed = True
+        # Open the TLS connection now so the first turn doesn't pay for the handshake
+        try:
+            await client.with_options(max_retries=0).models.list(limit=1)
+        except Exception as e:
+            logger.warning("Anthropic connection pre-warm failed: %s", e)
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        from anthropic.types import Message
+
+        messages = [
+            {"role": "user" if msg["role"] == "user" else "assistant", "content": msg["content"]}
+            for msg in history
+        ]
+        messages.append({"role": "user", "content": message})
+
+        payload = {
+            "model": self.model,
+            "system": system_prompt,
+            "messages": messages,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens
+        }
+        # messages.create() re-validates the payload against its TypedDicts, which costs
+        # tens of milliseconds on long histories; the dicts above are already wire format
+        response = await self.client.post("/v1/messages", body=payload, cast_to=Message)
+        return LLMReply(
+            content="".join(block.text for block in response.content if block.type == "text"),
+            model=self.model,
+            input_tokens=response.usage.input_tokens,
+            output_tokens=response.usage.output_tokens
+        )
+
+
+class MockProvider(LLMProvider):
+    """Deterministic offline model with a configurable latency distribution
+
+    Latency is a log-normal time-to-first-token (median `latency_ms`, shape
+    `latency_sigma`) plus output tokens divided by `tokens_per_second`.
+    Replies and latencies are derived from the request hash and `seed`, so
+    the same conversation always produces the same output and timing.
+    """
+
+    name = "mock"
+
+    REPLIES = [
+        "Thanks for sharing that! Could you tell me a bit more about your customers?",
+        "That makes sense. What's the biggest challenge you're facing right now?",
+        "Got it. An MVP that automates that workflow could save your team a lot of time. Does that sound useful?",
+        "Great. Which features would be must-haves for the first version?",
+        "Here's a quick proposal: a focused MVP with the core features you mentioned, delivered in about 6 weeks.",
+        "I'd love to walk through this on a strategy call: https://calendly.com/example/strategy-call",
+    ]
+
+    def __init__(self, latency_ms: float = 800.0, latency_sigma: float = 0.5,
+                 tokens_per_second: float = 60.0, seed: int = 0, model: str = "mock"):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.seed = seed
+        self.model = model
+
+    @classmethod
+    def from_env(cls) -> "MockProvider":
+        return cls(
+            latency_ms=float(os.getenv("MOCK_LLM_LATENCY_MS", 800)),
+            latency_sigma=float(os.getenv("MOCK_LLM_LATENCY_SIGMA", 0.5)),
+            tokens_per_second=float(os.getenv("MOCK_LLM_TOKENS_PER_SEC", 60)),
+            seed=int(os.getenv("MOCK_LLM_SEED", 0))
+        )
+
+    def _plan(self, system_prompt: str, history: List[Dict[str, str]], message: str):
+        """Pick the reply and simulated latency for a request"""
+        key = request_key(system_prompt, history, message)
+        rng = random.Random(f"{self.seed}:{key}")
+        content = rng.choice(self.REPLIES)
+        output_tokens = estimate_tokens(content)
+
+        latency = 0.0
+        if self.latency_ms > 0:
+            latency = rng.lognormvariate(0.0, self.latency_sigma) * self.latency_ms / 1000
+        if self.tokens_per_second > 0:
+            latency += output_tokens / self.tokens_per_second
+
+        input_tokens = estimate_tokens(system_prompt + message + "".join(m["content"] for m in history))
+        return LLMReply(content, self.model, input_tokens, output_tokens), latency
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        reply, latency = self._plan(system_prompt, history, message)
+        if latency:
+            await asyncio.sleep(latency)
+        return reply
+
+
+class CassetteProvider(LLMProvider):
+    """Records exchanges with an inner provider to JSONL, or replays them
+
+    In replay mode an unknown request raises LookupError rather than silently
+    reaching the network. With `replay_latency` the recorded call duration is
+    reproduced, which keeps replayed benchmarks realistic.
+    """
+
+    name = "cassette"
+
+    def __init__(self, path: str, mode: str = "replay", inner: Optional[LLMProvider] = None,
+                 replay_latency: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError("Cassette mode must be 'record' or 'replay'")
+        if mode == "record" and inner is None:
+            raise ValueError("Recording requires an inner provider")
+
+        self.path = path
+        self.mode = mode
+        self.inner = inner
+        self.replay_latency = replay_latency
+        self.entries: Dict[str, Dict[str, Any]] = {}
+
+        if os.path.exists(path):
+            with open(path) as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry["key"]] = entry
+        logger.info("Loaded %d cassette entries from %s (%s mode)", len(self.entries), path, mode)
+
+    async def warm(self):
+        if self.inner is not None:
+            await self.inner.warm()
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        key = request_key(system_prompt, history, message)
+
+        if self.mode == "replay":
+            entry = self.entries.get(key)
+            if entry is None:
+                raise LookupError(f"No cassette entry for request {key[:12]} in {self.path}")
+            if self.replay_latency and entry.get("latency"):
+                await asyncio.sleep(entry["latency"])
+            return LLMReply(**entry["reply"])
+
+        start = time.perf_counter()
+        reply = await self.inner.agenerate(system_prompt, history, message, stage=stage)
+        entry = {
+            "key": key,
+            "request": {"system": system_prompt, "history": history, "message": message},
+            "reply": asdict(reply),
+            "latency": round(time.perf_counter() - start, 4)
+        }
+        self.entries[key] = entry
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+        return reply
+
+
+def create_llm_provider() -> LLMProvider:
+    """Build the provider configured through environment variables"""
+    provider_name = os.getenv("LLM_PROVIDER", "anthropic")
+    cassette = os.getenv("LLM_CASSETTE")
+    cassette_mode = os.getenv("LLM_CASSETTE_MODE", "replay")
+
+    # Replaying needs no backend at all
+    if cassette and cassette_mode == "replay":
+        return CassetteProvider(
+            cassette,
+            mode="replay",
+            replay_latency=os.getenv("LLM_CASSETTE_REPLAY_LATENCY", "false").lower() == "true"
+        )
+
+    if provider_name not in ("mock", "anthropic", "anthropic_sdk"):
+        raise ValueError(f"Unknown LLM_PROVIDER: {provider_name}")
+
+    if os.getenv("LLM_ROUTING", "true").lower() == "true":
+        from .routing import RoutingTable, RoutedProvider
+
+        table = RoutingTable(
+            os.getenv("LLM_ROUTES_FILE", "llm_routes.json"),
+            reload_interval=float(os.getenv("LLM_ROUTES_RELOAD_SECONDS", 5))
+        )
+        provider: LLMProvider = RoutedProvider(table, lambda route: _route_provider(provider_name, route))
+    elif provider_name == "mock":
+        provider = MockProvider.from_env()
+    else:
+        provider = _anthropic_class(provider_name)(model=os.getenv("ANTHROPIC_MODEL", DEFAULT_MODEL))
+
+    if cassette:
+        provider = CassetteProvider(cassette, mode=cassette_mode, inner=provider)
+
+    if os.getenv("LLM_RESILIENCE", "true").lower() == "true":
+        from .resilience import ResilientProvider
+
+        provider = ResilientProvider.from_env(provider, _fallback_provider(provider_name))
+
+    logger.info("Using LLM provider: %s", provider.name)
+    return provider
+
+
+def _anthropic_class(provider_name: str):
+    return AnthropicSDKProvider if provider_name == "anthropic_sdk" else AnthropicProvider
+
+
+def _route_provider(provider_name: str, route) -> LLMProvider:
+    """Backend for one routing table entry"""
+    if provider_name == "mock":
+        provider = MockProvider.from_env()
+        provider.model = route.model
+        return provider
+    return _anthropic_class(provider_name)(model=route.model, temperature=route.temperature,
+                                           max_tokens=route.max_tokens)
+
+
+def _fallback_provider(provider_name: str) -> Optional[LLMProvider]:
+    """Faster model used for hedged requests and while the primary is failing"""
+    if provider_name == "mock":
+        fallback = MockProvider.from_env()
+        fallback.latency_ms = float(os.getenv("MOCK_LLM_FALLBACK_LATENCY_MS", fallback.latency_ms / 4))
+        return fallback
+
+    model = os.getenv("LLM_FALLBACK_MODEL", DEFAULT_FALLBACK_MODEL)
+    if not model:
+        return None
+    return _anthropic_class(provider_name)(model=model, max_tokens=500)
@@ -4,44 +4,118 @@ Now with persistent storage, notifications, and lead tracking!
 
 import os
 import json
+import time
+import asyncio
 import logging
-import redis
 import httpx
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Iterator, Tuple
 from datetime import datetime
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from .llm import create_llm_provider
+from .intent import load_intent_classifier, update_context, stage_after
+from .funnel import FunnelTracker
+from .conversation_cache import ConversationCache
+from .read_replicas import ReadReplicas
+from .archive import Archiver, create_archive_store, decompress
+from .greeting_pool import GreetingPool
+from .keyspace import sample_keyspace
+from .metrics import PHASE_SECONDS, NOTIFICATIONS, ARCHIVE_EVENTS, observe_llm_reply, notification_outcome
+from .redis_client import create_redis_client
+from .tracing import start_span
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Returned instead of a model reply when processing a message fails
+ERROR_REPLY = "I apologize, but I encountered an error. Could you please try again?"
+
 
 class SalesBotRedis:
     """Enhanced sales bot with Redis persistence and notifications"""
     
     def __init__(self):
         """Initialize the sales bot with Redis"""
-        # Initialize Anthropic model
-        self.llm = ChatAnthropic(
-            model="claude-3-5-sonnet-20241022",
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-            temperature=0.7,
-            max_tokens=1000
-        )
+        # Initialize LLM provider (Anthropic, local mock or cassette replay)
+        self.llm = create_llm_provider()
         
         # Initialize Redis connection
         redis_url = os.getenv("REDIS_URL", "redis://localhost:6379/0")
-        self.redis_client = redis.from_url(redis_url)
+        self.redis_client = create_redis_client(
+            redis_url,
+            max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+        )
         logger.info(f"Connected to Redis at {redis_url}")
         
+        # Replicas for dashboard/export reads; /chat always uses the primary
+        self.read_replicas = ReadReplicas.from_env(self.redis_client)
+        
+        # Cold storage for idle conversations (ARCHIVE_BACKEND); reads fall through to it
+        self.archive = create_archive_store()
+        self.archiver = Archiver.from_env(self.redis_client, self.archive) if self.archive else None
+        
+        # Rolled-up funnel analytics (stage transitions, time in stage)
+        self.funnel = FunnelTracker(self.redis_client)
+        
+        # Parsed hot conversations, invalidated across workers via pub/sub
+        self.conversation_cache = ConversationCache.from_env(self.redis_client)
+        
+        # Pre-generated replies for new threads that open with a bare greeting
+        self.greeting_pool = GreetingPool.from_env(
+            self.redis_client,
+            self.llm,
+            lambda: self._get_system_prompt("understanding", {"message_count": 1})
+        )
+        
+        # Intent model for stage transitions and context extraction, loaded by warm()
+        # (None: keyword rules, until then or with STAGE_CLASSIFIER=keywords)
+        self.intents = None
+        
         # Webhook URL for notifications
         self.webhook_url = os.getenv("WEBHOOK_URL")
         self.slack_webhook = os.getenv("SLACK_WEBHOOK_URL")
         
+        # Shared keep-alive client for notifications, opened by start()
+        self.http_client: Optional[httpx.AsyncClient] = None
+        self._inflight_turns = 0
+        
         logger.info("Sales bot with Redis initialized successfully")
     
+    async def start(self):
+        """Open per-worker async resources"""
+        self.http_client = httpx.AsyncClient(timeout=10.0)
+        if self.conversation_cache:
+            self.conversation_cache.start()
+        if self.archiver:
+            self.archiver.start()
+    
+    async def warm(self):
+        """Import LLM client libraries and load the intent model, off the request path"""
+        async def load_intents():
+            self.intents = await load_intent_classifier()
+        
+        await asyncio.gather(self.llm.warm(), load_intents())
+    
+    async def aclose(self, timeout: float = 30.0):
+        """Drain in-flight turns and background work, then release connections"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        while self._inflight_turns and loop.time() < deadline:
+            await asyncio.sleep(0.05)
+        if self._inflight_turns:
+            logger.warning("Shutting down with %d turns still in flight", self._inflight_turns)
+        
+        if self.greeting_pool:
+            await self.greeting_pool.aclose(max(deadline - loop.time(), 0))
+        if self.http_client:
+            await self.http_client.aclose()
+            self.http_client = None
+        if self.conversation_cache:
+            self.conversation_cache.stop()
+        if self.archiver:
+            await self.archiver.aclose()
+            self.archive.close()
+        self.read_replicas.close()
+        self.redis_client.close()
+    
     def _get_conversation_key(self, thread_id: str) -> str:
         """Generate Redis key for conversation"""
         return f"conversation:{thread_id}"
@@ -50,6 +124,16 @@ class SalesBotRedis:
         """Generate Redis key for lead data"""
         return f"lead:{thread_id}"
     
+    def _from_archive(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Conversation moved to cold storage by the archiver, if any"""
+        if not self.archive:
+            return None
+        data = self.archive.get(thread_id)
+        if data is None:
+            return None
+        ARCHIVE_EVENTS.inc(event="restored")
+        return decompress(data)
+    
     async def _send_notification(self, thread_id: str, stage: str, context: Dict[str, Any], conversation_history: List[Dict]):
         """Send notification when prospect reaches booking stage"""
         if stage != "booking":
@@ -81,9 +165,7 @@ class SalesBotRedis:
             
             # Send webhook notification
             if self.webhook_url:
-                async with httpx.AsyncClient() as client:
-                    await client.post(self.webhook_url, json=lead_data)
-                    logger.info(f"Webhook notification sent for thread {thread_id}")
+                await self._post_notification("webhook", self.webhook_url, lead_data, thread_id)
             
             # Send Slack notification
             if self.slack_webhook:
@@ -117,12 +199,28 @@ class SalesBotRedis:
                     ]
                 }
                 
-                async with httpx.AsyncClient() as client:
-                    await client.post(self.slack_webhook, json=slack_message)
-                    logger.info(f"Slack notification sent for thread {thread_id}")
+                await self._post_notification("slack", self.slack_webhook, slack_message, thread_id)
                     
         except Exception as e:
-            logger.error(f"Error sending notification: {str(e)}", exc_info=True)
+            logger.error("Error sending notification: %s", e, exc_info=True)
+    
+    async def _post_notification(self, channel: str, url: str, payload: Dict[str, Any], thread_id: str):
+        """POST a notification payload and record its outcome"""
+        try:
+            with start_span("notification.post", channel=channel, thread_id=thread_id) as span:
+                if self.http_client:
+                    response = await self.http_client.post(url, json=payload)
+                else:
+                    async with httpx.AsyncClient() as client:
+                        response = await client.post(url, json=payload)
+                if span is not None:
+                    span.set_attribute("http.status_code", response.status_code)
+            outcome = notification_outcome(response)
+            logger.info("%s notification %s for thread %s", channel.capitalize(), outcome, thread_id)
+        except Exception as e:
+            outcome = "error"
+            logger.error("Error sending %s notification: %s", channel, e)
+        NOTIFICATIONS.inc(channel=channel, outcome=outcome)
     
     def _summarize_conversation(self, history: List[Dict]) -> str:
         """Create a brief summary of the conversation"""
@@ -238,6 +336,9 @@ Be enthusiastic but professional.
     def _determine_next_stage(self, current_stage: str, user_message: str, context: Dict[str, Any]) -> str:
         """Determine what stage to move to based on conversation progress"""
         
+        if self.intents:
+            return stage_after(current_stage, self.intents.predict(user_message), context)
+        
         # Simple rule-based progression
         if current_stage == "greeting":
             # After greeting, move to understanding
@@ -297,6 +398,9 @@ Be enthusiastic but professional.
     def _extract_context_from_message(self, stage: str, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Extract relevant information from user message to update context"""
         
+        if self.intents:
+            return update_context(stage, user_message, context, self.intents.predict(user_message))
+        
         # Simple extraction based on keywords (in production, use NLP)
         if stage == "understanding":
             # Look for business type keywords
@@ -324,21 +428,60 @@ Be enthusiastic but professional.
     async def process_message(self, message: str, thread_id: str = "default") -> str:
         """Process a user message and return bot response"""
         try:
-            # Get conversation from Redis
-            conv_key = self._get_conversation_key(thread_id)
-            stored_data = self.redis_client.get(conv_key)
-            
-            if stored_data:
-                convo = json.loads(stored_data)
-            else:
-                # Create new conversation
-                convo = {
-                    "stage": "greeting",
-                    "context": {"message_count": 0, "thread_id": thread_id},
-                    "history": [],
-                    "created_at": datetime.utcnow().isoformat()
-                }
+            bot_message, _ = await self.process_turn(message, thread_id)
+            return bot_message
             
+        except Exception as e:
+            logger.error("Error processing message: %s", e, exc_info=True)
+            return ERROR_REPLY
+    
+    async def process_turn(self, message: str, thread_id: str = "default") -> Tuple[str, Dict[str, Any]]:
+        """Process a user message and return the bot response with the saved conversation
+        
+        Unlike process_message, errors are raised to the caller.
+        """
+        self._inflight_turns += 1
+        try:
+            return await self._process_turn(message, thread_id)
+        finally:
+            self._inflight_turns -= 1
+    
+    async def _process_turn(self, message: str, thread_id: str) -> Tuple[str, Dict[str, Any]]:
+        started = time.perf_counter()
+        
+        # Get conversation from this worker's cache or Redis; a cached entry is taken
+        # out while the turn modifies it and put back once saved
+        conv_key = self._get_conversation_key(thread_id)
+        with PHASE_SECONDS.time(bot="SalesBotRedis", phase="redis_read"):
+            convo = self.conversation_cache.get(thread_id, pop=True) if self.conversation_cache else None
+            if convo is None:
+                stored_data = self.redis_client.get(conv_key)
+                if stored_data:
+                    convo = json.loads(stored_data)
+        
+        # A resumed archived thread is rehydrated into Redis by the save below
+        rehydrated = False
+        if convo is None and self.archive:
+            with PHASE_SECONDS.time(bot="SalesBotRedis", phase="archive_read"):
+                convo = await asyncio.to_thread(self._from_archive, thread_id)
+            rehydrated = convo is not None
+        
+        if convo is not None:
+            previous_stage = convo["stage"]
+        else:
+            # Create new conversation
+            now = datetime.utcnow().isoformat()
+            convo = {
+                "stage": "greeting",
+                "context": {"message_count": 0, "thread_id": thread_id},
+                "history": [],
+                "created_at": now,
+                "stage_entered_at": now,
+                "transitions": [{"from": None, "to": "greeting", "at": now}]
+            }
+            previous_stage = None
+        
+        with PHASE_SECONDS.time(bot="SalesBotRedis", phase="prompt_build"):
             # Update context
             convo["context"]["message_count"] += 1
             convo["context"] = self._extract_context_from_message(
@@ -352,69 +495,110 @@ Be enthusiastic but professional.
             
             # Get system prompt for current stage
             system_prompt = self._get_system_prompt(next_stage, convo["context"])
-            
-            # Build conversation history
-            messages = [SystemMessage(content=system_prompt)]
-            
-            # Add recent history (last 6 messages for context)
-            for msg in convo["history"][-6:]:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                else:
-                    messages.append(AIMessage(content=msg["content"]))
-            
-            # Add current message
-            messages.append(HumanMessage(content=message))
-            
-            # Get response from LLM
-            response = self.llm.invoke(messages)
-            bot_message = response.content
-            
-            # Update conversation state
-            convo["stage"] = next_stage
-            convo["history"].append({"role": "user", "content": message})
-            convo["history"].append({"role": "assistant", "content": bot_message})
-            convo["last_updated"] = datetime.utcnow().isoformat()
-            
-            # Save to Redis
-            self.redis_client.setex(
+        
+        # A new thread opening with a bare greeting is answered from the pre-generated pool
+        reply = None
+        if (previous_stage is None and self.greeting_pool
+                and self.greeting_pool.accepts(message, convo["context"])):
+            with PHASE_SECONDS.time(bot="SalesBotRedis", phase="greeting_pool"):
+                reply = self.greeting_pool.take()
+        
+        if reply is None:
+            # Get response from LLM with recent history (last 6 messages for context)
+            with PHASE_SECONDS.time(bot="SalesBotRedis", phase="llm"), start_span("llm.generate", stage=next_stage):
+                reply = await self.llm.agenerate(system_prompt, convo["history"][-6:], message, stage=next_stage)
+            observe_llm_reply(reply)
+        bot_message = reply.content
+        
+        # Update conversation state
+        now = datetime.utcnow()
+        stage_entered_at = convo.get("stage_entered_at", convo.get("created_at"))
+        if next_stage != convo["stage"]:
+            convo.setdefault("transitions", []).append(
+                {"from": convo["stage"], "to": next_stage, "at": now.isoformat()}
+            )
+            convo["stage_entered_at"] = now.isoformat()
+        convo["stage"] = next_stage
+        convo["history"].append({"role": "user", "content": message})
+        convo["history"].append({"role": "assistant", "content": bot_message})
+        convo["last_updated"] = now.isoformat()
+        
+        # Save to Redis
+        with PHASE_SECONDS.time(bot="SalesBotRedis", phase="save"):
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.setex(
                 conv_key,
                 86400 * 7,  # 7 days expiration
                 json.dumps(convo)
             )
+            if self.conversation_cache:
+                self.conversation_cache.invalidate(pipe, thread_id)
+            pipe.execute()
+            if self.conversation_cache:
+                self.conversation_cache.put(thread_id, convo)
             
-            # Send notification if reaching booking stage
-            if next_stage == "booking" and convo["stage"] != "booking":
-                await self._send_notification(thread_id, next_stage, convo["context"], convo["history"])
-            
-            logger.info(f"Stage: {convo['stage']}, Context: {convo['context']}")
+            # Redis holds the live copy now; a stale archive copy would resurface once it expires
+            if rehydrated:
+                await asyncio.to_thread(self.archive.delete, thread_id)
             
-            return bot_message
-            
-        except Exception as e:
-            logger.error(f"Error processing message: {str(e)}", exc_info=True)
-            return "I apologize, but I encountered an error. Could you please try again?"
+            # Roll the transition up into the funnel buckets
+            try:
+                if previous_stage is None:
+                    self.funnel.record(thread_id, None, "greeting", None, now)
+                    previous_stage = "greeting"
+                self.funnel.record(thread_id, previous_stage, next_stage, stage_entered_at, now)
+            except Exception as e:
+                logger.warning("Failed to record funnel metrics: %s", e)
+        
+        # Send notification if reaching booking stage
+        if next_stage == "booking" and previous_stage != "booking":
+            with PHASE_SECONDS.time(bot="SalesBotRedis", phase="notify"):
+                await self._send_notification(thread_id, next_stage, convo["context"], convo["history"])
+        
+        logger.info("Thread %s - Stage: %s", thread_id, next_stage,
+                    extra={"thread_id": thread_id, "stage": next_stage})
+        logger.debug("Context: %s", convo["context"])
+        PHASE_SECONDS.observe(time.perf_counter() - started, bot="SalesBotRedis", phase="total")
+        
+        return bot_message, convo
     
     def reset_conversation(self, thread_id: str = "default"):
         """Reset conversation for a given thread"""
         conv_key = self._get_conversation_key(thread_id)
-        self.redis_client.delete(conv_key)
-        logger.info(f"Conversation reset for thread: {thread_id}")
+        if self.conversation_cache:
+            self.conversation_cache.discard(thread_id)
+            pipe = self.redis_client.pipeline(transaction=False)
+            pipe.delete(conv_key)
+            self.conversation_cache.invalidate(pipe, thread_id)
+            pipe.execute()
+        else:
+            self.redis_client.delete(conv_key)
+        if self.archive:
+            self.archive.delete(thread_id)
+        logger.info("Conversation reset for thread: %s", thread_id)
     
     def get_conversation(self, thread_id: str) -> Optional[Dict[str, Any]]:
-        """Retrieve a conversation from Redis"""
+        """Retrieve a conversation from this worker's cache or Redis (treat as read-only)"""
+        if self.conversation_cache:
+            cached = self.conversation_cache.get(thread_id)
+            if cached is not None:
+                return cached
+        
         conv_key = self._get_conversation_key(thread_id)
         stored_data = self.redis_client.get(conv_key)
         
         if stored_data:
             return json.loads(stored_data)
-        return None
+        return self._from_archive(thread_id)
     
     def get_all_conversations(self) -> List[Dict[str, Any]]:
-        """Get all active conversations"""
+        """Get all active conversations (from a replica when configured)"""
+        return self.read_replicas.run(self._get_all_conversations)
+    
+    def _get_all_conversations(self, client) -> List[Dict[str, Any]]:
         conversations = []
-        for key in self.redis_client.scan_iter(match="conversation:*"):
-            data = self.redis_client.get(key)
+        for key in client.scan_iter(match="conversation:*"):
+            data = client.get(key)
             if data:
                 conv = json.loads(data)
                 thread_id = key.decode().split(":", 1)[1]
@@ -423,11 +607,27 @@ Be enthusiastic but professional.
         
         return sorted(conversations, key=lambda x: x.get("last_updated", ""), reverse=True)
     
+    def get_funnel_timeseries(self, granularity: str = "hourly", periods: int = 24) -> Dict[str, Any]:
+        """Get rolled-up funnel buckets without scanning conversations"""
+        return self.read_replicas.run(
+            lambda client: FunnelTracker(client, self.funnel.prefix).get_timeseries(granularity=granularity, periods=periods)
+        )
+    
+    def get_keyspace_memory(self, prefixes: Optional[List[str]] = None, budget: float = 0.5,
+                            max_samples: int = 1000, top: int = 10) -> Dict[str, Any]:
+        """Sample Redis memory per key prefix within a time budget (from a replica when configured)"""
+        return self.read_replicas.run(
+            lambda client: sample_keyspace(client, prefixes, budget=budget, max_samples=max_samples, top=top)
+        )
+    
     def get_all_leads(self) -> List[Dict[str, Any]]:
-        """Get all leads that reached booking stage"""
+        """Get all leads that reached booking stage (from a replica when configured)"""
+        return self.read_replicas.run(self._get_all_leads)
+    
+    def _get_all_leads(self, client) -> List[Dict[str, Any]]:
         leads = []
-        for key in self.redis_client.scan_iter(match="lead:*"):
-            data = self.redis_client.hgetall(key)
+        for key in client.scan_iter(match="lead:*"):
+            data = client.hgetall(key)
             if data:
                 lead_data = json.loads(data[b"data"].decode())
                 lead_data["status"] = data.get(b"status", b"unknown").decode()
@@ -436,16 +636,23 @@ Be enthusiastic but professional.
         return sorted(leads, key=lambda x: x.get("timestamp", ""), reverse=True)
     
     def export_lead_data(self, thread_id: str) -> Optional[Dict[str, Any]]:
-        """Export complete lead data for MVP building"""
-        # Get conversation
-        conversation = self.get_conversation(thread_id)
+        """Export complete lead data for MVP building (from a replica when configured)"""
+        return self.read_replicas.run(lambda client: self._export_lead_data(client, thread_id))
+    
+    def _export_lead_data(self, client, thread_id: str) -> Optional[Dict[str, Any]]:
+        # Get conversation and lead data in one round trip
+        pipe = client.pipeline(transaction=False)
+        pipe.get(self._get_conversation_key(thread_id))
+        pipe.hgetall(self._get_lead_key(thread_id))
+        stored_data, lead_info = pipe.execute()
+        conversation = json.loads(stored_data) if stored_data else self._from_archive(thread_id)
         if not conversation:
             return None
         
-        # Get lead data
-        lead_key = self._get_lead_key(thread_id)
-        lead_info = self.redis_client.hgetall(lead_key)
-        
+        return self._build_export(thread_id, conversation, lead_info)
+    
+    def _build_export(self, thread_id: str, conversation: Dict[str, Any], lead_info: Dict[bytes, bytes]) -> Dict[str, Any]:
+        """Combine a conversation and its raw lead hash into an export record"""
         if lead_info:
             lead_data = json.loads(lead_info[b"data"].decode())
         else:
@@ -467,4 +674,89 @@ Be enthusiastic but professional.
             }
         }
         
-        return export_data
\ No newline at end of file
+        return export_data
+    
+    def iter_exports(self, stage: Optional[str] = None, since: Optional[str] = None,
+                     until: Optional[str] = None, batch_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Stream export records for every conversation in constant memory
+        
+        Cursors through the keyspace with SCAN and reads each batch of
+        conversations and lead hashes in a single pipeline. `since`/`until`
+        are naive UTC isoformat() strings, the form of last_updated, so they
+        compare as text (the API normalizes offsets and dates to it).
+        Reads from a replica when configured.
+        """
+        return self.read_replicas.iterate(
+            lambda client: self._iter_exports(client, stage, since, until, batch_size)
+        )
+    
+    def _iter_exports(self, client, stage: Optional[str], since: Optional[str], until: Optional[str],
+                      batch_size: int) -> Iterator[Dict[str, Any]]:
+        cursor = 0
+        while True:
+            cursor, keys = client.scan(cursor=cursor, match="conversation:*", count=batch_size)
+            if keys:
+                thread_ids = [key.decode().split(":", 1)[1] for key in keys]
+                
+                pipe = client.pipeline(transaction=False)
+                for key, thread_id in zip(keys, thread_ids):
+                    pipe.get(key)
+                    pipe.hgetall(self._get_lead_key(thread_id))
+                results = pipe.execute()
+                
+                for i, thread_id in enumerate(thread_ids):
+                    data, lead_info = results[2 * i], results[2 * i + 1]
+                    if not data:
+                        # Expired between SCAN and GET
+                        continue
+                    
+                    conversation = json.loads(data)
+                    if self._export_matches(conversation, stage, since, until):
+                        yield self._build_export(thread_id, conversation, lead_info)
+            
+            if cursor == 0:
+                break
+        
+        if self.archive:
+            yield from self._iter_archived_exports(client, stage, since, until, batch_size)
+    
+    def _iter_archived_exports(self, client, stage: Optional[str], since: Optional[str], until: Optional[str],
+                               batch_size: int) -> Iterator[Dict[str, Any]]:
+        """Export records for archived conversations that are not back in Redis"""
+        batch = []
+        for record in self.archive.iter_records():
+            batch.append(record)
+            if len(batch) >= batch_size:
+                yield from self._archived_export_batch(client, batch, stage, since, until)
+                batch = []
+        if batch:
+            yield from self._archived_export_batch(client, batch, stage, since, until)
+    
+    def _archived_export_batch(self, client, batch: List[Tuple[str, bytes]], stage: Optional[str],
+                               since: Optional[str], until: Optional[str]) -> Iterator[Dict[str, Any]]:
+        pipe = client.pipeline(transaction=False)
+        for thread_id, _ in batch:
+            pipe.exists(self._get_conversation_key(thread_id))
+            pipe.hgetall(self._get_lead_key(thread_id))
+        results = pipe.execute()
+        
+        for i, (thread_id, data) in enumerate(batch):
+            in_redis, lead_info = results[2 * i], results[2 * i + 1]
+            if in_redis:
+                # Resumed, so already exported from Redis
+                continue
+            conversation = decompress(data)
+            if self._export_matches(conversation, stage, since, until):
+                yield self._build_export(thread_id, conversation, lead_info)
+    
+    @staticmethod
+    def _export_matches(conversation: Dict[str, Any], stage: Optional[str], since: Optional[str],
+                        until: Optional[str]) -> bool:
+        if stage and conversation["stage"] != stage:
+            return False
+        updated = conversation.get("last_updated") or conversation.get("created_at", "")
+        if since and updated < since:
+            return False
+        if until and updated > until:
+            return False
+        return True
@@ -4,15 +4,18 @@ Sales Bot Agent Logic - SIMPLE WORKING VERSION
 
 import os
 import json
+import time
+import asyncio
 import logging
-from typing import Dict, Any
+import weakref
+from typing import Dict, Any, Optional, List
 from datetime import datetime
 
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from .llm import create_llm_provider
+from .intent import load_intent_classifier, update_context, stage_after
+from .metrics import PHASE_SECONDS, observe_llm_reply
+from .tracing import start_span
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
@@ -21,16 +24,23 @@ class SalesBot:
     
     def __init__(self):
         """Initialize the sales bot"""
-        # Initialize Anthropic model
-        self.llm = ChatAnthropic(
-            model="claude-3-5-sonnet-20241022",
-            api_key=os.getenv("ANTHROPIC_API_KEY"),
-            temperature=0.7,
-            max_tokens=1000
-        )
-        
-        # Store conversations in memory (replace with Redis later)
+        # Initialize LLM provider (Anthropic, local mock or cassette replay)
+        self.llm = create_llm_provider()
+        
+        # Store conversations in memory, or in SQLite with STORAGE_BACKEND=sqlite
         self.conversations = {}
+        self.store = None
+        if os.getenv("STORAGE_BACKEND", "memory") == "sqlite":
+            from .sqlite_store import SQLiteConversationStore
+            
+            self.store = SQLiteConversationStore.from_env()
+        
+        # thread_id -> lock serializing that thread's turns; entries go away once no turn holds them
+        self._thread_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        
+        # Intent model for stage transitions and context extraction, loaded by warm()
+        # (None: keyword rules, until then or with STAGE_CLASSIFIER=keywords)
+        self.intents = None
         
         logger.info("Sales bot initialized successfully")
     
@@ -107,6 +117,9 @@ Be enthusiastic but professional.
     def _determine_next_stage(self, current_stage: str, user_message: str, context: Dict[str, Any]) -> str:
         """Determine what stage to move to based on conversation progress"""
         
+        if self.intents:
+            return stage_after(current_stage, self.intents.predict(user_message), context)
+        
         # Simple rule-based progression
         if current_stage == "greeting":
             # After greeting, move to understanding
@@ -166,6 +179,9 @@ Be enthusiastic but professional.
     def _extract_context_from_message(self, stage: str, user_message: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """Extract relevant information from user message to update context"""
         
+        if self.intents:
+            return update_context(stage, user_message, context, self.intents.predict(user_message))
+        
         # Simple extraction based on keywords (in production, use NLP)
         if stage == "understanding":
             # Look for business type keywords
@@ -189,65 +205,169 @@ Be enthusiastic but professional.
         
         return context
     
+    def _thread_lock(self, thread_id: str) -> asyncio.Lock:
+        lock = self._thread_locks.get(thread_id)
+        if lock is None:
+            lock = self._thread_locks[thread_id] = asyncio.Lock()
+        return lock
+    
     async def process_message(self, message: str, thread_id: str = "default") -> str:
         """Process a user message and return bot response"""
+        # A turn reads, extends and saves the whole conversation, so concurrent turns
+        # of one thread would drop each other's messages; run them one at a time
+        async with self._thread_lock(thread_id):
+            return await self._process_message(message, thread_id)
+    
+    async def _process_message(self, message: str, thread_id: str) -> str:
         try:
+            started = time.perf_counter()
+            
             # Get or create conversation state
-            if thread_id not in self.conversations:
-                self.conversations[thread_id] = {
+            if self.store:
+                with PHASE_SECONDS.time(bot="SalesBot", phase="store_read"):
+                    convo = await self.store.get_conversation(thread_id)
+            else:
+                convo = self.conversations.get(thread_id)
+            if convo is None:
+                convo = {
                     "stage": "greeting",
                     "context": {"message_count": 0},
-                    "history": []
+                    "history": [],
+                    "created_at": datetime.utcnow().isoformat()
                 }
+                if not self.store:
+                    self.conversations[thread_id] = convo
+            previous_stage = convo["stage"]
             
-            convo = self.conversations[thread_id]
-            
-            # Update context
-            convo["context"]["message_count"] += 1
-            convo["context"] = self._extract_context_from_message(
-                convo["stage"], 
-                message, 
-                convo["context"]
-            )
-            
-            # Determine if we should move to next stage
-            next_stage = self._determine_next_stage(convo["stage"], message, convo["context"])
-            
-            # Get system prompt for current stage
-            system_prompt = self._get_system_prompt(next_stage, convo["context"])
-            
-            # Build conversation history
-            messages = [SystemMessage(content=system_prompt)]
-            
-            # Add recent history (last 6 messages for context)
-            for msg in convo["history"][-6:]:
-                if msg["role"] == "user":
-                    messages.append(HumanMessage(content=msg["content"]))
-                else:
-                    messages.append(AIMessage(content=msg["content"]))
-            
-            # Add current message
-            messages.append(HumanMessage(content=message))
+            with PHASE_SECONDS.time(bot="SalesBot", phase="prompt_build"):
+                # Update context
+                convo["context"]["message_count"] += 1
+                convo["context"] = self._extract_context_from_message(
+                    convo["stage"], 
+                    message, 
+                    convo["context"]
+                )
+                
+                # Determine if we should move to next stage
+                next_stage = self._determine_next_stage(convo["stage"], message, convo["context"])
+                
+                # Get system prompt for current stage
+                system_prompt = self._get_system_prompt(next_stage, convo["context"])
             
-            # Get response from LLM
-            response = self.llm.invoke(messages)
-            bot_message = response.content
+            # Get response from LLM with recent history (last 6 messages for context)
+            with PHASE_SECONDS.time(bot="SalesBot", phase="llm"), start_span("llm.generate", stage=next_stage):
+                reply = await self.llm.agenerate(system_prompt, convo["history"][-6:], message, stage=next_stage)
+            observe_llm_reply(reply)
+            bot_message = reply.content
             
             # Update conversation state
             convo["stage"] = next_stage
             convo["history"].append({"role": "user", "content": message})
             convo["history"].append({"role": "assistant", "content": bot_message})
+            convo["last_updated"] = datetime.utcnow().isoformat()
+            
+            if self.store:
+                with PHASE_SECONDS.time(bot="SalesBot", phase="save"):
+                    await self.store.save_conversation(thread_id, convo)
+                    if next_stage == "booking" and previous_stage != "booking":
+                        await self.store.save_lead(thread_id, self._lead_data(thread_id, convo))
             
-            logger.info(f"Stage: {convo['stage']}, Context: {convo['context']}")
+            logger.info("Thread %s - Stage: %s", thread_id, next_stage,
+                        extra={"thread_id": thread_id, "stage": next_stage})
+            logger.debug("Context: %s", convo["context"])
+            PHASE_SECONDS.observe(time.perf_counter() - started, bot="SalesBot", phase="total")
             
             return bot_message
             
         except Exception as e:
-            logger.error(f"Error processing message: {str(e)}", exc_info=True)
+            logger.error("Error processing message: %s", e, exc_info=True)
             return "I apologize, but I encountered an error. Could you please try again?"
     
-    def reset_conversation(self, thread_id: str = "default"):
-        """Reset conversation for a given thread"""
-        if thread_id in self.conversations:
-            del self.conversations[thread_id]
-        logger.info(f"Conversation reset for thread: {thread_id}")
\ No newline at end of file
+    def _lead_data(self, thread_id: str, convo: Dict[str, Any]) -> Dict[str, Any]:
+        """Lead record saved when a conversation reaches booking"""
+        context = convo["context"]
+        return {
+            "thread_id": thread_id,
+            "timestamp": datetime.utcnow().isoformat(),
+            "stage_reached": convo["stage"],
+            "business_type": context.get("business_type", "unknown"),
+            "timeline": context.get("timeline", "not specified"),
+            "budget": context.get("budget", "not specified"),
+            "features": context.get("features", []),
+            "total_messages": len(convo["history"])
+        }
+    
+    async def get_conversation(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Retrieve a conversation"""
+        if self.store:
+            return await self.store.get_conversation(thread_id)
+        return self.conversations.get(thread_id)
+    
+    async def get_all_conversations(self, stage: Optional[str] = None, since: Optional[str] = None,
+                                    until: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Most recently updated conversations, optionally filtered by stage and update time
+
+        `since`/`until` are naive UTC isoformat() strings, the form of last_updated.
+        """
+        if self.store:
+            return await self.store.list_conversations(stage, since, until, limit)
+        
+        conversations = []
+        for thread_id, convo in self.conversations.items():
+            updated = convo.get("last_updated", "")
+            if (stage and convo["stage"] != stage) or (since and updated < since) or (until and updated > until):
+                continue
+            conversations.append(dict(convo, thread_id=thread_id))
+        conversations.sort(key=lambda c: c.get("last_updated", ""), reverse=True)
+        return conversations[:limit]
+    
+    async def get_all_leads(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Leads that reached the booking stage (persisted with STORAGE_BACKEND=sqlite only)"""
+        if self.store:
+            return await self.store.list_leads(limit)
+        return []
+    
+    async def export_lead_data(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        """Export complete lead data for MVP building"""
+        conversation = await self.get_conversation(thread_id)
+        if not conversation:
+            return None
+        lead_info = (await self.store.get_lead(thread_id) if self.store else None) or {}
+        
+        context = conversation["context"]
+        return {
+            "thread_id": thread_id,
+            "conversation": conversation,
+            "lead_info": lead_info,
+            "exported_at": datetime.utcnow().isoformat(),
+            "summary": {
+                "business_type": context.get("business_type", "unknown"),
+                "timeline": context.get("timeline", "not specified"),
+                "budget": context.get("budget", "not specified"),
+                "features": context.get("features", []),
+                "stage_reached": conversation["stage"],
+                "message_count": len(conversation["history"])
+            }
+        }
+    
+    async def warm(self):
+        """Import LLM client libraries and load the intent model, off the request path"""
+        async def load_intents():
+            self.intents = await load_intent_classifier()
+        
+        await asyncio.gather(self.llm.warm(), load_intents())
+    
+    async def aclose(self):
+        """Commit pending writes"""
+        if self.store:
+            await self.store.aclose()
+    
+    async def reset_conversation(self, thread_id: str = "default"):
+        """Reset conversation for a given thread; a following turn never sees the old one"""
+        # Wait for a turn in flight, or its save would bring the conversation back
+        async with self._thread_lock(thread_id):
+            if self.store:
+                await self.store.delete_conversation(thread_id)
+            elif thread_id in self.conversations:
+                del self.conversations[thread_id]
+        logger.info("Conversation reset for thread: %s", thread_id)
\ No newline at end of file
@@ -0,0 +1,273 @@
+"""Prometheus metrics - a small in-process registry with text exposition
+
+Recording a sample is a dict lookup plus a few additions under a lock;
+nothing is formatted until /metrics is scraped.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Tuple, List, Optional
+
+# Latency buckets (seconds) covering Redis round-trips up to slow LLM calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = list(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels: str):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Bucketed distribution of observed values per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # label key -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    @contextmanager
+    def time(self, **labels: str):
+        """Observe the duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels: str) -> int:
+        row = self._values.get(self._key(labels))
+        return int(sum(row[:-1])) if row else 0
+
+    def snapshot(self) -> Dict[Tuple[str, ...], Tuple[int, float]]:
+        """(count, sum) per label values tuple"""
+        with self._lock:
+            return {key: (int(sum(row[:-1])), row[-1]) for key, row in self._values.items()}
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            items = [(key, list(row)) for key, row in self._values.items()]
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), row[:-1]):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                labels = _format_labels(self.labelnames, key, f'le="{le}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Content type expected by Prometheus scrapers
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+PHASE_SECONDS = REGISTRY.register(Histogram(
+    "salesbot_phase_seconds",
+    "Time spent in each phase of processing a chat message",
+    ("bot", "phase")
+))
+LLM_TOKENS = REGISTRY.register(Counter(
+    "salesbot_llm_tokens_total",
+    "LLM tokens consumed, by direction (input/output)",
+    ("model", "direction")
+))
+REDIS_COMMANDS = REGISTRY.register(Counter(
+    "salesbot_redis_commands_total",
+    "Redis commands sent, including those inside pipelines",
+    ("command",)
+))
+REDIS_ERRORS = REGISTRY.register(Counter(
+    "salesbot_redis_errors_total",
+    "Redis commands or pipelines that raised",
+    ("command",)
+))
+NOTIFICATIONS = REGISTRY.register(Counter(
+    "salesbot_notifications_total",
+    "Lead notification deliveries by channel and outcome",
+    ("channel", "outcome")
+))
+LLM_RESILIENCE_EVENTS = REGISTRY.register(Counter(
+    "salesbot_llm_resilience_events_total",
+    "LLM hedges, fallbacks, canned replies and circuit breaker short-circuits",
+    ("event",)
+))
+LLM_BREAKER_STATE = REGISTRY.register(Gauge(
+    "salesbot_llm_breaker_state",
+    "LLM circuit breaker state (0 closed, 1 half-open, 2 open)",
+    ("breaker",)
+))
+LLM_BREAKER_TRANSITIONS = REGISTRY.register(Counter(
+    "salesbot_llm_breaker_transitions_total",
+    "LLM circuit breaker state changes",
+    ("breaker", "state")
+))
+ADMISSIONS = REGISTRY.register(Counter(
+    "salesbot_admissions_total",
+    "Chat admission decisions (admitted, limited_thread/ip/global, shed)",
+    ("outcome",)
+))
+GREETING_POOL_EVENTS = REGISTRY.register(Counter(
+    "salesbot_greeting_pool_total",
+    "Greeting pool hits, misses and generated replies",
+    ("event",)
+))
+JOBS = REGISTRY.register(Counter(
+    "salesbot_jobs_total",
+    "Async chat jobs enqueued, done and failed",
+    ("event",)
+))
+JOB_WAIT_SECONDS = REGISTRY.register(Histogram(
+    "salesbot_job_wait_seconds",
+    "Time async chat jobs spent queued before a worker started them"
+))
+JOB_QUEUE_DEPTH = REGISTRY.register(Gauge(
+    "salesbot_job_queue_depth",
+    "Async chat jobs waiting in the queue (sampled at scrape time)"
+))
+CONVERSATION_CACHE = REGISTRY.register(Counter(
+    "salesbot_conversation_cache_total",
+    "Per-worker conversation cache hits, misses, evictions and cross-worker invalidations",
+    ("event",)
+))
+REPLICA_READS = REGISTRY.register(Counter(
+    "salesbot_replica_reads_total",
+    "Admin reads served by a replica, the primary, or the primary after a replica failed",
+    ("target",)
+))
+REPLICA_LAG_SECONDS = REGISTRY.register(Gauge(
+    "salesbot_replica_lag_seconds",
+    "Replication lag per Redis replica, from the last heartbeat check",
+    ("replica",)
+))
+ARCHIVE_EVENTS = REGISTRY.register(Counter(
+    "salesbot_archive_total",
+    "Conversations archived, changed while archiving, and read back from the archive",
+    ("event",)
+))
+PG_DROPPED_ROWS = REGISTRY.register(Counter(
+    "salesbot_pg_dropped_rows_total",
+    "Buffered Postgres rows dropped because the write buffer was full while COPY kept failing",
+    ("table",)
+))
+KEYSPACE_BYTES = REGISTRY.register(Gauge(
+    "salesbot_keyspace_projected_bytes",
+    "Projected Redis memory per key prefix, from the last /stats/memory sample",
+    ("prefix",)
+))
+LLM_ROUTE_SECONDS = REGISTRY.register(Histogram(
+    "salesbot_llm_route_seconds",
+    "LLM call latency per routed stage and model",
+    ("stage", "model")
+))
+LLM_COST_USD = REGISTRY.register(Counter(
+    "salesbot_llm_cost_usd_total",
+    "Estimated LLM spend in USD per routed stage and model",
+    ("stage", "model")
+))
+
+
+def observe_llm_reply(reply):
+    """Count the tokens of an LLMReply"""
+    LLM_TOKENS.inc(reply.input_tokens, model=reply.model, direction="input")
+    LLM_TOKENS.inc(reply.output_tokens, model=reply.model, direction="output")
+
+
+def notification_outcome(response) -> str:
+    """Classify a webhook HTTP response"""
+    return "sent" if response.status_code < 400 else "http_error"
@@ -0,0 +1,228 @@
+"""Admission control - Redis token buckets and a global in-flight LLM cap
+
+Each /chat request takes a token from three buckets (per thread, per client
+IP and global) in one atomic Lua script, so limits hold across workers and
+a request is only charged when every bucket has room. Admitted requests then
+need one of LLM_MAX_INFLIGHT leases (a Redis sorted set of lease IDs, so a
+crashed worker's leases expire). Requests wait up to LLM_QUEUE_TIMEOUT for a
+lease and are then shed with 429 and Retry-After.
+
+If Redis is unavailable the limiter fails open and logs a warning.
+
+Configuration (per-minute rate and burst per bucket; 0 disables a bucket):
+    RATE_LIMIT=true|false
+    RATE_LIMIT_THREAD_PER_MINUTE=20   RATE_LIMIT_THREAD_BURST=5
+    RATE_LIMIT_IP_PER_MINUTE=60       RATE_LIMIT_IP_BURST=20
+    RATE_LIMIT_GLOBAL_PER_MINUTE=3000 RATE_LIMIT_GLOBAL_BURST=300
+    RATE_LIMIT_TRUST_PROXY=false      use the first X-Forwarded-For address as the client IP
+    LLM_MAX_INFLIGHT=64
+    LLM_QUEUE_TIMEOUT=2
+"""
+
+import os
+import math
+import uuid
+import asyncio
+import logging
+from dataclasses import dataclass
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, List, Tuple
+
+import redis
+
+from .metrics import ADMISSIONS
+
+logger = logging.getLogger(__name__)
+
+# KEYS: bucket keys. ARGV: rate (tokens/s), burst and cost per key.
+# Returns {index of the bucket that refused (0 = admitted), seconds until it has room}
+TOKEN_BUCKET_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local levels = {}
+local denied, wait = 0, 0
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local burst = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local level = tonumber(state[1]) or burst
+    local ts = tonumber(state[2]) or now
+    level = math.min(burst, level + math.max(0, now - ts) * rate)
+    levels[i] = level
+    if level < cost then
+        local needed = (math.min(cost, burst) - level) / rate
+        if needed >= wait then
+            denied, wait = i, needed
+        end
+    end
+end
+if denied > 0 then
+    return {denied, tostring(wait)}
+end
+for i, key in ipairs(KEYS) do
+    local rate = tonumber(ARGV[i * 3 - 2])
+    local burst = tonumber(ARGV[i * 3 - 1])
+    local cost = tonumber(ARGV[i * 3])
+    redis.call('HSET', key, 'tokens', levels[i] - cost, 'ts', now)
+    redis.call('EXPIRE', key, math.ceil(burst / rate) + 1)
+end
+return {0, '0'}
+"""
+
+# KEYS[1]: lease sorted set. ARGV: cap, lease id, lease ttl (s). Returns 1 if the lease was granted.
+ACQUIRE_LEASE_SCRIPT = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local ttl = tonumber(ARGV[3])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - ttl)
+if redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[1]) then
+    redis.call('ZADD', KEYS[1], now, ARGV[2])
+    redis.call('EXPIRE', KEYS[1], math.ceil(ttl))
+    return 1
+end
+return 0
+"""
+
+LEASE_TTL = 120
+LEASE_POLL_INTERVAL = 0.05
+
+
+class Overloaded(Exception):
+    """Request refused by a rate limit or the in-flight cap"""
+
+    def __init__(self, scope: str, retry_after: float):
+        super().__init__(f"Too many requests ({scope} limit)")
+        self.scope = scope
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+@dataclass(frozen=True)
+class BucketLimit:
+    """Token bucket refilled at `per_minute` tokens per minute, holding up to `burst`"""
+    per_minute: float
+    burst: int
+
+    @property
+    def enabled(self) -> bool:
+        return self.per_minute > 0 and self.burst > 0
+
+
+def _limit_from_env(scope: str, per_minute: float, burst: int) -> BucketLimit:
+    return BucketLimit(
+        float(os.getenv(f"RATE_LIMIT_{scope}_PER_MINUTE", per_minute)),
+        int(os.getenv(f"RATE_LIMIT_{scope}_BURST", burst))
+    )
+
+
+class AdmissionController:
+    """Distributed per-thread/per-IP/global rate limits plus a global LLM concurrency cap"""
+
+    def __init__(self, redis_client, thread_limit: BucketLimit, ip_limit: BucketLimit,
+                 global_limit: BucketLimit, max_inflight: int = 64, queue_timeout: float = 2.0,
+                 prefix: str = "ratelimit"):
+        self.redis = redis_client
+        self.limits = {"thread": thread_limit, "ip": ip_limit, "global": global_limit}
+        self.max_inflight = max_inflight
+        self.queue_timeout = queue_timeout
+        self.prefix = prefix
+        self._bucket_script = redis_client.register_script(TOKEN_BUCKET_SCRIPT)
+        self._lease_script = redis_client.register_script(ACQUIRE_LEASE_SCRIPT)
+
+    @classmethod
+    def from_env(cls, redis_client) -> Optional["AdmissionController"]:
+        if os.getenv("RATE_LIMIT", "true").lower() != "true":
+            return None
+        return cls(
+            redis_client,
+            thread_limit=_limit_from_env("THREAD", 20, 5),
+            ip_limit=_limit_from_env("IP", 60, 20),
+            global_limit=_limit_from_env("GLOBAL", 3000, 300),
+            max_inflight=int(os.getenv("LLM_MAX_INFLIGHT", 64)),
+            queue_timeout=float(os.getenv("LLM_QUEUE_TIMEOUT", 2))
+        )
+
+    def check(self, client_ip: Optional[str], thread_id: Optional[str] = None, cost: int = 1):
+        """Take `cost` tokens from every applicable bucket, or raise Overloaded"""
+        self.check_batch(client_ip, {thread_id: cost} if thread_id else {}, cost)
+
+    def check_batch(self, client_ip: Optional[str], thread_costs: Dict[str, int], cost: int):
+        """Take `cost` tokens from the global and IP buckets and each thread's share from its own
+
+        All buckets are checked in one step, so the batch is refused as a whole
+        if any thread's bucket lacks room.
+        """
+        scopes: List[Tuple[str, str, int]] = [("global", "global", cost)]
+        if client_ip:
+            scopes.append(("ip", f"ip:{client_ip}", cost))
+        for thread_id, thread_cost in thread_costs.items():
+            scopes.append(("thread", f"thread:{thread_id}", thread_cost))
+        scopes = [entry for entry in scopes if self.limits[entry[0]].enabled]
+        if not scopes:
+            return
+
+        keys, args = [], []
+        for scope, name, scope_cost in scopes:
+            limit = self.limits[scope]
+            keys.append(f"{self.prefix}:{name}")
+            args.extend([limit.per_minute / 60, limit.burst, scope_cost])
+
+        try:
+            denied, wait = self._bucket_script(keys=keys, args=args)
+        except redis.RedisError as e:
+            logger.warning("Rate limiter unavailable, admitting request: %s", e)
+            return
+
+        if denied:
+            scope = scopes[int(denied) - 1][0]
+            ADMISSIONS.inc(outcome=f"limited_{scope}")
+            raise Overloaded(scope, float(wait))
+        ADMISSIONS.inc(outcome="admitted")
+
+    def max_cost(self, scopes: Tuple[str, ...] = ("ip", "global")) -> Optional[int]:
+        """Largest cost a check of `scopes` can ever admit (the smallest enabled burst), or None"""
+        bursts = [self.limits[scope].burst for scope in scopes if self.limits[scope].enabled]
+        return min(bursts) if bursts else None
+
+    @asynccontextmanager
+    async def llm_slot(self):
+        """Hold one of the global in-flight LLM leases, waiting briefly before shedding"""
+        if self.max_inflight <= 0:
+            yield
+            return
+
+        key = f"{self.prefix}:inflight"
+        lease_id = uuid.uuid4().hex
+        loop = asyncio.get_running_loop()
+        give_up_at = loop.time() + self.queue_timeout
+        try:
+            while not self._lease_script(keys=[key], args=[self.max_inflight, lease_id, LEASE_TTL]):
+                if loop.time() >= give_up_at:
+                    ADMISSIONS.inc(outcome="shed")
+                    raise Overloaded("inflight", self.queue_timeout)
+                await asyncio.sleep(LEASE_POLL_INTERVAL)
+        except redis.RedisError as e:
+            logger.warning("In-flight limiter unavailable, admitting request: %s", e)
+            yield
+            return
+
+        try:
+            yield
+        finally:
+            try:
+                self.redis.zrem(key, lease_id)
+            except redis.RedisError as e:
+                logger.warning("Failed to release in-flight lease %s: %s", lease_id, e)
+
+
+def client_ip(request) -> Optional[str]:
+    """Client address, optionally taken from X-Forwarded-For behind a trusted proxy"""
+    if os.getenv("RATE_LIMIT_TRUST_PROXY", "false").lower() == "true":
+        forwarded = request.headers.get("X-Forwarded-For")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
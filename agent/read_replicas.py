@@ -0,0 +1,155 @@
+"""Read replicas - route dashboard and export queries away from the primary
+
+`/chat` does a read-modify-write of the conversation and must see its own
+writes, so it always uses the primary. Admin reads (conversation and lead
+listings, exports, funnel stats) can tolerate a little staleness. They go
+to a replica from REDIS_REPLICA_URLS whose measured lag is within
+REDIS_REPLICA_MAX_LAG seconds.
+
+Lag is measured with a heartbeat. At most every REDIS_REPLICA_CHECK_SECONDS,
+a timestamp is written to the primary and read back from each replica. A
+replica that errors, or lags too far behind, is skipped until the next check.
+A read that fails on a replica is retried on the primary.
+
+Configuration:
+    REDIS_REPLICA_URLS=redis://replica-1:6379/0,redis://replica-2:6379/0   (unset: primary only)
+    REDIS_REPLICA_MAX_LAG=5           seconds of staleness admin reads may see
+    REDIS_REPLICA_CHECK_SECONDS=2     how often replica lag is re-measured
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Iterator, List, Optional, TypeVar
+
+import redis
+
+from .metrics import REPLICA_READS, REPLICA_LAG_SECONDS
+from .redis_client import create_redis_client
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_KEY = "replication:heartbeat"
+
+T = TypeVar("T")
+
+
+class _Replica:
+    def __init__(self, name: str, client):
+        self.name = name
+        self.client = client
+        self.lag: Optional[float] = None
+        self.healthy = False
+
+
+class ReadReplicas:
+    """Chooses a fresh-enough replica for read-only queries, or the primary"""
+
+    def __init__(self, primary, replicas: Optional[List[Any]] = None, max_lag: float = 5.0,
+                 check_interval: float = 2.0):
+        self.primary = primary
+        self.replicas = [_Replica(f"replica-{i}", client) for i, client in enumerate(replicas or [])]
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._checked_at = float("-inf")
+        self._next = 0
+        # Exports run in the threadpool, so checks can be triggered from several threads
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, primary) -> "ReadReplicas":
+        urls = [url.strip() for url in os.getenv("REDIS_REPLICA_URLS", "").split(",") if url.strip()]
+        replicas = [
+            create_redis_client(url, max_connections=int(os.getenv("REDIS_MAX_CONNECTIONS", 50)),
+                                socket_timeout=2.0, socket_connect_timeout=1.0)
+            for url in urls
+        ]
+        if replicas:
+            logger.info("Routing admin reads to %d Redis replicas", len(replicas))
+        return cls(
+            primary,
+            replicas,
+            max_lag=float(os.getenv("REDIS_REPLICA_MAX_LAG", 5)),
+            check_interval=float(os.getenv("REDIS_REPLICA_CHECK_SECONDS", 2))
+        )
+
+    def check(self):
+        """Write a heartbeat to the primary and measure how far each replica is behind"""
+        now = time.time()
+        self.primary.set(HEARTBEAT_KEY, repr(now))
+        for replica in self.replicas:
+            try:
+                seen = replica.client.get(HEARTBEAT_KEY)
+                replica.lag = max(time.time() - float(seen), 0.0) if seen else None
+                replica.healthy = replica.lag is not None and replica.lag <= self.max_lag
+                if replica.lag is not None:
+                    REPLICA_LAG_SECONDS.set(replica.lag, replica=replica.name)
+            except (redis.RedisError, ValueError) as e:
+                logger.warning("Redis %s unavailable for reads: %s", replica.name, e)
+                replica.lag = None
+                replica.healthy = False
+
+    def _choose(self) -> Optional[_Replica]:
+        if not self.replicas:
+            return None
+        with self._lock:
+            if time.monotonic() - self._checked_at >= self.check_interval:
+                self._checked_at = time.monotonic()
+                try:
+                    self.check()
+                except redis.RedisError as e:
+                    logger.warning("Replica heartbeat failed on the primary: %s", e)
+            healthy = [replica for replica in self.replicas if replica.healthy]
+            if not healthy:
+                return None
+            self._next = (self._next + 1) % len(healthy)
+            return healthy[self._next]
+
+    def run(self, read: Callable[[Any], T]) -> T:
+        """Call read(client) on a replica, falling back to the primary"""
+        target = "primary"
+        replica = self._choose()
+        if replica is not None:
+            try:
+                result = read(replica.client)
+                REPLICA_READS.inc(target="replica")
+                return result
+            except redis.RedisError as e:
+                logger.warning("Read on Redis %s failed, retrying on the primary: %s", replica.name, e)
+                replica.healthy = False
+                target = "fallback"
+        result = read(self.primary)
+        REPLICA_READS.inc(target=target)
+        return result
+
+    def iterate(self, read: Callable[[Any], Iterator[T]]) -> Iterator[T]:
+        """Streaming variant of run()
+
+        SCAN cursors belong to one server, so a replica failure can only fall
+        back to the primary before the first item has been yielded.
+        """
+        target = "primary"
+        replica = self._choose()
+        if replica is not None:
+            items = read(replica.client)
+            try:
+                first = next(items)
+            except StopIteration:
+                REPLICA_READS.inc(target="replica")
+                return
+            except redis.RedisError as e:
+                logger.warning("Read on Redis %s failed, retrying on the primary: %s", replica.name, e)
+                replica.healthy = False
+                target = "fallback"
+            else:
+                REPLICA_READS.inc(target="replica")
+                yield first
+                yield from items
+                return
+        REPLICA_READS.inc(target=target)
+        yield from read(self.primary)
+
+    def close(self):
+        for replica in self.replicas:
+            replica.client.close()
@@ -0,0 +1,54 @@
+"""Liveness/readiness support - background warm-up of heavy dependencies
+
+Workers start serving /livez immediately; LLM client libraries are imported
+on a background task, and /readyz only reports ready once that finished
+(and the app's own checks pass), so the load balancer never routes a first
+request into a multi-second import.
+"""
+
+import time
+import asyncio
+import logging
+from typing import Dict, Any, Optional, Tuple, Awaitable
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Runs a warm-up coroutine in the background and reports its state"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.seconds: Optional[float] = None
+
+    def start(self, warm: Awaitable[Any]):
+        async def run():
+            started = time.perf_counter()
+            try:
+                await warm
+            except Exception as e:
+                logger.error("Warm-up failed: %s", e)
+                raise
+            self.seconds = round(time.perf_counter() - started, 3)
+            logger.info("Warm-up finished in %.3fs", self.seconds)
+
+        self._task = asyncio.get_running_loop().create_task(run())
+
+    @property
+    def status(self) -> str:
+        if self._task is None or not self._task.done():
+            return "pending"
+        if self._task.cancelled():
+            return "cancelled"
+        error = self._task.exception()
+        return f"error: {error}" if error else "ok"
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+def readiness(checks: Dict[str, str]) -> Tuple[int, Dict[str, Any]]:
+    """Status code and body for /readyz; every check must be 'ok'"""
+    ready = all(value == "ok" for value in checks.values())
+    return (200 if ready else 503), {"status": "ready" if ready else "not_ready", "checks": checks}
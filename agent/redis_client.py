@@ -0,0 +1,96 @@
+"""Redis client construction with per-command instrumentation"""
+
+import logging
+import inspect
+from functools import wraps
+
+import redis
+
+from .metrics import REDIS_COMMANDS, REDIS_ERRORS
+from .tracing import start_span
+
+logger = logging.getLogger(__name__)
+
+
+def _command_name(args) -> str:
+    return str(args[0]).upper() if args else "UNKNOWN"
+
+
+def instrument_redis(client):
+    """Count and trace every command sent by `client`, including pipelined ones
+
+    Works for both redis.Redis and redis.asyncio.Redis by wrapping the
+    instance's execute_command and the execute method of its pipelines.
+    """
+    execute_command = client.execute_command
+    create_pipeline = client.pipeline
+
+    if inspect.iscoroutinefunction(execute_command):
+        @wraps(execute_command)
+        async def instrumented_execute(*args, **options):
+            command = _command_name(args)
+            REDIS_COMMANDS.inc(command=command)
+            try:
+                with start_span(f"redis.{command}", **{"db.system": "redis"}):
+                    return await execute_command(*args, **options)
+            except Exception:
+                REDIS_ERRORS.inc(command=command)
+                raise
+    else:
+        @wraps(execute_command)
+        def instrumented_execute(*args, **options):
+            command = _command_name(args)
+            REDIS_COMMANDS.inc(command=command)
+            try:
+                with start_span(f"redis.{command}", **{"db.system": "redis"}):
+                    return execute_command(*args, **options)
+            except Exception:
+                REDIS_ERRORS.inc(command=command)
+                raise
+
+    @wraps(create_pipeline)
+    def instrumented_pipeline(*args, **kwargs):
+        pipe = create_pipeline(*args, **kwargs)
+        execute = pipe.execute
+
+        def count_stack():
+            for command_args, _ in pipe.command_stack:
+                REDIS_COMMANDS.inc(command=_command_name(command_args))
+
+        if inspect.iscoroutinefunction(execute):
+            async def instrumented_pipeline_execute(*a, **kw):
+                count_stack()
+                try:
+                    with start_span("redis.PIPELINE", **{"db.system": "redis", "db.commands": len(pipe.command_stack)}):
+                        return await execute(*a, **kw)
+                except Exception:
+                    REDIS_ERRORS.inc(command="PIPELINE")
+                    raise
+        else:
+            def instrumented_pipeline_execute(*a, **kw):
+                count_stack()
+                try:
+                    with start_span("redis.PIPELINE", **{"db.system": "redis", "db.commands": len(pipe.command_stack)}):
+                        return execute(*a, **kw)
+                except Exception:
+                    REDIS_ERRORS.inc(command="PIPELINE")
+                    raise
+
+        pipe.execute = instrumented_pipeline_execute
+        return pipe
+
+    client.execute_command = instrumented_execute
+    client.pipeline = instrumented_pipeline
+    return client
+
+
+def create_redis_client(url: str, **kwargs):
+    """Create an instrumented synchronous Redis client"""
+    return instrument_redis(redis.from_url(url, **kwargs))
+
+
+def create_async_redis_client(url: str, **kwargs):
+    """Create an instrumented redis.asyncio client"""
+    import redis.asyncio
+
+    return instrument_redis(redis.asyncio.from_url(url, **kwargs))
@@ -0,0 +1,230 @@
+"""LLM latency budgets - hedged requests, fallback model and circuit breaker
+
+Each stage has a latency budget. If the primary model has not answered
+within the budget, the same request is hedged to a faster fallback model and
+whichever answers first wins. If nothing answers by the hard deadline
+(budget * LLM_DEADLINE_FACTOR) both calls are cancelled and a canned,
+stage-appropriate reply is returned. A circuit breaker routes straight to the
+fallback while the primary provider is browning out.
+
+Configuration:
+    LLM_STAGE_BUDGETS=greeting=3,proposal=12   seconds before hedging, per stage
+    LLM_DEADLINE_FACTOR=2.5
+    LLM_BREAKER_FAILURES=5                     consecutive slow/failed calls that open the breaker
+    LLM_BREAKER_RECOVERY=30                    seconds before a half-open probe
+"""
+
+import os
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from .llm import LLMProvider, LLMReply
+from .metrics import LLM_RESILIENCE_EVENTS, LLM_BREAKER_STATE, LLM_BREAKER_TRANSITIONS
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait for the primary model before hedging
+DEFAULT_STAGE_BUDGETS = {
+    "greeting": 3.0,
+    "understanding": 4.0,
+    "identify_mvp": 8.0,
+    "scoping": 5.0,
+    "proposal": 12.0,
+    "booking": 4.0,
+}
+DEFAULT_BUDGET = 6.0
+
+CANNED_REPLIES = {
+    "greeting": "Hi! I'm excited to learn about your MVP idea. What kind of business are you running?",
+    "understanding": "Thanks for sharing! Could you tell me a bit more about your customers and the biggest challenge you're facing?",
+    "identify_mvp": "Based on what you've told me, a focused MVP that automates your most time-consuming workflow could be a great start. Does that sound like what you have in mind?",
+    "scoping": "Great! Which features would be must-haves for the first version, and do you have a timeline or budget in mind?",
+    "proposal": "Thanks, I have a good picture now. Let's go through a detailed proposal on a quick strategy call: https://calendly.com/example/strategy-call",
+    "booking": "I'd love to discuss this further! You can book a strategy call here: https://calendly.com/example/strategy-call",
+}
+DEFAULT_CANNED_REPLY = "Thanks for your message! Could you tell me a bit more about what you're looking to build?"
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker with a half-open probe"""
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+    _STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+    def __init__(self, name: str = "primary", failure_threshold: int = 5, recovery_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        # When the half-open probe was let through (None: no probe in flight)
+        self.probe_started_at: Optional[float] = None
+        LLM_BREAKER_STATE.set(0, breaker=name)
+
+    def _transition(self, state: str):
+        if state == self.state:
+            return
+        logger.warning("LLM circuit breaker %s: %s -> %s", self.name, self.state, state)
+        self.state = state
+        LLM_BREAKER_STATE.set(self._STATE_VALUES[state], breaker=self.name)
+        LLM_BREAKER_TRANSITIONS.inc(breaker=self.name, state=state)
+
+    def allow_request(self) -> bool:
+        """Whether the protected provider should be called"""
+        if self.state == self.CLOSED:
+            return True
+        now = time.monotonic()
+        if self.state == self.OPEN:
+            if now - self.opened_at < self.recovery_timeout:
+                return False
+            self._transition(self.HALF_OPEN)
+        # Half-open: let one probe through and reject everyone else until it reports back.
+        # A probe abandoned without an outcome (its caller was cancelled) stops counting
+        # after recovery_timeout, so the breaker cannot stay half-open forever
+        if self.probe_started_at is not None and now - self.probe_started_at < self.recovery_timeout:
+            return False
+        self.probe_started_at = now
+        return True
+
+    def record_success(self):
+        self.failures = 0
+        self.probe_started_at = None
+        self._transition(self.CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        self.probe_started_at = None
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._transition(self.OPEN)
+
+
+def parse_budgets(spec: str) -> Dict[str, float]:
+    """Parse 'stage=seconds,stage=seconds' overrides"""
+    budgets = dict(DEFAULT_STAGE_BUDGETS)
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        stage, _, seconds = item.partition("=")
+        budgets[stage.strip()] = float(seconds)
+    return budgets
+
+
+def canned_reply(stage: Optional[str]) -> LLMReply:
+    return LLMReply(content=CANNED_REPLIES.get(stage, DEFAULT_CANNED_REPLY), model="canned")
+
+
+def _discard(task: asyncio.Task):
+    """Cancel a losing call and make sure its outcome is never reported as unretrieved"""
+    task.cancel()
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+
+
+class ResilientProvider(LLMProvider):
+    """Wraps a primary provider with per-stage budgets, hedging and fallbacks"""
+
+    name = "resilient"
+
+    def __init__(self, primary: LLMProvider, fallback: Optional[LLMProvider] = None,
+                 budgets: Optional[Dict[str, float]] = None, deadline_factor: float = 2.5,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.primary = primary
+        self.fallback = fallback
+        self.budgets = budgets or dict(DEFAULT_STAGE_BUDGETS)
+        self.deadline_factor = deadline_factor
+        self.breaker = breaker or CircuitBreaker()
+
+    @classmethod
+    def from_env(cls, primary: LLMProvider, fallback: Optional[LLMProvider]) -> "ResilientProvider":
+        return cls(
+            primary,
+            fallback,
+            budgets=parse_budgets(os.getenv("LLM_STAGE_BUDGETS", "")),
+            deadline_factor=float(os.getenv("LLM_DEADLINE_FACTOR", 2.5)),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", 5)),
+                recovery_timeout=float(os.getenv("LLM_BREAKER_RECOVERY", 30))
+            )
+        )
+
+    async def warm(self):
+        await self.primary.warm()
+        if self.fallback is not None:
+            await self.fallback.warm()
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        budget = self.budgets.get(stage, DEFAULT_BUDGET)
+        deadline = budget * self.deadline_factor
+        args = (system_prompt, history, message)
+
+        if not self.breaker.allow_request():
+            LLM_RESILIENCE_EVENTS.inc(event="breaker_short_circuit")
+            return await self._fallback_only(args, stage, deadline)
+
+        primary = asyncio.create_task(self.primary.agenerate(*args, stage=stage))
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=budget)
+
+            if done:
+                try:
+                    reply = primary.result()
+                    self.breaker.record_success()
+                    return reply
+                except Exception as e:
+                    logger.warning("Primary LLM call failed: %s", e)
+                    self.breaker.record_failure()
+                    LLM_RESILIENCE_EVENTS.inc(event="primary_error")
+                    return await self._fallback_only(args, stage, deadline - budget)
+
+            # Over budget: hedge to the fallback and take whichever answers first
+            self.breaker.record_failure()
+            if self.fallback is not None:
+                LLM_RESILIENCE_EVENTS.inc(event="hedge")
+                tasks.append(asyncio.create_task(self.fallback.agenerate(*args, stage=stage)))
+
+            loop = asyncio.get_running_loop()
+            give_up_at = loop.time() + deadline - budget
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(give_up_at - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is primary:
+                            # Slow but healthy; undo the over-budget failure
+                            self.breaker.record_success()
+                        won_by = "primary" if task is primary else "fallback"
+                        LLM_RESILIENCE_EVENTS.inc(event=f"hedge_won_{won_by}")
+                        return task.result()
+                    logger.warning("Hedged LLM call failed: %s", task.exception())
+
+            LLM_RESILIENCE_EVENTS.inc(event="canned_timeout")
+            return canned_reply(stage)
+        finally:
+            # The losing call, calls past the deadline, and every call when the
+            # caller itself is cancelled (client gone, batch timeout) stop billing here
+            for task in tasks:
+                if not task.done():
+                    _discard(task)
+
+    async def _fallback_only(self, args, stage: Optional[str], timeout: float) -> LLMReply:
+        """Call only the fallback model, or answer with the canned reply"""
+        if self.fallback is None:
+            LLM_RESILIENCE_EVENTS.inc(event="canned_no_fallback")
+            return canned_reply(stage)
+
+        LLM_RESILIENCE_EVENTS.inc(event="fallback")
+        try:
+            return await asyncio.wait_for(self.fallback.agenerate(*args, stage=stage), timeout=max(timeout, 0.1))
+        except asyncio.TimeoutError:
+            LLM_RESILIENCE_EVENTS.inc(event="canned_timeout")
+        except Exception as e:
+            logger.warning("Fallback LLM call failed: %s", e)
+            LLM_RESILIENCE_EVENTS.inc(event="canned_error")
+        return canned_reply(stage)
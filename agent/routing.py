@@ -0,0 +1,177 @@
+"""Per-stage model routing - model, temperature and max_tokens per conversation stage
+
+Early, near-templated stages go to a fast model and the stages that need
+reasoning (identify_mvp, proposal) keep the large one. The table is read
+from a JSON file and reloaded when the file changes, so routes can be
+tuned without a restart:
+
+    {
+      "default": {"model": "claude-3-5-sonnet-20241022", "temperature": 0.7, "max_tokens": 1000},
+      "stages": {
+        "greeting": {"model": "claude-3-5-haiku-20241022", "max_tokens": 300}
+      },
+      "prices": {"claude-3-5-haiku-20241022": {"input": 0.8, "output": 4.0}}
+    }
+
+Stage entries only override the fields they set. Prices are USD per million
+tokens and feed the cost stats.
+
+Configuration:
+    LLM_ROUTES_FILE=llm_routes.json     (built-in table if the file does not exist)
+    LLM_ROUTES_RELOAD_SECONDS=5         how often the file's mtime is checked
+"""
+
+import os
+import json
+import time
+import logging
+from dataclasses import dataclass, replace
+from typing import Dict, Any, Optional, List, Callable, Tuple
+
+from .llm import LLMProvider, LLMReply, DEFAULT_MODEL, DEFAULT_FALLBACK_MODEL
+from .metrics import LLM_ROUTE_SECONDS, LLM_COST_USD
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Route:
+    """Model settings used for one conversation stage"""
+    model: str
+    temperature: float = 0.7
+    max_tokens: int = 1000
+
+
+DEFAULT_ROUTE = Route(DEFAULT_MODEL)
+
+DEFAULT_STAGE_ROUTES = {
+    "greeting": Route(DEFAULT_FALLBACK_MODEL, temperature=0.7, max_tokens=300),
+    "understanding": Route(DEFAULT_FALLBACK_MODEL, temperature=0.7, max_tokens=500),
+    "identify_mvp": Route(DEFAULT_MODEL, temperature=0.7, max_tokens=1000),
+    "scoping": Route(DEFAULT_MODEL, temperature=0.5, max_tokens=800),
+    "proposal": Route(DEFAULT_MODEL, temperature=0.5, max_tokens=1500),
+    "booking": Route(DEFAULT_FALLBACK_MODEL, temperature=0.3, max_tokens=300),
+}
+
+# USD per million (input, output) tokens
+DEFAULT_PRICES = {
+    "claude-3-5-sonnet-20241022": (3.0, 15.0),
+    "claude-3-5-haiku-20241022": (0.8, 4.0),
+}
+
+
+def _route_from_config(base: Route, config: Dict[str, Any]) -> Route:
+    return replace(
+        base,
+        model=str(config.get("model", base.model)),
+        temperature=float(config.get("temperature", base.temperature)),
+        max_tokens=int(config.get("max_tokens", base.max_tokens))
+    )
+
+
+class RoutingTable:
+    """Stage -> Route mapping backed by an optional, hot-reloaded JSON file"""
+
+    def __init__(self, path: Optional[str] = None, reload_interval: float = 5.0):
+        self.path = path
+        self.reload_interval = reload_interval
+        self.default = DEFAULT_ROUTE
+        self.stages: Dict[str, Route] = dict(DEFAULT_STAGE_ROUTES)
+        self.prices: Dict[str, Tuple[float, float]] = dict(DEFAULT_PRICES)
+        self._mtime: Optional[float] = None
+        self._checked_at = 0.0
+        self.maybe_reload(force=True)
+
+    def maybe_reload(self, force: bool = False):
+        """Re-read the file if it changed; a broken file keeps the current table"""
+        now = time.monotonic()
+        if not self.path or (not force and now - self._checked_at < self.reload_interval):
+            return
+        self._checked_at = now
+
+        try:
+            mtime = os.path.getmtime(self.path)
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+
+        try:
+            with open(self.path) as f:
+                self.load(json.load(f))
+            self._mtime = mtime
+            logger.info("Loaded LLM routing table from %s", self.path)
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            self._mtime = mtime
+            logger.error("Invalid LLM routing table %s, keeping previous routes: %s", self.path, e)
+
+    def load(self, config: Dict[str, Any]):
+        """Replace the table from a parsed config dict"""
+        default = _route_from_config(DEFAULT_ROUTE, config.get("default", {}))
+        stages = {
+            stage: _route_from_config(default, route)
+            for stage, route in config.get("stages", {}).items()
+        }
+        prices = dict(DEFAULT_PRICES)
+        for model, price in config.get("prices", {}).items():
+            prices[model] = (float(price["input"]), float(price["output"]))
+
+        # Swap everything at once so a half-parsed file never takes effect
+        self.default, self.stages, self.prices = default, stages, prices
+
+    def route_for(self, stage: Optional[str]) -> Route:
+        self.maybe_reload()
+        return self.stages.get(stage, self.default)
+
+    def cost(self, reply: LLMReply) -> float:
+        input_price, output_price = self.prices.get(reply.model, (0.0, 0.0))
+        return (reply.input_tokens * input_price + reply.output_tokens * output_price) / 1_000_000
+
+
+class RoutedProvider(LLMProvider):
+    """Sends each stage to the provider built for its route"""
+
+    name = "routed"
+
+    def __init__(self, table: RoutingTable, factory: Callable[[Route], LLMProvider]):
+        self.table = table
+        self.factory = factory
+        self._providers: Dict[Route, LLMProvider] = {}
+
+    def _provider(self, route: Route) -> LLMProvider:
+        provider = self._providers.get(route)
+        if provider is None:
+            provider = self._providers[route] = self.factory(route)
+        return provider
+
+    async def warm(self):
+        """Build and warm the provider for every configured route"""
+        for route in {self.table.default, *self.table.stages.values()}:
+            await self._provider(route).warm()
+
+    async def agenerate(self, system_prompt: str, history: List[Dict[str, str]], message: str,
+                        stage: Optional[str] = None) -> LLMReply:
+        route = self.table.route_for(stage)
+        labels = {"stage": stage or "default", "model": route.model}
+
+        start = time.perf_counter()
+        reply = await self._provider(route).agenerate(system_prompt, history, message, stage=stage)
+        LLM_ROUTE_SECONDS.observe(time.perf_counter() - start, **labels)
+        LLM_COST_USD.inc(self.table.cost(reply), **labels)
+        return reply
+
+
+def route_stats() -> List[Dict[str, Any]]:
+    """Calls, mean latency and estimated spend per stage and model since startup"""
+    stats = []
+    for (stage, model), (count, total) in sorted(LLM_ROUTE_SECONDS.snapshot().items()):
+        cost = LLM_COST_USD.value(stage=stage, model=model)
+        stats.append({
+            "stage": stage,
+            "model": model,
+            "calls": count,
+            "mean_seconds": round(total / count, 3) if count else None,
+            "cost_usd": round(cost, 6),
+            "mean_cost_usd": round(cost / count, 6) if count else None
+        })
+    return stats
@@ -0,0 +1,227 @@
+"""Embedded SQLite storage for SalesBot - single-node persistence without Redis
+
+Conversations and leads are stored as JSON, next to indexed thread_id,
+stage and last_updated columns, so listings and filters are index scans
+rather than keyspace scans. The database runs in WAL mode: readers never
+block the writer and the writer never blocks readers.
+
+All SQL runs off the event loop. Reads go through a small thread pool, with
+one connection per thread. Writes are queued and committed by a single
+writer thread in batches: writes that arrive within SQLITE_BATCH_MS of each
+other share a transaction and an fsync. Each caller is woken once its batch
+is committed. sqlite3 caches the prepared statement for each SQL string per
+connection, so the fixed statements below are compiled once per thread.
+
+Configuration:
+    STORAGE_BACKEND=memory|sqlite    (default memory: state is lost on restart)
+    SQLITE_PATH=data/salesbot.sqlite3
+    SQLITE_BATCH_MS=5                how long a write waits for others to share its commit
+"""
+
+import os
+import json
+import sqlite3
+import asyncio
+import logging
+import threading
+from itertools import groupby
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    thread_id TEXT PRIMARY KEY,
+    stage TEXT NOT NULL,
+    created_at TEXT,
+    last_updated TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_last_updated ON conversations (last_updated);
+CREATE INDEX IF NOT EXISTS idx_conversations_stage_last_updated ON conversations (stage, last_updated);
+
+CREATE TABLE IF NOT EXISTS leads (
+    thread_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    created_at TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leads_created_at ON leads (created_at);
+"""
+
+UPSERT_CONVERSATION = (
+    "INSERT INTO conversations (thread_id, stage, created_at, last_updated, data) VALUES (?, ?, ?, ?, ?) "
+    "ON CONFLICT(thread_id) DO UPDATE SET stage = excluded.stage, last_updated = excluded.last_updated, "
+    "data = excluded.data"
+)
+DELETE_CONVERSATION = "DELETE FROM conversations WHERE thread_id = ?"
+UPSERT_LEAD = (
+    "INSERT INTO leads (thread_id, status, created_at, data) VALUES (?, ?, ?, ?) "
+    "ON CONFLICT(thread_id) DO UPDATE SET status = excluded.status, data = excluded.data"
+)
+SELECT_CONVERSATION = "SELECT data FROM conversations WHERE thread_id = ?"
+SELECT_LEAD = "SELECT status, data FROM leads WHERE thread_id = ?"
+SELECT_LEADS = "SELECT status, data FROM leads ORDER BY created_at DESC LIMIT ?"
+
+
+class SQLiteConversationStore:
+    """Conversation and lead persistence in a WAL-mode SQLite file"""
+
+    def __init__(self, path: str, batch_window: float = 0.005, max_batch: int = 500, readers: int = 4):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._local = threading.local()
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sqlite-writer")
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="sqlite-reader")
+        self._pending: List[Tuple[str, tuple, Optional[asyncio.Future]]] = []
+        self._flush_task: Optional[asyncio.Task] = None
+
+        conn = self._connection()
+        conn.executescript(SCHEMA)
+        conn.commit()
+        logger.info("SQLite storage at %s", path)
+
+    @classmethod
+    def from_env(cls) -> "SQLiteConversationStore":
+        return cls(
+            os.getenv("SQLITE_PATH", "data/salesbot.sqlite3"),
+            batch_window=float(os.getenv("SQLITE_BATCH_MS", 5)) / 1000
+        )
+
+    def _connection(self):
+        """This thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10.0, cached_statements=64)
+            conn.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only risks the last commits on power loss, never corruption
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def _enqueue(self, sql: str, params: tuple, wait: bool) -> Optional[asyncio.Future]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future() if wait else None
+        self._pending.append((sql, params, future))
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = loop.create_task(self._flush())
+        return future
+
+    async def _flush(self):
+        await asyncio.sleep(self.batch_window)
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            try:
+                await loop.run_in_executor(self._writer, self._commit, [(sql, params) for sql, params, _ in batch])
+            except Exception as e:
+                logger.error("SQLite batch of %d writes failed: %s", len(batch), e)
+                for _, _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_exception(e)
+            else:
+                for _, _, future in batch:
+                    if future is not None and not future.done():
+                        future.set_result(None)
+
+    def _commit(self, ops: List[Tuple[str, tuple]]):
+        conn = self._connection()
+        with conn:
+            # Consecutive writes of the same statement go through one executemany
+            for sql, group in groupby(ops, key=lambda op: op[0]):
+                conn.executemany(sql, [params for _, params in group])
+
+    async def save_conversation(self, thread_id: str, conversation: Dict[str, Any]):
+        """Insert or replace a conversation; returns once it is committed"""
+        await self._enqueue(UPSERT_CONVERSATION, (
+            thread_id,
+            conversation["stage"],
+            conversation.get("created_at"),
+            conversation.get("last_updated") or conversation.get("created_at") or "",
+            json.dumps(conversation)
+        ), wait=True)
+
+    async def save_lead(self, thread_id: str, lead: Dict[str, Any], status: str = "hot_lead"):
+        await self._enqueue(UPSERT_LEAD, (thread_id, status, lead["timestamp"], json.dumps(lead)), wait=True)
+
+    async def delete_conversation(self, thread_id: str):
+        """Delete a conversation after any pending writes for it (leads are kept); returns once committed"""
+        await self._enqueue(DELETE_CONVERSATION, (thread_id,), wait=True)
+
+    # Reads
+
+    async def _read(self, fn, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._readers, fn, *args)
+
+    def _get_conversation(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(SELECT_CONVERSATION, (thread_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def get_conversation(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(self._get_conversation, thread_id)
+
+    def _list_conversations(self, stage: Optional[str], since: Optional[str], until: Optional[str],
+                            limit: int) -> List[Dict[str, Any]]:
+        # Served by idx_conversations_stage_last_updated / idx_conversations_last_updated
+        where, params = [], []
+        if stage:
+            where.append("stage = ?")
+            params.append(stage)
+        if since:
+            where.append("last_updated >= ?")
+            params.append(since)
+        if until:
+            where.append("last_updated <= ?")
+            params.append(until)
+        sql = "SELECT thread_id, data FROM conversations"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY last_updated DESC LIMIT ?"
+
+        conversations = []
+        for thread_id, data in self._connection().execute(sql, (*params, limit)):
+            conversation = json.loads(data)
+            conversation["thread_id"] = thread_id
+            conversations.append(conversation)
+        return conversations
+
+    async def list_conversations(self, stage: Optional[str] = None, since: Optional[str] = None,
+                                 until: Optional[str] = None, limit: int = 1000) -> List[Dict[str, Any]]:
+        """Most recently updated conversations first, optionally filtered by stage and update time"""
+        return await self._read(self._list_conversations, stage, since, until, limit)
+
+    def _list_leads(self, limit: int) -> List[Dict[str, Any]]:
+        leads = []
+        for status, data in self._connection().execute(SELECT_LEADS, (limit,)):
+            lead = json.loads(data)
+            lead["status"] = status
+            leads.append(lead)
+        return leads
+
+    async def list_leads(self, limit: int = 1000) -> List[Dict[str, Any]]:
+        return await self._read(self._list_leads, limit)
+
+    def _get_lead(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(SELECT_LEAD, (thread_id,)).fetchone()
+        if not row:
+            return None
+        lead = json.loads(row[1])
+        lead["status"] = row[0]
+        return lead
+
+    async def get_lead(self, thread_id: str) -> Optional[Dict[str, Any]]:
+        return await self._read(self._get_lead, thread_id)
+
+    async def aclose(self):
+        """Commit queued writes and shut the threads down"""
+        if self._flush_task is not None:
+            await self._flush_task
+        self._writer.shutdown(wait=True)
+        self._readers.shutdown(wait=True)
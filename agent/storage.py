@@ -1,10 +1,13 @@
 import os
 import json
 import logging
-from typing import Dict, Any
-from datetime import datetime
+from typing import Dict, Any, Optional, TYPE_CHECKING
+from datetime import datetime, timezone
 import httpx
-from supabase import create_client, Client
+
+# supabase pulls in a large dependency tree; only import it when storage is actually used
+if TYPE_CHECKING:
+    from supabase import Client
 
 logger = logging.getLogger(__name__)
 
@@ -12,13 +15,18 @@ class ConversationStorage:
     """Handle conversation storage and notifications"""
     
     def __init__(self):
+        from supabase import create_client
+        
         # Initialize Supabase client (or use PostgreSQL directly)
-        self.supabase: Client = create_client(
+        self.supabase: "Client" = create_client(
             os.getenv("SUPABASE_URL", ""),
             os.getenv("SUPABASE_KEY", "")
         )
         
-        # Webhook URLs for notifications
+        self._load_webhooks()
+    
+    def _load_webhooks(self):
+        """Webhook URLs for notifications"""
         self.slack_webhook = os.getenv("SLACK_WEBHOOK_URL")
         self.discord_webhook = os.getenv("DISCORD_WEBHOOK_URL")
         self.custom_webhook = os.getenv("CUSTOM_WEBHOOK_URL")
@@ -122,6 +130,26 @@ class ConversationStorage:
         except Exception as e:
             logger.error(f"Custom webhook error: {e}")
     
+    async def _create_hubspot_deal(self, lead_data: Dict[str, Any]):
+        """Create a deal for a qualified lead in HubSpot (HUBSPOT_API_KEY: private app token)"""
+        try:
+            async with httpx.AsyncClient() as client:
+                response = await client.post(
+                    "https://api.hubapi.com/crm/v3/objects/deals",
+                    headers={"Authorization": f"Bearer {os.getenv('HUBSPOT_API_KEY')}"},
+                    json={"properties": {
+                        "dealname": f"Sales Bot Lead {lead_data['thread_id']}",
+                        "pipeline": "default",
+                        "dealstage": "qualifiedtobuy",
+                        "description": (f"Business: {lead_data.get('business_type')}\n"
+                                        f"Timeline: {lead_data.get('timeline')}\n"
+                                        f"Budget: {lead_data.get('budget')}")
+                    }}
+                )
+                response.raise_for_status()
+        except Exception as e:
+            logger.error("HubSpot deal error: %s", e)
+    
     async def create_lead(self, thread_id: str, context: Dict[str, Any]):
         """Create a lead/opportunity in your CRM"""
         try:
@@ -157,3 +185,22 @@ class ConversationStorage:
         except Exception as e:
             logger.error(f"Error retrieving history: {e}")
             return []
+
+
+def timestamp_bound(name: str, value: Optional[str], end_of_day: bool = False) -> Optional[str]:
+    """Parse an ISO 8601 since/until bound into the naive UTC form of last_updated
+
+    Offsets, including Z, are converted to UTC; with end_of_day a date-only
+    bound covers the whole day. Raises ValueError naming the parameter when invalid.
+    """
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an ISO 8601 date or timestamp")
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    elif end_of_day and len(value) <= 10:
+        parsed = parsed.replace(hour=23, minute=59, second=59, microsecond=999999)
+    return parsed.isoformat()
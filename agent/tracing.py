@@ -0,0 +1,246 @@
+"""Request-scoped tracing - request IDs, nested spans and pluggable exporters
+
+Each HTTP request gets a request ID (from the X-Request-ID header or
+generated) stored in a contextvar, so it follows the request through every
+await. Sampling is decided once per request (head-based); unsampled requests
+only pay for a contextvar lookup per span.
+
+Configuration:
+    TRACE_EXPORTER=none|file|otlp   (default none)
+    TRACE_FILE=traces.jsonl         OTLP/JSON spans, one resourceSpans object per line
+    TRACE_OTLP_ENDPOINT=http://localhost:4318/v1/traces
+    TRACE_SAMPLE_RATIO=0.1
+"""
+
+import os
+import json
+import time
+import uuid
+import queue
+import random
+import logging
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Any, Optional, List
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "sales-bot")
+
+request_id_var: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+class Span:
+    """A timed operation within a trace"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.start_ns = time.time_ns()
+        self.end_ns = 0
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Serialize in the OTLP/JSON span shape"""
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}} for key, value in self.attributes.items()
+            ],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class SpanExporter:
+    """Receives batches of finished spans on a background thread"""
+
+    def export(self, spans: List[Span]):
+        raise NotImplementedError
+
+    def shutdown(self):
+        pass
+
+
+def _otlp_payload(spans: List[Span]) -> Dict[str, Any]:
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "agent.tracing"}, "spans": [s.to_otlp() for s in spans]}],
+        }]
+    }
+
+
+class FileSpanExporter(SpanExporter):
+    """Appends OTLP/JSON payloads to a local file, one line per batch"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def export(self, spans: List[Span]):
+        with open(self.path, "a") as f:
+            f.write(json.dumps(_otlp_payload(spans)) + "\n")
+
+
+class OTLPHttpSpanExporter(SpanExporter):
+    """Posts OTLP/JSON payloads to a collector's /v1/traces endpoint"""
+
+    def __init__(self, endpoint: str):
+        import httpx
+
+        self.endpoint = endpoint
+        self.client = httpx.Client(timeout=5.0)
+
+    def export(self, spans: List[Span]):
+        self.client.post(self.endpoint, json=_otlp_payload(spans))
+
+    def shutdown(self):
+        self.client.close()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporter off the event loop"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_ratio: float = 1.0,
+                 batch_size: int = 256, flush_interval: float = 2.0):
+        self.exporter = exporter
+        self.sample_ratio = sample_ratio
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=10000)
+        self._worker: Optional[threading.Thread] = None
+        if exporter:
+            self._worker = threading.Thread(target=self._run, name="span-exporter", daemon=True)
+            self._worker.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def should_sample(self) -> bool:
+        return self.enabled and random.random() < self.sample_ratio
+
+    @contextmanager
+    def start_span(self, name: str, root: bool = False, **attributes: Any):
+        """Open a child of the current span; with root=True, start a new (sampled) trace"""
+        parent = _current_span.get()
+        if parent is None and not (root and self.should_sample()):
+            yield None
+            return
+
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        span = Span(name, trace_id, parent.span_id if parent else None, attributes)
+        request_id = request_id_var.get()
+        if request_id and not parent:
+            span.attributes["request_id"] = request_id
+
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                pass
+
+    def _run(self):
+        batch: List[Span] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                span = self._queue.get(timeout=max(deadline - time.monotonic(), 0.01))
+                if span is None:
+                    break
+                batch.append(span)
+            except queue.Empty:
+                pass
+
+            if batch and (len(batch) >= self.batch_size or time.monotonic() >= deadline):
+                self._export(batch)
+                batch = []
+            if time.monotonic() >= deadline:
+                deadline = time.monotonic() + self.flush_interval
+
+        if batch:
+            self._export(batch)
+
+    def _export(self, batch: List[Span]):
+        try:
+            self.exporter.export(batch)
+        except Exception as e:
+            logger.warning("Span export failed: %s", e)
+
+    def shutdown(self):
+        """Flush pending spans and stop the exporter thread"""
+        if self._worker:
+            self._queue.put(None)
+            self._worker.join(timeout=5.0)
+            self.exporter.shutdown()
+
+
+def _tracer_from_env() -> Tracer:
+    kind = os.getenv("TRACE_EXPORTER", "none")
+    exporter: Optional[SpanExporter] = None
+    if kind == "file":
+        exporter = FileSpanExporter(os.getenv("TRACE_FILE", "traces.jsonl"))
+    elif kind == "otlp":
+        exporter = OTLPHttpSpanExporter(os.getenv("TRACE_OTLP_ENDPOINT", "http://localhost:4318/v1/traces"))
+    elif kind != "none":
+        logger.warning("Unknown TRACE_EXPORTER %s, tracing disabled", kind)
+    return Tracer(exporter, sample_ratio=float(os.getenv("TRACE_SAMPLE_RATIO", 0.1)))
+
+
+TRACER = _tracer_from_env()
+start_span = TRACER.start_span
+
+
+def new_request_id() -> str:
+    return uuid.uuid4().hex
+
+
+async def tracing_middleware(request, call_next):
+    """FastAPI HTTP middleware: request ID, root span and X-Request-ID response header"""
+    request_id = request.headers.get(REQUEST_ID_HEADER) or new_request_id()
+    token = request_id_var.set(request_id)
+    try:
+        with start_span(f"{request.method} {request.url.path}", root=True,
+                        **{"http.method": request.method, "http.target": request.url.path}) as span:
+            response = await call_next(request)
+            if span is not None:
+                span.set_attribute("http.status_code", response.status_code)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+    finally:
+        request_id_var.reset(token)
+
+
+class RequestIdFilter(logging.Filter):
+    """Adds the current request ID (or '-') to every log record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get() or "-"
+        return True
+
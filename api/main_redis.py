@@ -1,19 +1,78 @@
 """FastAPI server with Redis persistence"""
 
 import os
+import io
+import csv
+import json
 import asyncio
+import logging
+import contextlib
 from datetime import datetime
-from typing import Optional
-from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from typing import Optional, List, Dict, Any
+from fastapi import FastAPI, Request, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
-import uvloop
+from pydantic import BaseModel
+import redis
 
 # Import the Redis-enhanced bot
-from agent.logic_redis import SalesBotRedis
+from agent.logic_redis import SalesBotRedis, ERROR_REPLY
+from agent.idempotency import IdempotencyCache, IdempotencyConflict, IdempotencyTimeout, request_fingerprint
+from agent.rate_limit import AdmissionController, Overloaded, client_ip
+from agent.jobs import JobQueue
+from agent.metrics import REGISTRY, CONTENT_TYPE, JOB_QUEUE_DEPTH
+from agent.routing import route_stats
+from agent.readiness import Warmup, readiness
+from agent.storage import timestamp_bound
+from agent.tracing import TRACER, tracing_middleware
+from agent.logging_config import setup_logging, shutdown_logging
+
+# Structured, non-blocking logging
+setup_logging()
+logger = logging.getLogger(__name__)
+
+# Per-worker resources, created in lifespan so each worker process gets its own
+# bot, Redis connection pool and HTTP client
+bot: Optional[SalesBotRedis] = None
+idempotency: Optional[IdempotencyCache] = None
+jobs: Optional[JobQueue] = None
+admission: Optional[AdmissionController] = None
+warmup = Warmup()
+
+# How long shutdown waits for in-flight turns, refills and notifications
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", 30))
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Build per-worker resources on startup; drain and release them on shutdown"""
+    global bot, idempotency, jobs, admission
+    bot = SalesBotRedis()
+    await bot.start()
+    
+    # Results of /chat requests sent with an Idempotency-Key, shared across workers through Redis
+    idempotency = IdempotencyCache.from_env(bot.redis_client)
+    
+    # Turns queued by /chat?mode=async, processed by `python -m agent.jobs` workers
+    jobs = JobQueue(bot.redis_client, ttl=int(os.getenv("JOB_TTL", 3600)))
+    
+    # Per-thread/IP/global rate limits and the global in-flight LLM cap (None when RATE_LIMIT=false)
+    admission = AdmissionController.from_env(bot.redis_client)
+    
+    # Import LLM client libraries and load the intent model in the background; /readyz waits for it
+    warmup.start(bot.warm())
+    
+    logger.info("Worker %d started", os.getpid())
+    yield
+    
+    logger.info("Worker %d draining", os.getpid())
+    warmup.cancel()
+    await bot.aclose(DRAIN_TIMEOUT)
+    TRACER.shutdown()
+    shutdown_logging()
 
 # Initialize FastAPI app
-app = FastAPI(title="Sales Bot API with Redis")
+app = FastAPI(title="Sales Bot API with Redis", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -22,10 +81,28 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Idempotent-Replayed", "Retry-After", "Location"],
 )
 
-# Initialize the bot
-bot = SalesBotRedis()
+# Request IDs and tracing spans
+app.middleware("http")(tracing_middleware)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+JOB_LONG_POLL_MAX = 30
+
+# Batch chat limits; a batch costs one rate-limit token per item, so keep the
+# item cap within RATE_LIMIT_IP_BURST
+CHAT_BATCH_MAX_ITEMS = int(os.getenv("CHAT_BATCH_MAX_ITEMS", 20))
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))
+
+
+class BatchChatItem(BaseModel):
+    message: str
+    thread_id: str = "default"
+
+
+class BatchChatRequest(BaseModel):
+    items: List[BatchChatItem]
 
 @app.get("/")
 async def root():
@@ -33,11 +110,21 @@ async def root():
         "message": "Sales Bot API with Redis is running!",
         "endpoints": [
             "/health",
+            "/metrics",
             "/chat",
+            "/chat/batch",
             "/reset/{thread_id}",
             "/conversations",
             "/leads",
-            "/export/{thread_id}"
+            "/export/all",
+            "/export/{thread_id}",
+            "/stats/timeseries",
+            "/stats/routes",
+            "/stats/memory",
+            "/jobs/{job_id}",
+            "/jobs/stats",
+            "/livez",
+            "/readyz"
         ]
     }
 
@@ -49,6 +136,28 @@ async def health_check():
         "features": ["redis", "notifications", "lead-tracking"]
     }
 
+@app.get("/livez")
+async def livez():
+    """Liveness: the worker's event loop is responsive"""
+    return {"status": "alive"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: bot built, LLM libraries warmed and Redis reachable"""
+    checks = {"bot": "ok" if bot else "pending", "llm": warmup.status}
+    try:
+        checks["redis"] = "ok" if bot and bot.redis_client.ping() else "pending"
+    except Exception as e:
+        checks["redis"] = f"error: {e}"
+    status_code, body = readiness(checks)
+    return JSONResponse(status_code=status_code, content=body)
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    JOB_QUEUE_DEPTH.set(bot.redis_client.llen(jobs.queue_key))
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
 @app.post("/chat")
 async def chat(request: Request):
     try:
@@ -59,22 +168,157 @@ async def chat(request: Request):
         if not message:
             raise HTTPException(status_code=400, detail="Message is required")
         
-        # Process message
-        response = await bot.process_message(message, thread_id)
+        # mode=async queues the turn for the job workers and answers 202 with a job ID
+        queued = request.query_params.get("mode") == "async"
+        turn = _enqueue_turn if queued else _chat_turn
+        
+        # Retries carrying the same Idempotency-Key (or message_id) never re-run the turn,
+        # and joining or replaying an earlier request is not charged against the rate limits
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER) or data.get("message_id")
+        if idempotency_key:
+            idempotency_key = f"{thread_id}:{idempotency_key}"
+        if admission and not (idempotency_key and idempotency.seen(idempotency_key)):
+            admission.check(client_ip(request), thread_id)
         
-        # Get current conversation state
-        conversation = bot.get_conversation(thread_id)
+        headers = None
+        try:
+            if idempotency_key:
+                content, replayed = await idempotency.run(
+                    idempotency_key,
+                    request_fingerprint(thread_id, message, "async" if queued else "sync"),
+                    lambda: turn(message, thread_id)
+                )
+                headers = {"Idempotent-Replayed": "true" if replayed else "false"}
+            else:
+                content = await turn(message, thread_id)
+        except IdempotencyConflict as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except IdempotencyTimeout as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        except Overloaded:
+            raise
+        except Exception as e:
+            # Failed turns are not stored, so a retry with the same key runs again
+            logger.error("Error processing message: %s", e, exc_info=True)
+            if queued:
+                raise HTTPException(status_code=503, detail="Could not queue the message, please retry")
+            content = _chat_error(thread_id)
         
-        return JSONResponse(content={
-            "response": response,
-            "thread_id": thread_id,
-            "stage": conversation["stage"] if conversation else "greeting",
-            "context": conversation["context"] if conversation else {}
-        })
+        if queued:
+            return JSONResponse(status_code=202, content=content, headers={**(headers or {}), "Location": content["poll"]})
+        return JSONResponse(content=content, headers=headers)
         
+    except Overloaded as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _chat_turn(message: str, thread_id: str) -> Dict[str, Any]:
+    """Process one message and build the /chat response"""
+    async with _llm_slot():
+        response, conversation = await bot.process_turn(message, thread_id)
+    return {
+        "response": response,
+        "thread_id": thread_id,
+        "stage": conversation["stage"],
+        "context": conversation["context"]
+    }
+
+async def _enqueue_turn(message: str, thread_id: str) -> Dict[str, Any]:
+    """Queue one message for the job workers and build the 202 response"""
+    job_id = jobs.enqueue(thread_id, message)
+    return {"job_id": job_id, "status": "queued", "thread_id": thread_id, "poll": f"/jobs/{job_id}"}
+
+def _llm_slot():
+    """In-flight LLM lease, or a no-op when admission control is disabled"""
+    return admission.llm_slot() if admission else contextlib.nullcontext()
+
+def _chat_error(thread_id: str) -> Dict[str, Any]:
+    """/chat response when processing failed; the conversation is left unchanged"""
+    conversation = bot.get_conversation(thread_id)
+    return {
+        "response": ERROR_REPLY,
+        "thread_id": thread_id,
+        "stage": conversation["stage"] if conversation else "greeting",
+        "context": conversation["context"] if conversation else {}
+    }
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, http_request: Request):
+    """Process many (thread_id, message) pairs concurrently
+    
+    Items for the same thread run in submission order; different threads run
+    in parallel, bounded by CHAT_BATCH_CONCURRENCY. Each item gets its own
+    result or error.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="At least one item is required")
+    # Group items by thread, keeping submission order within each thread
+    threads: Dict[str, List[int]] = {}
+    for index, item in enumerate(request.items):
+        threads.setdefault(item.thread_id, []).append(index)
+    
+    # Batches larger than the rate-limit burst could never be admitted, so reject them up front
+    max_items = CHAT_BATCH_MAX_ITEMS
+    if admission and admission.max_cost() is not None:
+        max_items = min(max_items, admission.max_cost())
+    if len(request.items) > max_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_items} items per batch")
+    max_thread_items = admission.max_cost(("thread",)) if admission else None
+    if max_thread_items is not None and max(len(indexes) for indexes in threads.values()) > max_thread_items:
+        raise HTTPException(status_code=413, detail=f"At most {max_thread_items} items per thread in a batch")
+    
+    if admission:
+        try:
+            # Each item is charged to its own thread as well, as if sent to /chat
+            thread_costs = {thread_id: len(indexes) for thread_id, indexes in threads.items()}
+            admission.check_batch(client_ip(http_request), thread_costs, cost=len(request.items))
+        except Overloaded as e:
+            raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": e.retry_after_header})
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(request.items)
+    semaphore = asyncio.Semaphore(CHAT_BATCH_CONCURRENCY)
+    
+    async def run_thread(indexes: List[int]):
+        for index in indexes:
+            item = request.items[index]
+            result = {"index": index, "thread_id": item.thread_id}
+            if not item.message:
+                result["error"] = "Message is required"
+            else:
+                async with semaphore:
+                    try:
+                        async with _llm_slot():
+                            response, conversation = await bot.process_turn(item.message, item.thread_id)
+                        result.update(response=response, stage=conversation["stage"])
+                    except Exception as e:
+                        result["error"] = str(e)
+            results[index] = result
+    
+    await asyncio.gather(*(run_thread(indexes) for indexes in threads.values()))
+    
+    return JSONResponse(content={
+        "total": len(results),
+        "errors": sum(1 for r in results if "error" in r),
+        "results": results
+    })
+
+@app.get("/jobs/stats")
+async def get_job_stats():
+    """Get async job queue depth, oldest queued job age and mean queue wait"""
+    return jobs.stats()
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, wait: float = 0):
+    """Get an async chat job; with wait=N, long-poll up to N seconds for it to finish"""
+    job = await jobs.wait(job_id, min(max(wait, 0), JOB_LONG_POLL_MAX))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return JSONResponse(content=job)
+
 @app.post("/reset/{thread_id}")
 async def reset_conversation(thread_id: str):
     """Reset a specific conversation"""
@@ -99,6 +343,102 @@ async def get_all_leads():
         "leads": leads
     }
 
+@app.get("/stats/timeseries")
+async def get_funnel_timeseries(granularity: str = "hourly", periods: int = 24):
+    """Get hourly/daily funnel transitions, unique threads and time-in-stage histograms"""
+    if granularity not in ("hourly", "daily"):
+        raise HTTPException(status_code=400, detail="granularity must be 'hourly' or 'daily'")
+    if not 1 <= periods <= 24 * 90:
+        raise HTTPException(status_code=400, detail="periods must be between 1 and 2160")
+    
+    return JSONResponse(content=bot.get_funnel_timeseries(granularity, periods))
+
+@app.get("/stats/routes")
+async def get_route_stats():
+    """Get LLM calls, mean latency and estimated cost per stage route"""
+    return {"routes": route_stats()}
+
+@app.get("/stats/memory")
+async def get_keyspace_memory(budget_ms: int = 500, samples: int = 1000, top: int = 10,
+                              prefix: Optional[List[str]] = Query(None)):
+    """Sample Redis memory per key prefix: size and TTL distributions, largest keys, projected totals"""
+    if not 1 <= budget_ms <= 10000:
+        raise HTTPException(status_code=400, detail="budget_ms must be between 1 and 10000")
+    if not 1 <= samples <= 100000:
+        raise HTTPException(status_code=400, detail="samples must be between 1 and 100000")
+    if not 1 <= top <= 100:
+        raise HTTPException(status_code=400, detail="top must be between 1 and 100")
+    
+    # Runs for up to budget_ms of small SCAN/MEMORY USAGE steps, so keep it off the event loop
+    try:
+        report = await asyncio.to_thread(
+            bot.get_keyspace_memory, prefix, budget=budget_ms / 1000, max_samples=samples, top=top
+        )
+    except redis.ResponseError as e:
+        raise HTTPException(status_code=501, detail=f"MEMORY USAGE is not available on this Redis: {e}")
+    return JSONResponse(content=report)
+
+EXPORT_CSV_COLUMNS = [
+    "thread_id", "stage_reached", "message_count", "created_at", "last_updated",
+    "business_type", "timeline", "budget", "features", "lead_status"
+]
+
+def _export_csv_row(record: dict) -> list:
+    """Flatten an export record into a CSV row"""
+    conversation = record["conversation"]
+    summary = record["summary"]
+    return [
+        record["thread_id"],
+        summary["stage_reached"],
+        summary["message_count"],
+        conversation.get("created_at", ""),
+        conversation.get("last_updated", ""),
+        summary["business_type"],
+        summary["timeline"],
+        summary["budget"],
+        json.dumps(summary["features"]),
+        "hot_lead" if record["lead_info"] else ""
+    ]
+
+def _stream_csv(records):
+    """Encode export records as CSV, one chunk per row"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_CSV_COLUMNS)
+    for record in records:
+        writer.writerow(_export_csv_row(record))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _stream_ndjson(records):
+    """Encode export records as newline-delimited JSON"""
+    for record in records:
+        yield json.dumps(record) + "\n"
+
+@app.get("/export/all")
+async def export_all(format: str = "ndjson", stage: Optional[str] = None,
+                     since: Optional[str] = None, until: Optional[str] = None):
+    """Stream every conversation and lead as NDJSON or CSV"""
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="format must be 'ndjson' or 'csv'")
+    try:
+        since = timestamp_bound("since", since)
+        until = timestamp_bound("until", until, end_of_day=True)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    
+    records = bot.iter_exports(stage=stage, since=since, until=until)
+    if format == "csv":
+        return StreamingResponse(
+            _stream_csv(records),
+            media_type="text/csv",
+            headers={"Content-Disposition": "attachment; filename=export.csv"}
+        )
+    return StreamingResponse(_stream_ndjson(records), media_type="application/x-ndjson")
+
 @app.get("/export/{thread_id}")
 async def export_lead_data(thread_id: str):
     """Export complete lead data for MVP building"""
@@ -117,7 +457,34 @@ async def get_conversation(thread_id: str):
     
     return JSONResponse(content=conversation)
 
+def available_cpus() -> int:
+    """CPUs this process may use, honouring affinity and a cgroup v2 CPU quota"""
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, int(quota) // int(period)))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port, loop="uvloop")
\ No newline at end of file
+    # One worker by default: metrics live in each worker's process, so /metrics is only
+    # complete with one. WEB_CONCURRENCY=auto runs one event loop per CPU, or set a count
+    concurrency = os.getenv("WEB_CONCURRENCY", "1")
+    workers = available_cpus() if concurrency == "auto" else max(int(concurrency), 1)
+    uvicorn.run(
+        "api.main_redis:app",
+        host="0.0.0.0",
+        port=port,
+        loop="uvloop",
+        workers=workers,
+        timeout_graceful_shutdown=int(DRAIN_TIMEOUT)
+    )
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""Micro-benchmarks for the per-message hot path of every bot
+
+Covers prompt building, stage/context heuristics, summaries, conversation
+(de)serialization and the full process_message (mock LLM, in-memory Redis)
+for SalesBot, SalesBotRedis and EnhancedSalesBot, over synthetic
+conversations of 10, 100 and 1,000 turns.
+
+Usage:
+    pip install -r requirements_dev.txt
+    python -m benchmarks.bench_hot_path --output bench.json
+    python -m benchmarks.bench_hot_path --baseline bench.json --threshold 0.2
+"""
+
+import os
+import sys
+import copy
+import json
+import asyncio
+import argparse
+import logging
+from unittest import mock
+from typing import Dict, Any, List
+
+import fakeredis
+import fakeredis.aioredis
+
+from benchmarks.harness import measure, measure_async, print_results, write_results, compare_to_baseline
+from test_redis_bot import TEST_MESSAGES
+
+TURN_COUNTS = [10, 100, 1000]
+STAGES = ["greeting", "understanding", "identify_mvp", "scoping", "proposal", "booking"]
+SCOPING_MESSAGE = "Timeline is 4-6 weeks, budget around $5,000"
+
+
+def synthetic_conversation(turns: int, thread_id: str = "bench") -> Dict[str, Any]:
+    """A conversation with `turns` user/assistant exchanges, parked in the scoping stage"""
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": TEST_MESSAGES[i % len(TEST_MESSAGES)]})
+        history.append({"role": "assistant", "content": f"Assistant reply number {i} with a follow-up question?"})
+
+    return {
+        "thread_id": thread_id,
+        "stage": "scoping",
+        "context": {
+            "message_count": turns,
+            "thread_id": thread_id,
+            "business_type": "e-commerce",
+            "features": [TEST_MESSAGES[4]] * (turns // 5),
+        },
+        "history": history,
+        "created_at": "2024-01-01T00:00:00",
+        "last_updated": "2024-01-01T01:00:00",
+        "lead_info": {},
+    }
+
+
+def build_bots(server: fakeredis.FakeServer) -> Dict[str, Any]:
+    """Instantiate each bot against the mock LLM and an in-memory Redis"""
+    os.environ["LLM_PROVIDER"] = "mock"
+    os.environ["MOCK_LLM_LATENCY_MS"] = "0"
+    os.environ["MOCK_LLM_TOKENS_PER_SEC"] = "0"
+    for var in ("WEBHOOK_URL", "SLACK_WEBHOOK_URL", "NOTIFICATION_WEBHOOK", "SLACK_WEBHOOK"):
+        os.environ.pop(var, None)
+
+    import redis
+    import redis.asyncio
+    from agent.logic_simple import SalesBot
+    from agent.logic_redis import SalesBotRedis
+    from agent.logic_enhanced import EnhancedSalesBot
+
+    with mock.patch.object(redis, "from_url", lambda *a, **k: fakeredis.FakeRedis(server=server)):
+        redis_bot = SalesBotRedis()
+    with mock.patch.object(redis.asyncio, "from_url",
+                           lambda *a, **k: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)):
+        enhanced_bot = EnhancedSalesBot()
+
+    return {"SalesBot": SalesBot(), "SalesBotRedis": redis_bot, "EnhancedSalesBot": enhanced_bot}
+
+
+def bench_heuristics(name: str, bot, turns: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    """Prompt building, stage determination, context extraction and summaries"""
+    results = {}
+    conversation = synthetic_conversation(turns)
+    context = conversation["context"]
+
+    results[f"{name}._get_system_prompt[{turns}]"] = measure(
+        lambda: [bot._get_system_prompt(stage, context) for stage in STAGES], iterations
+    )
+
+    # Both heuristics mutate the context, so hand each call a fresh copy
+    contexts: List[Dict[str, Any]] = []
+    refill = lambda: contexts.append(copy.deepcopy(context))
+    results[f"{name}._determine_next_stage[{turns}]"] = measure(
+        lambda: [bot._determine_next_stage(stage, SCOPING_MESSAGE, contexts[-1]) for stage in STAGES],
+        iterations, setup=refill
+    )
+    results[f"{name}._extract_context_from_message[{turns}]"] = measure(
+        lambda: [bot._extract_context_from_message(stage, SCOPING_MESSAGE, contexts[-1]) for stage in STAGES],
+        iterations, setup=refill
+    )
+
+    if name == "SalesBotRedis":
+        results[f"{name}._summarize_conversation[{turns}]"] = measure(
+            lambda: bot._summarize_conversation(conversation["history"]), iterations
+        )
+    elif name == "EnhancedSalesBot":
+        results[f"{name}._summarize_conversation[{turns}]"] = measure(
+            lambda: bot._summarize_conversation(conversation), iterations
+        )
+    return results
+
+
+def bench_serialization(turns: int, iterations: int) -> Dict[str, Dict[str, float]]:
+    conversation = synthetic_conversation(turns)
+    blob = json.dumps(conversation)
+    return {
+        f"conversation.json_dumps[{turns}]": measure(lambda: json.dumps(conversation), iterations),
+        f"conversation.json_loads[{turns}]": measure(lambda: json.loads(blob), iterations),
+    }
+
+
+async def bench_process_message(name: str, bot, server: fakeredis.FakeServer, turns: int,
+                                iterations: int) -> Dict[str, Dict[str, float]]:
+    """Full process_message on a conversation preloaded with `turns` exchanges"""
+    thread_id = f"bench-{name}-{turns}"
+    conversation = synthetic_conversation(turns, thread_id)
+    blob = json.dumps(conversation)
+    sync_redis = fakeredis.FakeRedis(server=server)
+
+    def reset():
+        if name == "SalesBot":
+            bot.conversations[thread_id] = json.loads(blob)
+        else:
+            sync_redis.set(f"conversation:{thread_id}", blob)
+
+    return {
+        f"{name}.process_message[{turns}]": await measure_async(
+            lambda: bot.process_message(SCOPING_MESSAGE, thread_id), iterations, setup=reset
+        )
+    }
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    server = fakeredis.FakeServer()
+    bots = build_bots(server)
+    results: Dict[str, Dict[str, float]] = {}
+
+    for turns in args.turns:
+        # Keep the total runtime reasonable on the 1,000-turn conversations
+        iterations = max(args.iterations // (turns // 10), 20)
+        results.update(bench_serialization(turns, iterations))
+        for name, bot in bots.items():
+            results.update(bench_heuristics(name, bot, turns, iterations))
+            results.update(await bench_process_message(name, bot, server, turns, max(iterations // 5, 20)))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the per-message hot path")
+    parser.add_argument("--iterations", type=int, default=2000, help="Iterations at 10 turns (scaled down for longer conversations)")
+    parser.add_argument("--turns", type=int, nargs="+", default=TURN_COUNTS)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    # The bots log every message at INFO; keep that out of the measurements
+    logging.disable(logging.INFO)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.output:
+        write_results(args.output, "hot_path", results)
+
+    if args.baseline:
+        regressions = compare_to_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
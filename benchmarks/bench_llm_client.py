@@ -0,0 +1,106 @@
+"""Per-call client overhead: LangChain ChatAnthropic vs the anthropic SDK directly
+
+Both providers talk to an in-process httpx MockTransport that answers every
+request with the same canned message, so the numbers are pure client-side
+cost: message conversion, payload building, request serialization and
+response parsing, over histories of 0, 10 and 100 turns.
+
+Usage:
+    pip install -r requirements_dev.txt
+    python -m benchmarks.bench_llm_client --output llm_client.json
+    python -m benchmarks.bench_llm_client --baseline llm_client.json --threshold 0.2
+"""
+
+import sys
+import json
+import asyncio
+import argparse
+import logging
+from typing import Dict, List
+
+import httpx
+from anthropic import AsyncAnthropic
+
+from agent.llm import AnthropicProvider, AnthropicSDKProvider
+from benchmarks.harness import measure_async, print_results, write_results, compare_to_baseline
+
+HISTORY_TURNS = [0, 10, 100]
+SYSTEM_PROMPT = "You are a friendly sales assistant helping founders scope an MVP. " * 20
+MESSAGE = "Timeline is 4-6 weeks, budget around $5,000"
+
+CANNED_RESPONSE = json.dumps({
+    "id": "msg_bench",
+    "type": "message",
+    "role": "assistant",
+    "model": "claude-3-5-sonnet-20241022",
+    "content": [{"type": "text", "text": "Great. Which features would be must-haves for the first version?"}],
+    "stop_reason": "end_turn",
+    "stop_sequence": None,
+    "usage": {"input_tokens": 812, "output_tokens": 16},
+}).encode()
+
+
+def _respond(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, content=CANNED_RESPONSE, headers={"content-type": "application/json"})
+
+
+def mock_client() -> AsyncAnthropic:
+    return AsyncAnthropic(api_key="bench", http_client=httpx.AsyncClient(transport=httpx.MockTransport(_respond)))
+
+
+def history(turns: int) -> List[Dict[str, str]]:
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"User message number {i} about the product idea"})
+        messages.append({"role": "assistant", "content": f"Assistant reply number {i} with a follow-up question?"})
+    return messages
+
+
+async def run(args) -> Dict[str, Dict[str, float]]:
+    langchain = AnthropicProvider()
+    langchain.llm._async_client = mock_client()
+    providers = {
+        "langchain": langchain,
+        "sdk": AnthropicSDKProvider(client=mock_client()),
+    }
+
+    results = {}
+    for turns in args.turns:
+        prior = history(turns)
+        for name, provider in providers.items():
+            results[f"agenerate/{name}/{turns}_turns"] = await measure_async(
+                lambda: provider.agenerate(SYSTEM_PROMPT, prior, MESSAGE), iterations=args.iterations
+            )
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark per-call LLM client overhead")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--turns", type=int, nargs="+", default=HISTORY_TURNS)
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    # The SDK and httpx log every request at INFO/DEBUG; keep that out of the measurements
+    logging.disable(logging.INFO)
+
+    results = asyncio.run(run(args))
+    print_results(results)
+
+    if args.output:
+        write_results(args.output, "llm_client", results)
+
+    if args.baseline:
+        regressions = compare_to_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
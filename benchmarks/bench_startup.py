@@ -0,0 +1,171 @@
+"""Cold-start benchmark for both API apps
+
+Measures, in fresh interpreters:
+  - import time of `main` and `api.main_redis`
+  - time from spawning a single uvicorn worker to its first successful /chat
+  - time from spawning to /readyz reporting ready (LLM libraries warmed)
+
+The servers use the mock LLM; the Redis app runs against fakeredis, so no
+services are needed. Samples are wall-clock, reported in the harness's
+microsecond columns.
+
+Usage:
+    pip install -r requirements_dev.txt
+    python -m benchmarks.bench_startup --runs 5 --output startup.json
+    python -m benchmarks.bench_startup --baseline startup.json --threshold 0.2
+"""
+
+import os
+import sys
+import time
+import socket
+import argparse
+import subprocess
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.harness import _summarize, print_results, write_results, compare_to_baseline
+
+APPS = {
+    "main": "main:app",
+    "main_redis": "api.main_redis:app",
+}
+
+IMPORT_SNIPPET = """
+import time
+start = time.perf_counter_ns()
+import {module}
+print(time.perf_counter_ns() - start)
+"""
+
+# Patches redis.from_url with one shared fakeredis before the app is imported
+SERVE_SNIPPET = """
+import sys
+import uvicorn
+if {fake_redis}:
+    import fakeredis, redis
+    server = fakeredis.FakeRedis()
+    redis.from_url = lambda *args, **kwargs: server
+uvicorn.run("{target}", host="127.0.0.1", port={port}, log_level="warning")
+"""
+
+BENCH_ENV = {
+    "LLM_PROVIDER": "mock",
+    "MOCK_LLM_LATENCY_MS": "0",
+    "MOCK_LLM_TOKENS_PER_SEC": "0",
+    "RATE_LIMIT": "false",
+    "GREETING_POOL": "false",
+    "LOG_LEVEL": "WARNING",
+}
+
+
+def _env() -> Dict[str, str]:
+    env = dict(os.environ)
+    env.update(BENCH_ENV)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [os.getcwd(), env.get("PYTHONPATH")]))
+    return env
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def import_time(module: str) -> int:
+    """Nanoseconds to import `module` in a fresh interpreter"""
+    out = subprocess.run(
+        [sys.executable, "-c", IMPORT_SNIPPET.format(module=module)],
+        env=_env(), capture_output=True, text=True, check=True
+    )
+    return int(out.stdout.strip().splitlines()[-1])
+
+
+def _wait_for(client: httpx.Client, method: str, path: str, proc: subprocess.Popen, timeout: float,
+              **kwargs) -> Optional[int]:
+    """Poll until `path` returns 200; nanoseconds since the first attempt started, None on timeout"""
+    start = time.perf_counter_ns()
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with code {proc.returncode}")
+        try:
+            if client.request(method, path, **kwargs).status_code == 200:
+                return time.perf_counter_ns() - start
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None
+
+
+def cold_start(name: str, timeout: float) -> Dict[str, int]:
+    """Spawn one server and time its first successful /chat and its readiness"""
+    port = _free_port()
+    snippet = SERVE_SNIPPET.format(fake_redis=name == "main_redis", target=APPS[name], port=port)
+    spawned = time.perf_counter_ns()
+    proc = subprocess.Popen([sys.executable, "-c", snippet], env=_env(),
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=timeout) as client:
+            payload = {"message": "Hi, I have an idea for an app", "thread_id": f"bench-{time.time_ns()}"}
+            if _wait_for(client, "POST", "/chat", proc, timeout, json=payload) is None:
+                raise RuntimeError(f"{name}: no successful /chat within {timeout}s")
+            first_chat = time.perf_counter_ns() - spawned
+            if _wait_for(client, "GET", "/readyz", proc, timeout) is None:
+                raise RuntimeError(f"{name}: not ready within {timeout}s")
+            ready = time.perf_counter_ns() - spawned
+        return {"first_chat": first_chat, "ready": ready}
+    except RuntimeError:
+        proc.kill()
+        sys.stderr.write(proc.stderr.read().decode(errors="replace")[-2000:])
+        raise
+    finally:
+        if proc.poll() is None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+
+def run(args) -> Dict[str, Dict[str, float]]:
+    results = {}
+    for name in args.apps:
+        module = APPS[name].split(":")[0]
+        results[f"import/{name}"] = _summarize([import_time(module) for _ in range(args.runs)])
+
+        samples: Dict[str, List[int]] = {"first_chat": [], "ready": []}
+        for _ in range(args.runs):
+            for key, value in cold_start(name, args.timeout).items():
+                samples[key].append(value)
+        for key, values in samples.items():
+            results[f"{key}/{name}"] = _summarize(values)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark import time and time to first /chat")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh processes per measurement")
+    parser.add_argument("--apps", nargs="+", choices=sorted(APPS), default=sorted(APPS))
+    parser.add_argument("--timeout", type=float, default=60.0, help="Seconds to wait for a server")
+    parser.add_argument("--output", help="Write results as JSON")
+    parser.add_argument("--baseline", help="Compare against a previous results file")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p50 slowdown before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = run(args)
+    print_results(results)
+
+    if args.output:
+        write_results(args.output, "startup", results)
+
+    if args.baseline:
+        regressions = compare_to_baseline(args.baseline, results, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""Evaluate the stage intent classifier against the keyword heuristics
+
+Each labelled message is run through SalesBot's _extract_context_from_message
+and _determine_next_stage at the message's stage, once with the keyword
+rules (STAGE_CLASSIFIER=keywords) and once with a classifier trained on the
+other folds. Both are scored on the decisions the bot acts on:
+
+- advance        whether the stage moves on (identify_mvp/proposal: agreement;
+                 scoping: both timeline and budget given)
+- timeline, budget, features   what is written into the context in scoping
+- business_type  e-commerce / SaaS / none in understanding
+
+A premature advance costs LLM turns spent on the wrong stage; a stalled one
+costs extra turns asking again. Per-message latency of both paths and batch
+scoring throughput are reported as well.
+
+Usage:
+    python -m benchmarks.eval_intent                         # bundled seed set
+    python -m benchmarks.eval_intent labelled.jsonl --folds 5 --output eval.json
+"""
+
+import os
+import random
+import argparse
+import logging
+from typing import Dict, Any, List
+
+from benchmarks.harness import measure, print_results, write_results
+from agent.intent import SEED_PATH, load_records
+from agent.intent_model import IntentClassifier
+
+# Stages whose advance decision depends on the message (the others only count messages)
+DECISION_STAGES = ("identify_mvp", "scoping", "proposal")
+
+
+def gold_decisions(record: Dict[str, Any]) -> Dict[str, Any]:
+    labels = set(record["labels"])
+    if record["stage"] == "scoping":
+        advance = "timeline" in labels and "budget" in labels
+    else:
+        advance = "affirm" in labels and "decline" not in labels
+    business_type = "e-commerce" if "ecommerce" in labels else "SaaS" if "saas" in labels else None
+    return {
+        "advance": advance,
+        "timeline": "timeline" in labels,
+        "budget": "budget" in labels,
+        "features": "features" in labels,
+        "business_type": business_type,
+    }
+
+
+def bot_decisions(bot, record: Dict[str, Any]) -> Dict[str, Any]:
+    """What the bot does with this message as the first one seen in its stage"""
+    stage, text = record["stage"], record["text"]
+    context = bot._extract_context_from_message(stage, text, {"message_count": 1})
+    next_stage = bot._determine_next_stage(stage, text, context)
+    return {
+        "advance": next_stage != stage,
+        "timeline": bool(context.get("timeline")),
+        "budget": bool(context.get("budget")),
+        "features": bool(context.get("features")),
+        "business_type": context.get("business_type"),
+    }
+
+
+def score(pairs: List[tuple], name: str, stages) -> Dict[str, Any]:
+    """Accuracy, and for booleans precision/recall plus false advances (premature) and misses (stalled)"""
+    rows = [(gold[name], predicted[name]) for record, gold, predicted in pairs if record["stage"] in stages]
+    if not rows:
+        return {}
+    result = {"n": len(rows), "accuracy": round(sum(g == p for g, p in rows) / len(rows), 3)}
+    if isinstance(rows[0][0], bool):
+        true_positive = sum(g and p for g, p in rows)
+        predicted, actual = sum(p for _, p in rows), sum(g for g, _ in rows)
+        result["precision"] = round(true_positive / predicted, 3) if predicted else None
+        result["recall"] = round(true_positive / actual, 3) if actual else None
+        result["false_positives"] = predicted - true_positive
+        result["false_negatives"] = actual - true_positive
+    return result
+
+
+def report(pairs: List[tuple]) -> Dict[str, Dict[str, Any]]:
+    return {
+        "advance": score(pairs, "advance", DECISION_STAGES),
+        "timeline": score(pairs, "timeline", ("scoping",)),
+        "budget": score(pairs, "budget", ("scoping",)),
+        "features": score(pairs, "features", ("scoping",)),
+        "business_type": score(pairs, "business_type", ("understanding",)),
+    }
+
+
+def cross_validate(bot, records: List[Dict[str, Any]], folds: int) -> Dict[str, List[tuple]]:
+    """(record, gold, predicted) triples for the keyword rules and for held-out model predictions"""
+    order = list(range(len(records)))
+    random.Random(0).shuffle(order)
+
+    keywords, model = [], []
+    bot.intents = None
+    for record in records:
+        if record.get("stage"):
+            keywords.append((record, gold_decisions(record), bot_decisions(bot, record)))
+
+    for fold in range(folds):
+        held_out = {i for position, i in enumerate(order) if position % folds == fold}
+        train = [records[i] for i in order if i not in held_out]
+        bot.intents = IntentClassifier.train([r["text"] for r in train], [r["labels"] for r in train])
+        for i in sorted(held_out):
+            record = records[i]
+            if record.get("stage"):
+                model.append((record, gold_decisions(record), bot_decisions(bot, record)))
+    return {"keywords": keywords, "model": model}
+
+
+def print_comparison(results: Dict[str, Dict[str, Dict[str, Any]]]):
+    print(f"{'decision':<16} {'rules':<10} {'n':>5} {'accuracy':>9} {'precision':>10} {'recall':>8} "
+          f"{'false +':>8} {'false -':>8}")
+    for decision in results["keywords"]:
+        for rules in ("keywords", "model"):
+            row = results[rules][decision]
+            if not row:
+                continue
+            print(f"{decision:<16} {rules:<10} {row['n']:>5} {row['accuracy']:>9} {str(row.get('precision', '')):>10} "
+                  f"{str(row.get('recall', '')):>8} {str(row.get('false_positives', '')):>8} "
+                  f"{str(row.get('false_negatives', '')):>8}")
+
+
+def bench_latency(bot, records: List[Dict[str, Any]], iterations: int) -> Dict[str, Dict[str, float]]:
+    staged = [record for record in records if record.get("stage")]
+    texts = [record["text"] for record in records]
+    classifier = IntentClassifier.train(texts, [record["labels"] for record in records])
+    position = [0]
+
+    def next_record():
+        position[0] = (position[0] + 1) % len(staged)
+        return staged[position[0]]
+
+    def next_text():
+        # Distinct strings so the one-message cache in predict() is not hit
+        return next_record()["text"] + " "
+
+    results = {}
+    bot.intents = None
+    results["keywords.decide_per_message"] = measure(lambda: bot_decisions(bot, next_record()), iterations)
+    bot.intents = classifier
+    results["model.decide_per_message"] = measure(lambda: bot_decisions(bot, next_record()), iterations)
+    results["model.predict"] = measure(lambda: classifier.predict(next_text()), iterations)
+
+    batch = (texts * (1000 // len(texts) + 1))[:1000]
+    row = measure(lambda: classifier.predict_batch(batch), max(iterations // 100, 10), warmup=2)
+    results["model.predict_batch[1000]_per_message"] = {
+        key: (round(value / len(batch), 3) if key.endswith("_us") else value) for key, value in row.items()
+    }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the intent classifier with the keyword heuristics")
+    parser.add_argument("paths", nargs="*", help="Labelled JSONL files (default: the bundled seed set)")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--output", help="Write accuracy and latency results as JSON")
+    args = parser.parse_args(argv)
+
+    os.environ["LLM_PROVIDER"] = "mock"
+    os.environ["STAGE_CLASSIFIER"] = "keywords"
+    logging.disable(logging.INFO)
+    from agent.logic_simple import SalesBot
+
+    bot = SalesBot()
+    records = load_records(args.paths or [SEED_PATH])
+    pairs = cross_validate(bot, records, args.folds)
+    accuracy = {rules: report(rows) for rules, rows in pairs.items()}
+    print(f"{len(records)} labelled messages, {args.folds}-fold cross-validation\n")
+    print_comparison(accuracy)
+
+    print()
+    latency = bench_latency(bot, records, args.iterations)
+    print_results(latency)
+
+    if args.output:
+        write_results(args.output, "intent", {**latency, **{
+            f"{rules}.{decision}": row for rules, rows in accuracy.items() for decision, row in rows.items()
+        }})
+
+
+if __name__ == "__main__":
+    main()
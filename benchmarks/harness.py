@@ -0,0 +1,105 @@
+"""Shared helpers for the benchmark scripts - timing, JSON results, regression checks"""
+
+import os
+import sys
+import json
+import time
+import platform
+import subprocess
+from datetime import datetime
+from typing import Dict, Any, Callable, Optional, List, Awaitable
+
+
+def _summarize(samples_ns: List[int]) -> Dict[str, float]:
+    ordered = sorted(samples_ns)
+    n = len(ordered)
+    return {
+        "iterations": n,
+        "mean_us": round(sum(ordered) / n / 1000, 3),
+        "p50_us": round(ordered[n // 2] / 1000, 3),
+        "p95_us": round(ordered[min(int(n * 0.95), n - 1)] / 1000, 3),
+        "min_us": round(ordered[0] / 1000, 3),
+    }
+
+
+def measure(fn: Callable[[], Any], iterations: int = 1000, warmup: int = 10,
+            setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """Time `fn` per call; `setup` runs before each call and is not timed"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        fn()
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(samples)
+
+
+async def measure_async(fn: Callable[[], Awaitable[Any]], iterations: int = 200, warmup: int = 5,
+                        setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """Async variant of measure(), run inside a single event loop"""
+    for _ in range(warmup):
+        if setup:
+            setup()
+        await fn()
+
+    samples = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        start = time.perf_counter_ns()
+        await fn()
+        samples.append(time.perf_counter_ns() - start)
+    return _summarize(samples)
+
+
+def _git_sha() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return os.getenv("GIT_SHA", "unknown")
+
+
+def write_results(path: str, suite: str, results: Dict[str, Dict[str, float]]):
+    """Save results with enough metadata to compare builds"""
+    payload = {
+        "suite": suite,
+        "timestamp": datetime.utcnow().isoformat(),
+        "git_sha": _git_sha(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "results": results,
+    }
+    with open(path, "w") as f:
+        json.dump(payload, f, indent=2)
+    print(f"\nResults written to {path}")
+
+
+def print_results(results: Dict[str, Dict[str, float]]):
+    print(f"{'benchmark':<60} {'p50 us':>12} {'p95 us':>12} {'mean us':>12}")
+    for name, row in results.items():
+        print(f"{name:<60} {row['p50_us']:>12} {row['p95_us']:>12} {row['mean_us']:>12}")
+
+
+def compare_to_baseline(path: str, results: Dict[str, Dict[str, float]], threshold: float,
+                        metric: str = "p50_us") -> List[str]:
+    """Return the benchmarks whose `metric` regressed by more than `threshold` (0.2 = 20%)"""
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+
+    regressions = []
+    for name, row in results.items():
+        if name not in baseline or not baseline[name].get(metric):
+            continue
+        before, after = baseline[name][metric], row[metric]
+        change = (after - before) / before
+        if change > threshold:
+            regressions.append(f"{name}: {before} -> {after} {metric} (+{change:.0%})")
+    return regressions
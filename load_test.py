@@ -0,0 +1,214 @@
+"""Load generator for the Redis-enhanced sales bot
+
+Runs many concurrent virtual users through the same conversation flow as
+test_redis_bot.py and reports throughput and latency percentiles per
+endpoint and per conversation stage.
+
+Examples:
+    # 20 virtual users ramped up over 10s, each running the scripted flow
+    python load_test.py --users 20 --ramp-up 10
+
+    # Open-loop: start 5 new conversations per second for 60s
+    python load_test.py --rate 5 --duration 60 --flow random
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+
+from test_redis_bot import API_URL, TEST_MESSAGES
+
+# Extra messages mixed into randomized flows
+RANDOM_MESSAGES = [
+    "Can you tell me more?",
+    "What would that cost roughly?",
+    "We have about 500 customers right now",
+    "Not sure yet, what do you recommend?",
+    "Our team is just three people",
+]
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+class Stats:
+    """Collects per-request latency samples"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.started = time.perf_counter()
+        self.finished: Optional[float] = None
+
+    def record(self, key: str, latency: float, ok: bool = True):
+        self.samples.setdefault(key, []).append(latency)
+        if not ok:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        elapsed = (self.finished or time.perf_counter()) - self.started
+        report = {}
+        for key in sorted(self.samples):
+            samples = self.samples[key]
+            report[key] = {
+                "count": len(samples),
+                "errors": self.errors.get(key, 0),
+                "rps": round(len(samples) / elapsed, 2) if elapsed else 0.0,
+                "p50_ms": round(percentile(samples, 50) * 1000, 1),
+                "p95_ms": round(percentile(samples, 95) * 1000, 1),
+                "p99_ms": round(percentile(samples, 99) * 1000, 1),
+                "max_ms": round(max(samples) * 1000, 1),
+            }
+        return report
+
+
+def build_flow(kind: str, rng: random.Random) -> List[str]:
+    """Build the list of user messages for one virtual user"""
+    if kind == "scripted":
+        return list(TEST_MESSAGES)
+
+    # Randomized: keep the scripted skeleton but drop, repeat and mix in turns
+    flow = []
+    for message in TEST_MESSAGES:
+        if rng.random() < 0.15:
+            continue
+        flow.append(message)
+        if rng.random() < 0.25:
+            flow.append(rng.choice(RANDOM_MESSAGES))
+    return flow or [TEST_MESSAGES[0]]
+
+
+async def timed_request(client: httpx.AsyncClient, stats: Stats, method: str, path: str,
+                        label: str, **kwargs) -> Optional[httpx.Response]:
+    """Send one request and record its latency under the endpoint label"""
+    start = time.perf_counter()
+    try:
+        response = await client.request(method, path, **kwargs)
+        ok = response.status_code < 400
+    except httpx.HTTPError:
+        response, ok = None, False
+    stats.record(f"endpoint {method} {label}", time.perf_counter() - start, ok)
+    return response
+
+
+async def virtual_user(client: httpx.AsyncClient, stats: Stats, flow_kind: str,
+                       think_time: float, rng: random.Random):
+    """Run one full conversation, like test_redis_bot.test_conversation"""
+    thread_id = f"load-{uuid.uuid4().hex[:12]}"
+
+    for message in build_flow(flow_kind, rng):
+        start = time.perf_counter()
+        response = await timed_request(
+            client, stats, "POST", "/chat", "/chat",
+            json={"message": message, "thread_id": thread_id}
+        )
+        if response is not None and response.status_code == 200:
+            stage = response.json().get("stage", "unknown")
+            stats.record(f"stage {stage}", time.perf_counter() - start)
+
+        if think_time:
+            await asyncio.sleep(rng.expovariate(1 / think_time))
+
+    await timed_request(client, stats, "GET", f"/export/{thread_id}", "/export/{thread_id}")
+
+
+async def run_closed_loop(client: httpx.AsyncClient, stats: Stats, args, rng: random.Random):
+    """N virtual users, each looping over conversations until the deadline"""
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def user_loop(user_index: int):
+        # Ramp-up: linear spreads start times evenly, step starts users in 4 waves
+        if args.ramp_up:
+            if args.profile == "step":
+                delay = args.ramp_up * (user_index * 4 // args.users) / 4
+            else:
+                delay = args.ramp_up * user_index / args.users
+            await asyncio.sleep(delay)
+
+        user_rng = random.Random(rng.random())
+        while True:
+            await virtual_user(client, stats, args.flow, args.think_time, user_rng)
+            if deadline is None or time.perf_counter() >= deadline:
+                break
+
+    await asyncio.gather(*(user_loop(i) for i in range(args.users)))
+
+
+async def run_open_loop(client: httpx.AsyncClient, stats: Stats, args, rng: random.Random):
+    """Start new conversations at a Poisson arrival rate, regardless of latency"""
+    deadline = time.perf_counter() + (args.duration or 60)
+    tasks = []
+    while time.perf_counter() < deadline:
+        tasks.append(asyncio.create_task(
+            virtual_user(client, stats, args.flow, args.think_time, random.Random(rng.random()))
+        ))
+        await asyncio.sleep(rng.expovariate(args.rate))
+    await asyncio.gather(*tasks)
+
+
+async def main(args):
+    rng = random.Random(args.seed)
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.max_connections, max_keepalive_connections=args.max_connections)
+
+    async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout, limits=limits) as client:
+        health = await client.get("/health")
+        print(f"Health: {health.json()}")
+
+        mode = f"open loop at {args.rate}/s" if args.rate else f"{args.users} users"
+        print(f"Running {args.flow} flow, {mode}...\n")
+
+        stats.started = time.perf_counter()
+        if args.rate:
+            await run_open_loop(client, stats, args, rng)
+        else:
+            await run_closed_loop(client, stats, args, rng)
+        stats.finished = time.perf_counter()
+
+        await timed_request(client, stats, "GET", "/leads", "/leads")
+
+    report = stats.summary()
+    print(f"{'name':<32} {'count':>7} {'err':>5} {'rps':>8} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for key, row in report.items():
+        print(f"{key:<32} {row['count']:>7} {row['errors']:>5} {row['rps']:>8} "
+              f"{row['p50_ms']:>7}ms {row['p95_ms']:>7}ms {row['p99_ms']:>7}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"args": vars(args), "results": report}, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the sales bot API")
+    parser.add_argument("--url", default=API_URL, help="Base URL of the API")
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users (closed loop)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="New conversations per second (open loop; overrides --users)")
+    parser.add_argument("--duration", type=float, default=0.0,
+                        help="Seconds to keep generating load (0 = one conversation per user)")
+    parser.add_argument("--ramp-up", type=float, default=0.0, help="Seconds to ramp up to full load")
+    parser.add_argument("--profile", choices=["linear", "step"], default="linear", help="Ramp-up profile")
+    parser.add_argument("--flow", choices=["scripted", "random"], default="scripted")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between turns")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--max-connections", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
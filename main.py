@@ -5,21 +5,28 @@ FastAPI application for the Sales Bot
 import os
 import logging
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, JSONResponse
 from pydantic import BaseModel
 
 from agent.logic import SalesBot
+from agent.metrics import REGISTRY, CONTENT_TYPE
+from agent.readiness import Warmup, readiness
+from agent.storage import timestamp_bound
+from agent.tracing import TRACER, tracing_middleware
+from agent.logging_config import setup_logging, shutdown_logging
 
 # Set up logging
-logging.basicConfig(level=logging.INFO)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 # Global bot instance
 bot_instance = None
+warmup = Warmup()
 
 
 @asynccontextmanager
@@ -28,9 +35,15 @@ async def lifespan(app: FastAPI):
     global bot_instance
     logger.info("Initializing Sales Bot...")
     bot_instance = SalesBot()
+    # Import LLM client libraries and load the intent model in the background; /readyz waits for it
+    warmup.start(bot_instance.warm())
     logger.info("Sales Bot initialized successfully")
     yield
     logger.info("Shutting down Sales Bot...")
+    warmup.cancel()
+    await bot_instance.aclose()
+    TRACER.shutdown()
+    shutdown_logging()
 
 
 # Create FastAPI app
@@ -48,8 +61,12 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
+# Request IDs and tracing spans
+app.middleware("http")(tracing_middleware)
+
 
 # Request/Response models
 class ChatRequest(BaseModel):
@@ -80,6 +97,28 @@ async def health_check():
     )
 
 
+# Liveness and readiness probes
+@app.get("/livez")
+async def livez():
+    """Liveness: the event loop is responsive"""
+    return {"status": "alive"}
+
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: bot built and LLM libraries warmed"""
+    checks = {"bot": "ok" if bot_instance else "pending", "llm": warmup.status}
+    status_code, body = readiness(checks)
+    return JSONResponse(status_code=status_code, content=body)
+
+
+# Metrics endpoint
+@app.get("/metrics")
+async def metrics():
+    """Prometheus metrics"""
+    return Response(content=REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 # Chat endpoint
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
@@ -88,7 +127,9 @@ async def chat(request: ChatRequest):
         raise HTTPException(status_code=503, detail="Bot is still initializing")
     
     try:
-        logger.info(f"Processing message from thread {request.thread_id}: {request.message}")
+        logger.info("Processing message from thread %s", request.thread_id,
+                    extra={"thread_id": request.thread_id})
+        logger.debug("Message: %s", request.message)
         
         # Process the message
         response = await bot_instance.process_message(
@@ -103,7 +144,7 @@ async def chat(request: ChatRequest):
         )
         
     except Exception as e:
-        logger.error(f"Error processing chat: {str(e)}", exc_info=True)
+        logger.error("Error processing chat: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -115,13 +156,64 @@ async def reset_conversation(thread_id: str):
         raise HTTPException(status_code=503, detail="Bot is still initializing")
     
     try:
-        bot_instance.reset_conversation(thread_id)
+        await bot_instance.reset_conversation(thread_id)
         return {"message": f"Conversation reset for thread: {thread_id}"}
     except Exception as e:
-        logger.error(f"Error resetting conversation: {str(e)}", exc_info=True)
+        logger.error("Error resetting conversation: %s", e, exc_info=True)
         raise HTTPException(status_code=500, detail=str(e))
 
 
+# Conversation and lead listings (persisted with STORAGE_BACKEND=sqlite)
+@app.get("/conversations")
+async def get_all_conversations(stage: Optional[str] = None, since: Optional[str] = None,
+                                until: Optional[str] = None, limit: int = 100):
+    """List conversations, most recently updated first"""
+    if not bot_instance:
+        raise HTTPException(status_code=503, detail="Bot is still initializing")
+    
+    try:
+        since = timestamp_bound("since", since)
+        until = timestamp_bound("until", until, end_of_day=True)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    conversations = await bot_instance.get_all_conversations(stage, since, until, min(limit, 1000))
+    return {"total": len(conversations), "conversations": conversations}
+
+
+@app.get("/conversation/{thread_id}")
+async def get_conversation(thread_id: str):
+    """Get a specific conversation"""
+    if not bot_instance:
+        raise HTTPException(status_code=503, detail="Bot is still initializing")
+    
+    conversation = await bot_instance.get_conversation(thread_id)
+    if not conversation:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return conversation
+
+
+@app.get("/leads")
+async def get_all_leads(limit: int = 100):
+    """List leads that reached the booking stage"""
+    if not bot_instance:
+        raise HTTPException(status_code=503, detail="Bot is still initializing")
+    
+    leads = await bot_instance.get_all_leads(min(limit, 1000))
+    return {"total": len(leads), "leads": leads}
+
+
+@app.get("/export/{thread_id}")
+async def export_lead_data(thread_id: str):
+    """Export complete lead data for MVP building"""
+    if not bot_instance:
+        raise HTTPException(status_code=503, detail="Bot is still initializing")
+    
+    data = await bot_instance.export_lead_data(thread_id)
+    if not data:
+        raise HTTPException(status_code=404, detail="Conversation not found")
+    return data
+
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -131,8 +223,14 @@ async def root():
         "version": "1.0.0",
         "endpoints": {
             "health": "/health",
+            "livez": "/livez",
+            "readyz": "/readyz",
             "chat": "/chat",
             "reset": "/reset/{thread_id}",
+            "conversations": "/conversations",
+            "leads": "/leads",
+            "export": "/export/{thread_id}",
+            "metrics": "/metrics",
             "docs": "/docs"
         }
     }